@@ -0,0 +1,177 @@
+# activity02_cleansing.py
+"""
+ACTIVITY 02: text normalization, replacing the manual Excel TEXTJOIN/MID
+formula in 'command used for cleansing.txt'.
+
+The ingredients and allergensraw columns keep exactly what the formula
+keeps: the lower-cased text with only a-z, comma and space left. Digits,
+punctuation and brackets are dropped and spaces are not collapsed, so
+"Vegetables (Peas 39%, carrots 26%)." becomes "vegetables peas , carrots ".
+Excel compares by collation, so Latin letters outside a-z (the "œ" in
+"œufs") sit between "a" and "z" and are kept as well; symbols such as
+"•" or "’" are not. Each chunk of a column is joined into one string and
+its UTF-8 bytes are lower-cased and stripped of unwanted ASCII by a single
+bytes.translate() call, then split back apart; only the few values
+with non-ASCII characters left get a second, per-value look.
+
+The result is written as the app-ready CSV that mobile_slm5's CsvReader
+reads from assets/foodpreprocessed.csv: UTF-8 with BOM, comma separated,
+columns id,name,link,ingredients,allergensraw,allergensmapped. With
+--infer an allergensinferred column (ingredient_index.py) follows them;
+CsvReader reads columns by position, so the app ignores it.
+"""
+import argparse
+import re
+import time
+import unicodedata
+
+from table_io import read_header, iter_table, TableWriter, DEFAULT_CHUNK_ROWS
+from ingredient_index import infer_frame, INFERRED_COLUMN
+
+# --- CONFIGURATION ---
+INPUT_FILE = 'foodpreprocessed.txt'   # activity03_mapping output (any table_io format)
+OUTPUT_FILE = 'foodpreprocessed.csv'  # Copy to mobile_slm5/assets/ for the app
+NORMALIZED_COLUMNS = ['ingredients', 'allergensraw']
+APP_COLUMNS = ['id', 'name', 'link', 'ingredients', 'allergensraw', 'allergensmapped']
+
+# Characters the Excel formula keeps (after LOWER)
+KEEP_BYTES = b'abcdefghijklmnopqrstuvwxyz, '
+
+# Joins a chunk into one string; an ASCII control char the cleaning
+# never keeps, so no cleaned value can contain it
+BATCH_SEPARATOR = '\x1f'
+# Multi-byte UTF-8 sequences only use bytes >= 0x80, so mapping and
+# deleting ASCII bytes never damages a non-ASCII character
+UPPER_BYTES = b'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+LOWER_TABLE = bytes.maketrans(UPPER_BYTES, UPPER_BYTES.lower())
+DELETE_BYTES = bytes(c for c in range(128)
+                     if c not in KEEP_BYTES and c not in UPPER_BYTES and c != ord(BATCH_SEPARATOR))
+NON_ASCII_REGEX = re.compile(r'[^\x00-\x7f]+')
+
+_latin_letters = {}
+
+
+def is_latin_letter(char):
+    """True for letters Excel sorts between "a" and "z" (é, ß, œ...)"""
+    keep = _latin_letters.get(char)
+    if keep is None:
+        keep = char.isalpha() and 'LATIN' in unicodedata.name(char, '')
+        _latin_letters[char] = keep
+    return keep
+
+
+def _drop_non_letters(text):
+    """Lower-cases a value with non-ASCII characters left and drops non-Latin ones"""
+    return NON_ASCII_REGEX.sub(
+        lambda m: ''.join(c for c in m.group() if is_latin_letter(c)), text.lower())
+
+
+def _clean_bytes(text):
+    """ASCII part of the cleaning, on the UTF-8 bytes"""
+    return text.encode('utf-8').translate(LOWER_TABLE, DELETE_BYTES).decode('utf-8')
+
+
+def normalize_text(text):
+    """Lower-case, keep only letters, comma and space"""
+    if not text:
+        return ""
+    text = _clean_bytes(str(text).replace(BATCH_SEPARATOR, ''))
+    return text if text.isascii() else _drop_non_letters(text)
+
+
+def normalize_texts(texts):
+    """Batch normalize_text: one translate over the whole joined list"""
+    values = [str(t) if t else "" for t in texts]
+    joined = BATCH_SEPARATOR.join(values)
+    if joined.count(BATCH_SEPARATOR) != len(values) - 1:
+        return [normalize_text(t) for t in values]  # Separator clash, go one by one
+    # isascii() is O(1) on str, so only the rare non-ASCII values cost extra
+    return [p if p.isascii() else _drop_non_letters(p)
+            for p in _clean_bytes(joined).split(BATCH_SEPARATOR)]
+
+
+def normalize_frame(df, columns=NORMALIZED_COLUMNS):
+    """Normalizes the given text columns of a DataFrame (missing ones are skipped)"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = normalize_texts(df[col].tolist())
+    return df
+
+
+def flatten_lines(texts):
+    """Line breaks -> spaces, checked on the joined column"""
+    values = [str(t) for t in texts]
+    joined = BATCH_SEPARATOR.join(values)
+    if '\n' not in joined and '\r' not in joined:
+        return values
+    return [' '.join(v.splitlines()) if v else v for v in values]
+
+
+def to_app_frame(df, columns=APP_COLUMNS):
+    """
+    Columns in CsvReader order, blank allergensmapped if the input has none.
+    CsvReader reads line by line, so line breaks inside cells become spaces.
+    """
+    for col in columns:
+        if col not in df.columns:
+            df[col] = ""
+    df = df[columns].copy()
+    for col in columns:
+        if col not in NORMALIZED_COLUMNS:
+            df[col] = flatten_lines(df[col].tolist())
+    return df
+
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Normalize text columns and write the app CSV")
+    parser.add_argument('--input', default=INPUT_FILE,
+                        help="Table to clean (.txt/.csv, .parquet, .arrow or .xlsx)")
+    parser.add_argument('--output', default=OUTPUT_FILE,
+                        help="App CSV to write (UTF-8 with BOM, comma separated)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Rows processed per chunk")
+    parser.add_argument('--infer', action='store_true',
+                        help=f"Add a {INFERRED_COLUMN} column with the allergens named in the ingredients")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("=" * 60)
+    print("  ACTIVITY 02: DATA CLEANSING (LOWER CASE, LETTERS/COMMA/SPACE)")
+    print("=" * 60)
+
+    try:
+        print(f"📂 Reading file: {args.input}...")
+        columns = read_header(args.input)
+    except Exception as e:
+        print(f"❌ Error reading file: {e}")
+        return
+
+    missing = [c for c in APP_COLUMNS if c not in columns]
+    if missing:
+        print(f"   ⚠️ Missing column(s) {', '.join(missing)}; they will be left blank.")
+
+    output_columns = APP_COLUMNS + [INFERRED_COLUMN] if args.infer else APP_COLUMNS
+
+    try:
+        print(f"🧹 Normalizing {', '.join(c for c in NORMALIZED_COLUMNS if c in columns)}...")
+        start = time.perf_counter()
+        with TableWriter(args.output, separator=',', bom=True) as writer:
+            for chunk in iter_table(args.input, args.chunk_size):
+                if args.infer:
+                    chunk = infer_frame(chunk)
+                writer.write(to_app_frame(normalize_frame(chunk), output_columns))
+                print(f"   Processed {writer.rows} rows...", end="\r")
+        elapsed = time.perf_counter() - start
+
+        print(f"\n✅ Success! Saved {writer.rows} rows to {args.output} in {elapsed:.2f}s")
+        print(f"   👉 Copy it to mobile_slm5/assets/{OUTPUT_FILE} for the app.")
+    except Exception as e:
+        print(f"❌ Error saving file: {e}")
+
+
+if __name__ == "__main__":
+    main()
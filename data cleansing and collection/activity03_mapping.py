@@ -1,54 +1,232 @@
 # activity03_mapping.py
-import pandas as pd
-import google.generativeai as genai
 import time
+_IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import json
-from google.api_core import exceptions
+import re
+import hashlib
+import threading
+# pandas and google.generativeai are slow to import, so they are only loaded
+# when actually needed (main / first model call)
+from allergen_matcher import STANDARD_CATEGORIES
+from allergen_taxonomy import (SYNONYMS, map_allergen_text, parse_categories, format_categories,
+                               is_valid_mapping, normalize_term)
+from mapping_cache import MappingCache, mapping_key, cache_version
+from batch_dispatcher import AdaptiveDispatcher, RateLimited
+from batch_packer import TokenBudgetPacker, estimate_tokens
+from model_router import ModelRouter
+from checkpoint import CheckpointJournal
+from table_io import read_header, iter_table, TableWriter
+from metrics import METRICS
 
 # --- CONFIGURATION ---
-INPUT_FILE = 'foodraw.xlsx'
-OUTPUT_FILE = 'foodpreprocessed.xlsx'
-BATCH_SIZE = 20
+INPUT_FILE = 'foodraw.txt'            # .txt/.csv (semicolon or comma), .parquet, .arrow or .xlsx
+OUTPUT_FILE = 'foodpreprocessed.txt'  # Same choices; .xlsx is an optional export for opening by hand
+CHUNK_ROWS = 50000                    # Rows read/written per chunk
+BATCH_SIZE = 20                       # Values per batch in mapping_service, and the old fixed batch size
+TOKEN_BUDGET = 1500                   # Estimated prompt + reply tokens per model call to start with
+MAX_TOKEN_BUDGET = 4000               # Upper bound the budget may grow to after complete replies
+MAX_BATCH_ROWS = 500                  # Distinct values per dispatcher batch, however few need the model
+CACHE_FILE = 'mapping_cache.sqlite'   # Persistent results of earlier runs
+CACHE_MAX_ENTRIES = 200000            # LRU cap on cached values
+CHECKPOINT_FILE = 'mapping_journal.jsonl'  # Finished batches of the current run (--resume)
+MAX_CONCURRENT_BATCHES = 8            # Upper bound for batches in flight
+INITIAL_CONCURRENT_BATCHES = 2        # Starting point for the adaptive limit
+RATE_LIMIT_COOLDOWN = 10              # Seconds to pause after a quota error
+ITEM_MAX_ATTEMPTS = 3                 # Model answers tried per unknown token before leaving it blank
+MODEL_PROBE_FILE = 'model_probe.json' # Cached list of models available to this key
+MODEL_PROBE_TTL = 6 * 60 * 60         # Seconds before the model list is fetched again
+MODEL_PRIORITY = ["models/gemini-2.5-flash", "models/gemini-1.5-flash", "models/gemini-1.5-pro", "models/gemini-pro"]
+MODEL_COOLDOWN = 60                   # Seconds an out-of-quota model rests before it is tried again
+MODEL_MAX_COOLDOWN = 15 * 60          # Cap for the doubling cool-down of a model that stays exhausted
+MODEL_URL = None                      # Gemini REST endpoint to use instead of the SDK (e.g. a standin_server.py)
 
 # 🔐 YOUR API KEY
 API_KEY = "" 
-genai.configure(api_key=API_KEY)
 
-# ... [Keep the get_working_model function unchanged] ...
-def get_working_model():
-    # (Same code as before)
-    print("🔍 Testing available models for quota health...")
+_genai = None
+_router = None
+_router_built = False
+_router_lock = threading.Lock()
+_packer = None
+
+def load_genai():
+    """
+    Imports and configures google.generativeai on first use, or with
+    MODEL_URL set, the REST client for that endpoint
+    """
+    global _genai
+    if _genai is None:
+        if MODEL_URL:
+            from gemini_rest import RestGenAI
+            _genai = RestGenAI(MODEL_URL, API_KEY)
+        else:
+            import google.generativeai as genai
+            genai.configure(api_key=API_KEY)
+            _genai = genai
+    return _genai
+
+def api_key_fingerprint():
+    """Short hash of the API key (and endpoint), so a probe result is never reused for another one"""
+    return hashlib.sha256((API_KEY + (MODEL_URL or '')).encode('utf-8')).hexdigest()[:12]
+
+def read_model_probe():
+    """Model names from a fresh probe cache for this key, else None"""
+    try:
+        with open(MODEL_PROBE_FILE, 'r', encoding='utf-8') as f:
+            probe = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if probe.get('key') != api_key_fingerprint():
+        return None
+    if time.time() - probe.get('checked_at', 0) > MODEL_PROBE_TTL:
+        return None
+    return probe.get('models')
+
+def write_model_probe(model_names):
+    try:
+        with open(MODEL_PROBE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'models': model_names, 'key': api_key_fingerprint(), 'checked_at': time.time()}, f)
+    except OSError as e:
+        print(f"   ⚠️ Could not save model probe: {e}")
+
+def get_candidate_models():
+    """Models from MODEL_PRIORITY that this key can use, best first"""
+    cached = read_model_probe()
+    if cached is not None:
+        print(f"🔍 Using {len(cached)} model(s) listed within the last {MODEL_PROBE_TTL // 3600}h")
+        return cached
+    
+    print("🔍 Checking available models...")
     try:
         available_models = []
-        for m in genai.list_models():
+        for m in load_genai().list_models():
             if 'generateContent' in m.supported_generation_methods:
                 available_models.append(m.name)
-        
-        priority_list = ["models/gemini-2.5-flash", "models/gemini-1.5-flash", "models/gemini-1.5-pro", "models/gemini-pro"]
-        for model_name in priority_list:
-            if model_name in available_models:
-                print(f"   👉 Testing: {model_name}...", end=" ")
-                try:
-                    test_model = genai.GenerativeModel(model_name)
-                    test_model.generate_content("test") 
-                    print("✅ Working!")
-                    return test_model
-                except Exception:
-                    print("❌ Quota Exhausted/Error. Skipping.")
-                    continue
-        print("❌ No working models found.")
-        return None
     except Exception as e:
         print(f"❌ Error checking models: {e}")
-        return None
+        return []
+    
+    candidates = [name for name in MODEL_PRIORITY if name in available_models]
+    if candidates:
+        print(f"   👉 Routing across: {', '.join(candidates)}")
+        write_model_probe(candidates)
+    else:
+        print("❌ No working models found.")
+    return candidates
+
+def get_router():
+    """
+    The model router, built on first use (None if no model is available).
+    Model health is learned from real mapping calls instead of test prompts.
+    """
+    global _router, _router_built
+    with _router_lock:
+        if not _router_built:
+            candidates = get_candidate_models()
+            if candidates:
+                _router = ModelRouter(candidates, lambda name: load_genai().GenerativeModel(name),
+                                      cooldown=MODEL_COOLDOWN, max_cooldown=MODEL_MAX_COOLDOWN)
+            _router_built = True
+        return _router
 
-model = get_working_model()
+# Prompt sent for tokens the local taxonomy doesn't know
+PROMPT_TEMPLATE = """
+    Map these RAW ALLERGEN texts to the 9 standard categories: 
+    [milk, egg, peanut, tree nut, wheat, soy, fish, shellfish, sesame].
+    
+    Rules:
+    1. Output a JSON object.
+    2. Use every input text, exactly as given, as a key.
+    3. Each value is a string of the matching categories separated by commas, or "" if none apply.
+    4. If input is "no allergens", its value is "".
+    5. Mapping examples: "cashew" -> "tree nut", "shrimp" -> "shellfish".
+    
+    Input:
+    {items}
+    """
+
+def get_packer():
+    """The token-budget packer shared by every mapping call, built on first use"""
+    global _packer
+    with _router_lock:
+        if _packer is None:
+            _packer = TokenBudgetPacker(TOKEN_BUDGET, MAX_TOKEN_BUDGET,
+                                        overhead=estimate_tokens(PROMPT_TEMPLATE.format(items='[]')),
+                                        max_items=MAX_BATCH_ROWS)
+        return _packer
+
+# Cached results are only valid for this prompt and these tables
+CACHE_VERSION = cache_version(PROMPT_TEMPLATE, STANDARD_CATEGORIES, SYNONYMS)
+
+# Run counters (printed at the end of main)
+MAPPING_STATS = {
+    'values': 0,           # Distinct values mapped (cache misses)
+    'local_values': 0,     # Values fully resolved by the local taxonomy
+    'unknown_tokens': 0,   # Distinct unknown tokens forwarded to the model
+    'model_calls': 0,      # generate_content calls made while mapping
+    'unique_values': 0,    # Distinct normalized values in the input
+    'cache_hits': 0,       # Distinct values answered from the cache
+    'model_values': 0,     # Values that needed the model and got a full answer
+    'salvaged_items': 0,   # Answers kept from partly malformed replies
+    'bisections': 0,       # Failing sub-batches split in half
+    'failed_calls': 0,     # Prompts that failed on every model (items left unmapped)
+}
+STATS_LOCK = threading.Lock()  # Batches update the counters from worker threads
+_counted_tokens = set()         # Unknown tokens already in MAPPING_STATS['unknown_tokens']
+# Answers from mapping calls that were cut short by a quota error, used
+# instead of asking again when the dispatcher retries the batch
+_partial_answers = {}
+_partial_lock = threading.Lock()
+
+# "Please retry in 21.5s" in Gemini quota error messages
+RETRY_IN_REGEX = re.compile(r'retry in ([\d.]+)\s*s', re.I)
+
+def count_stat(name, amount=1):
+    with STATS_LOCK:
+        MAPPING_STATS[name] += amount
+
+def count_unknown_tokens(tokens):
+    """Counts each distinct unknown token once per run, however many batches it is in"""
+    with STATS_LOCK:
+        new = [t for t in tokens if t not in _counted_tokens]
+        _counted_tokens.update(new)
+        MAPPING_STATS['unknown_tokens'] += len(new)
+
+def quota_retry_after(error):
+    """Seconds the server asked to wait in a quota error, or None"""
+    retry_after = getattr(error, 'retry_after', None)  # gemini_rest, from Retry-After
+    if retry_after is not None:
+        return retry_after
+    for detail in getattr(error, 'details', None) or []:  # google.rpc.RetryInfo from the SDK
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    match = RETRY_IN_REGEX.search(str(error))
+    return float(match.group(1)) if match else None
+
+def is_missing(value):
+    """None/NaN check without importing pandas"""
+    return value is None or value != value
 
 def map_allergens_batch(text_list):
     """
-    Sends a list of allergens to Gemini.
+    Maps a list of allergensraw values to the 9 standard categories.
+    Known terms are resolved locally (allergen_taxonomy); only tokens the
+    local table doesn't know are sent to Gemini.
     Skips "empty" rows to follow assignment requirements strictly.
     """
+    results, _ = map_allergens_batch_detailed(text_list)
+    return results
+
+def map_allergens_batch_detailed(text_list, raise_on_quota=False):
+    """
+    Same as map_allergens_batch, plus a per-row flag that is False when the
+    row depended on a model call that failed (so it must not be cached).
+    With raise_on_quota, quota errors raise RateLimited for the dispatcher
+    instead of being waited out here.
+    """
     clean_list = []
     
     # 1. Pre-process list to handle "empty" values
@@ -56,129 +234,417 @@ def map_allergens_batch(text_list):
         val = str(x).strip()
         # If allergenraw is empty, we send a placeholder that AI ignores, 
         # or we handle it later. Here we send "" to signify no data.
-        if pd.isna(x) or val == "" or val.lower() == "empty":
+        if is_missing(x) or val == "" or val.lower() == "empty":
             clean_list.append("") 
         else:
             clean_list.append(val)
     
-    if not model:
-        return [""] * len(text_list)
+    # 2. Resolve known terms offline and collect the unknown ones
+    row_mappings = [map_allergen_text(val) for val in clean_list]
+    unknown_tokens = list(dict.fromkeys(t for _, unknown in row_mappings for t in unknown))
+    count_unknown_tokens(unknown_tokens)
+    
+    # 3. Ask the model about the unknown tokens only
+    token_categories = {}
+    if unknown_tokens:
+        mapped_tokens = map_allergens_with_model(unknown_tokens, raise_on_quota)
+        if mapped_tokens is not None:
+            for token, value in zip(unknown_tokens, mapped_tokens):
+                if value is not None:
+                    token_categories[token] = parse_categories(value)
+    
+    results = []
+    resolved = []
+    for categories, unknown in row_mappings:
+        for token in unknown:
+            categories |= token_categories.get(token, set())
+        results.append(format_categories(categories))
+        resolved.append(all(token in token_categories for token in unknown))
+    
+    # Counted once the batch is done, so dispatcher retries aren't double counted
+    count_stat('values', len(clean_list))
+    count_stat('local_values', sum(1 for _, unknown in row_mappings if not unknown))
+    count_stat('model_values', sum(1 for (_, unknown), ok in zip(row_mappings, resolved) if unknown and ok))
+    return results, resolved
 
-    # 2. Prepare AI Prompt
-    # Only ask AI to map actual text. We tell it "" means no allergens.
-    prompt = f"""
-    Map these RAW ALLERGEN texts to the 9 standard categories: 
-    [milk, egg, peanut, tree nut, wheat, soy, fish, shellfish, sesame].
+# Complete "key": "value" pairs, for salvaging truncated or broken JSON
+PAIR_REGEX = re.compile(r'("(?:[^"\\]|\\.)*")\s*:\s*("(?:[^"\\]|\\.)*"|\[[^\[\]]*\])')
+
+def strip_code_fence(result_text):
+    """Removes a ```json ... ``` wrapper around a reply"""
+    if result_text.startswith("```json"):
+        return result_text[7:-3].strip()
+    elif result_text.startswith("```"):
+        return result_text[3:-3].strip()
+    return result_text
+
+def parse_model_response(result_text, text_list):
+    """
+    Pulls every usable (input -> mapping) pair out of a model reply.
+    Accepts the requested JSON object, a JSON list of the right length, or,
+    when the JSON is broken, whatever complete "key": "value" pairs survive.
+    Returns {input_text: value} for the valid answers only.
+    """
+    wanted = {normalize_term(t): t for t in text_list}
+    try:
+        data = json.loads(result_text)
+    except json.JSONDecodeError:
+        data = None
     
-    Rules:
-    1. Output a JSON list of strings.
-    2. Maintain exact order.
-    3. If input is empty string "", return empty string "".
-    4. If input is "no allergens", return "".
-    5. Mapping examples: "cashew" -> "tree nut", "shrimp" -> "shellfish".
+    if isinstance(data, dict):
+        pairs = data.items()
+    elif isinstance(data, list) and len(data) == len(text_list):
+        pairs = zip(text_list, data)  # Old-style positional answer
+    elif data is None:
+        pairs = []
+        for match in PAIR_REGEX.finditer(result_text):
+            try:
+                pairs.append((json.loads(match.group(1)), json.loads(match.group(2))))
+            except json.JSONDecodeError:
+                continue
+    else:
+        pairs = []
     
-    Input:
-    {json.dumps(clean_list)}
+    answers = {}
+    for key, value in pairs:
+        text = wanted.get(normalize_term(str(key)))
+        if text is not None and is_valid_mapping(value):
+            answers[text] = value
+    return answers
+
+def request_model_mappings(text_list, raise_on_quota=False):
     """
+    One prompt for text_list, sent to the healthiest model. A model that runs
+    out of quota is cooled down (for the server's retry-after when it gives
+    one) and a model that errors loses health; either way the prompt fails
+    over to the next one. Returns {input_text: value} for the valid answers,
+    or None if the call failed on every model.
+    """
+    from gemini_rest import ResourceExhausted  # google.api_core's class when the SDK is installed
+    
+    router = get_router()
+    if router is None:
+        return None
+    prompt = PROMPT_TEMPLATE.format(items=json.dumps(text_list))
+    packer = get_packer()
+    tokens = packer.batch_cost(text_list)
     
-    max_retries = 3
+    # Enough attempts to try every model once, plus one after a cool-down
+    max_retries = len(router.states) + 1
+    failed = set()  # Models that errored on this prompt
     for attempt in range(max_retries):
+        state = router.acquire(exclude=failed)
+        if state is None:
+            # Every model left is cooling down, or none is left
+            wait_time = router.seconds_until_available(exclude=failed)
+            if wait_time is None:
+                break
+            if raise_on_quota:
+                raise RateLimited("all models out of quota", retry_after=wait_time)
+            print(f"   [⏳] All models out of quota. Waiting {wait_time:.0f}s...")
+            time.sleep(wait_time)
+            continue
+        
         try:
-            response = model.generate_content(prompt)
-            result_text = response.text.strip()
-            if result_text.startswith("```json"):
-                result_text = result_text[7:-3].strip()
-            elif result_text.startswith("```"):
-                result_text = result_text[3:-3].strip()
-            
-            mapped_data = json.loads(result_text)
-            
-            if len(mapped_data) != len(text_list):
-                print(f"   [!] Batch mismatch. Filling with blanks.")
-                return [""] * len(text_list)
-            return mapped_data
-
-        except exceptions.ResourceExhausted:
-            print(f"   [⏳] Rate limit hit. Waiting 10s...")
-            time.sleep(10)
+            count_stat('model_calls')
+            if attempt:
+                METRICS.inc('model_retries', model=state.name)
+            started = time.perf_counter()
+            response = state.model.generate_content(prompt)
+            latency = time.perf_counter() - started
+            result_text = response.text
+            router.report_success(state, latency)
+            METRICS.observe('generate_content', latency, model=state.name, outcome='ok')
+        except ResourceExhausted as e:
+            router.report_quota(state, quota_retry_after(e))
+            METRICS.observe('generate_content', time.perf_counter() - started, model=state.name, outcome='quota')
+            METRICS.inc('model_quota_errors', model=state.name)
+            print(f"   [⏳] {state.name} out of quota. Failing over...")
         except Exception as e:
-            print(f"   [!] Error: {e}")
-            return [""] * len(text_list)
+            router.report_error(state)
+            METRICS.observe('generate_content', time.perf_counter() - started, model=state.name, outcome='error')
+            METRICS.inc('model_errors', model=state.name, error=type(e).__name__)
+            print(f"   [!] Error ({state.name}): {e}. Failing over...")
+            failed.add(state.name)
+        else:
+            # Outside the try: a parsing bug is not the model's fault
+            answers = parse_model_response(strip_code_fence(result_text.strip()), text_list)
+            METRICS.inc('model_batch_items', len(text_list))
+            METRICS.inc('model_batch_tokens', tokens)
+            budget = packer.report(len(text_list), len(answers), tokens)
+            if budget is not None and len(answers) < len(text_list):
+                print(f"   [📦] Reply covered {len(answers)}/{len(text_list)} items (~{tokens} tokens). "
+                      f"Token budget now {budget:.0f}.")
+            return answers
 
-    return [""] * len(text_list)
+    return None
 
-def main():
+def map_allergens_with_model(text_list, raise_on_quota=False):
+    """
+    Sends a list of raw allergen texts to Gemini, in as many prompts as the
+    current token budget needs, and recovers from bad replies: valid answers
+    are kept, only missing/invalid items are asked again, and a sub-batch
+    whose reply parsed to nothing at all is bisected down to single items.
+    A call that failed on every model is not retried here; its items stay
+    None for the next run instead of multiplying the failing calls.
+    Returns a list aligned with text_list (None where no usable answer came
+    back after ITEM_MAX_ATTEMPTS), or None if there is no model.
+    
+    If RateLimited is raised part way, the answers so far are kept and reused
+    when the dispatcher retries the same texts.
+    """
+    if get_router() is None:
+        return None
+    
+    with _partial_lock:
+        answers = {t: _partial_answers.pop(t) for t in text_list if t in _partial_answers}
+    failures = dict.fromkeys(text_list, 0)
+    pending = [t for t in dict.fromkeys(text_list) if t not in answers]
+    stack = get_packer().split(pending)[::-1]  # First batch on top
+    while stack:
+        batch = stack.pop()
+        try:
+            got = request_model_mappings(batch, raise_on_quota)
+        except RateLimited:
+            with _partial_lock:
+                _partial_answers.update(answers)
+            raise
+        if got is None:
+            count_stat('failed_calls')  # Not split or retried; a bad reply is handled below
+            continue
+        answers.update(got)
+        
+        missing = [t for t in batch if t not in got]
+        if not missing:
+            continue
+        
+        if not got and len(missing) > 1:
+            # Nothing usable: split so one bad item can't sink the rest
+            count_stat('bisections')
+            half = len(missing) // 2
+            stack.append(missing[half:])
+            stack.append(missing[:half])
+            continue
+        
+        if got:
+            count_stat('salvaged_items', len(got))
+            print(f"   [!] Partial reply: kept {len(got)}, re-requesting {len(missing)}.")
+        for t in missing:
+            failures[t] += 1
+        retry = [t for t in missing if failures[t] < ITEM_MAX_ATTEMPTS]
+        if retry:
+            stack.append(retry)
+    
+    return [answers.get(t) for t in text_list]
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Map allergensraw to the 9 standard categories")
+    parser.add_argument('--input', default=INPUT_FILE,
+                        help="Table to map (.txt/.csv, .parquet, .arrow or .xlsx)")
+    parser.add_argument('--output', default=OUTPUT_FILE,
+                        help="Where to write the mapped table (format from the extension)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_ROWS,
+                        help="Rows read and written per chunk")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Continue an interrupted run from {CHECKPOINT_FILE} instead of starting over")
+    parser.add_argument('--token-budget', type=int, default=TOKEN_BUDGET,
+                        help="Estimated prompt + reply tokens per model call to start with")
+    parser.add_argument('--max-token-budget', type=int, default=MAX_TOKEN_BUDGET,
+                        help="Largest budget reached by growing after complete replies")
+    parser.add_argument('--model-url',
+                        help="Gemini REST endpoint to call instead of the SDK, e.g. a local stand-in server")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Write run metrics (stage timings, model latency, quota errors) as JSON")
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help="Write the same metrics in Prometheus text format")
+    return parser.parse_args(argv)
+
+def open_checkpoint(input_file, resume):
+    """
+    Journal of finished batches for this input and prompt version.
+    Returns (journal, {key: mapped_value}) restored from an earlier run.
+    """
+    run = {'type': 'run', 'input': input_file, 'version': CACHE_VERSION}
+    journal = CheckpointJournal(CHECKPOINT_FILE, resume=resume)
+    records = journal.records
+    if records and records[0] != run:
+        print(f"   ⚠️ {CHECKPOINT_FILE} is from another input or prompt version. Starting over.")
+        journal.close()
+        journal = CheckpointJournal(CHECKPOINT_FILE)
+        records = []
+    if not records:
+        journal.append(run)
+    
+    restored = {}
+    for record in records:
+        if record.get('type') == 'batch':
+            restored.update(record['results'])
+    return journal, restored
+
+def main(argv=None):
+    global MODEL_URL, TOKEN_BUDGET, MAX_TOKEN_BUDGET
+    args = parse_args(argv)
+    if args.model_url:
+        MODEL_URL = args.model_url
+    TOKEN_BUDGET = args.token_budget
+    MAX_TOKEN_BUDGET = args.max_token_budget
+    if args.metrics or args.prometheus:
+        METRICS.enable()
+        METRICS.add_stage('import', IMPORT_SECONDS)
+    
     print("=" * 60)
     print("  ACTIVITY 03: DATA MAPPING (STRICT: ALLERGENSRAW)")
     print("=" * 60)
+    print(f"⏱️ Module import: {IMPORT_SECONDS * 1000:.0f} ms (models are listed on first use)")
 
-    if not model:
-        return
-
-    # 1. Read input
+    # 1. Read input: only the allergen column, chunk by chunk
     try:
-        print(f"📂 Reading file: {INPUT_FILE}...")
-        df = pd.read_excel(INPUT_FILE)
+        print(f"📂 Reading file: {args.input}...")
+        io_started = time.perf_counter()
+        columns = read_header(args.input)
         
         # --- STRICT CHANGE: TARGET 'allergensraw' ---
         target_col = 'allergensraw' 
         
-        if target_col not in df.columns:
+        if target_col not in columns:
             # Check if it's named 'allergens' instead (common mismatch)
-            if 'allergens' in df.columns:
+            if 'allergens' in columns:
                 target_col = 'allergens'
                 print(f"   ⚠️ 'allergensraw' not found. Using 'allergens' instead.")
             else:
                 print(f"❌ Error: Column '{target_col}' not found.")
                 return
+        
+        # 2. Deduplicate: map each distinct normalized value once
+        total_rows = 0
+        unique_keys = {}
+        for chunk in iter_table(args.input, args.chunk_size, columns=[target_col]):
+            total_rows += len(chunk)
+            unique_keys.update(dict.fromkeys(mapping_key(v) for v in chunk[target_col]))
+        unique_keys = list(unique_keys)
+        read_seconds = time.perf_counter() - io_started
+        METRICS.add_stage('read', read_seconds)
                 
     except Exception as e:
         print(f"❌ Error reading file: {e}")
         return
 
-    # 2. Batch Process
-    total_rows = len(df)
-    all_results = []
+    MAPPING_STATS['unique_values'] = len(unique_keys)
+
+    with METRICS.stage('restore'):
+        journal, mapped = open_checkpoint(args.input, args.resume)
+        if args.resume:
+            print(f"♻️ Resuming: {len(mapped)} values restored from {CHECKPOINT_FILE}")
+
+        cache = MappingCache(CACHE_FILE, CACHE_VERSION, CACHE_MAX_ENTRIES)
+        mapped.update(cache.get_many([k for k in unique_keys if k not in mapped]))
+    mapped[""] = ""  # Empty rows never need mapping
+    MAPPING_STATS['cache_hits'] = cache.hits
+    pending = [k for k in unique_keys if k not in mapped]
 
     print(f"\n🚀 Processing {total_rows} items (Target: {target_col})...")
+    print(f"   {len(unique_keys)} distinct values, {cache.hits} cached, {len(pending)} to map")
 
-    for i in range(0, total_rows, BATCH_SIZE):
-        batch = df[target_col].iloc[i : i + BATCH_SIZE].tolist()
-        print(f"   Processing {i} to {i + len(batch)}...", end="\r")
-        
-        results = map_allergens_batch(batch)
-        all_results.extend(results)
-        time.sleep(2) 
+    # 3. Batch Process: several batches in flight, adapting to rate limits.
+    # Batches are cut lazily to fit the token budget of the unknown tokens
+    # they will send, as it stands when a dispatcher slot frees up.
+    packer = get_packer()
+    unknown_of = lambda key: map_allergen_text(key)[1]
+    batches = packer.iter_batches(pending, unknown_of)
+    dispatcher = AdaptiveDispatcher(
+        max_concurrency=MAX_CONCURRENT_BATCHES,
+        initial_concurrency=INITIAL_CONCURRENT_BATCHES,
+        cooldown=RATE_LIMIT_COOLDOWN
+    )
+    done_count = [0]
 
-# 3. Save
-    df['allergensmapped'] = all_results
-    
-    # Reorder columns
-    desired_order = ['id', 'name', 'link', 'ingredients', 'allergensraw', 'allergensmapped']
-    final_cols = [c for c in desired_order if c in df.columns]
-    df = df[final_cols]
+    def on_batch_done(index, batch, outcome):
+        # Runs on this thread, so the SQLite cache and the journal are only touched here
+        results, resolved = outcome
+        mapped.update(zip(batch, results))
+        finished = {k: r for k, r, ok in zip(batch, results, resolved) if ok}
+        cache.put_many(finished)
+        if finished:
+            journal.append({'type': 'batch', 'results': finished})
+        done_count[0] += len(batch)
+        print(f"   Processed {done_count[0]}/{len(pending)} (in flight: {int(dispatcher.limit)})...", end="\r")
+
+    with METRICS.stage('map'):
+        dispatcher.run(
+            lambda batch: map_allergens_batch_detailed(batch, raise_on_quota=True),
+            batches,
+            on_result=on_batch_done,
+            fallback=lambda batch: ([""] * len(batch), [False] * len(batch))
+        )
+    cache.close()
+    METRICS.inc('dispatcher_rate_limit_events', dispatcher.rate_limit_events)
+    METRICS.inc('dispatcher_retries', dispatcher.retries)
+    METRICS.inc_many('mapping', MAPPING_STATS, 'stat')
+    if _router is not None:
+        print("\n   🔀 Model usage:")
+        for line in _router.summary():
+            print(f"      {line}")
+    print("\n   📦 Prompt packing:")
+    for line in packer.summary():
+        print(f"      {line}")
+    fixed_calls = sum(1 for i in range(0, len(pending), BATCH_SIZE)
+                      if any(unknown_of(k) for k in pending[i:i + BATCH_SIZE]))
+    print(f"      Fixed {BATCH_SIZE}-value batches would have needed at least {fixed_calls} model call(s)")
+    print(f"\n   ⚙️ Peak concurrency: {dispatcher.peak_limit:.1f} | rate-limit events: {dispatcher.rate_limit_events} | retried batches: {dispatcher.retries}")
+
+    print(f"\n🧠 Distinct values: {MAPPING_STATS['unique_values']} of {total_rows} rows (cache hits: {MAPPING_STATS['cache_hits']}) | "
+          f"resolved locally: {MAPPING_STATS['local_values']}/{MAPPING_STATS['values']} values | "
+          f"unknown tokens sent to model: {MAPPING_STATS['unknown_tokens']} | model calls: {MAPPING_STATS['model_calls']}")
+    if MAPPING_STATS['model_values']:
+        print(f"   Model calls per model-mapped value: {MAPPING_STATS['model_calls'] / MAPPING_STATS['model_values']:.2f} "
+              f"(salvaged answers: {MAPPING_STATS['salvaged_items']}, bisections: {MAPPING_STATS['bisections']})")
+    if MAPPING_STATS['failed_calls']:
+        print(f"   [!] {MAPPING_STATS['failed_calls']} model call(s) failed on every model; "
+              f"their values stay unmapped")
 
     # --- 🧹 NEW CLEANING BLOCK 🧹 ---
-    print("🧹 Cleaning formatting (removing brackets)...")
     def clean_text(text):
         # Convert to string and remove [ ] ' "
         text = str(text)
         for char in ["[", "]", "'", '"']:
             text = text.replace(char, "")
         return text.strip()
-
-    df['allergensmapped'] = df['allergensmapped'].apply(clean_text)
     # --------------------------------
 
+    # 4. Save: second streaming pass fans the distinct results back out to every row
+    desired_order = ['id', 'name', 'link', 'ingredients', 'allergensraw', 'allergensmapped']
     try:
-        print(f"\n\n💾 Saving to: {OUTPUT_FILE}...")
-        df.to_excel(OUTPUT_FILE, index=False)
+        print(f"\n\n💾 Saving to: {args.output}...")
+        print("🧹 Cleaning formatting (removing brackets)...")
+        io_started = time.perf_counter()
+        last_chunk = None
+        with TableWriter(args.output) as writer:
+            for chunk in iter_table(args.input, args.chunk_size):
+                chunk['allergensmapped'] = [clean_text(mapped[mapping_key(v)]) for v in chunk[target_col]]
+                
+                # Reorder columns
+                final_cols = [c for c in desired_order if c in chunk.columns]
+                last_chunk = chunk[final_cols]
+                writer.write(last_chunk)
+        write_seconds = time.perf_counter() - io_started
+        METRICS.add_stage('write', write_seconds)
+        
+        journal.remove()  # Output is complete, nothing left to resume
         print("✅ Success! Mapping completed.")
+        print(f"   ⏱️ I/O: read {read_seconds:.2f}s, mapped + written {write_seconds:.2f}s ({writer.rows} rows)")
         print("-" * 50)
-        print(df.tail()) 
+        if last_chunk is not None:
+            print(last_chunk.tail()) 
         print("-" * 50)
     except Exception as e:
         print(f"❌ Error saving file: {e}")
+        journal.close()
+        print(f"   👉 Progress kept in {CHECKPOINT_FILE}; rerun with --resume to try again.")
+
+    METRICS.write('activity03_mapping', args.metrics, args.prometheus)
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
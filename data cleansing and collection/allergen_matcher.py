@@ -0,0 +1,194 @@
+#  allergen_matcher.py
+"""
+Word-boundary aware allergen keyword matcher ("nut" no longer hits "coconut"),
+compiled into one prefix-sharing regex, with a word lookup for ASCII text.
+"""
+import re
+
+# The 9 standard categories used by the mapping step and the app
+STANDARD_CATEGORIES = ["milk", "egg", "peanut", "tree nut", "wheat", "soy", "fish", "shellfish", "sesame"]
+
+# Category of each collector keyword (TARGET_ALLERGEN_KEYWORDS)
+KEYWORD_CATEGORIES = {
+    "milk": "milk", "lactose": "milk", "cream": "milk", "whey": "milk",
+    "egg": "egg",
+    "peanut": "peanut",
+    "nut": "tree nut", "almond": "tree nut", "cashew": "tree nut",
+    "walnut": "tree nut", "pecan": "tree nut", "hazelnut": "tree nut",
+    "wheat": "wheat", "gluten": "wheat", "barley": "wheat", "rye": "wheat",
+    "soy": "soy", "soya": "soy",
+    "fish": "fish",
+    "shellfish": "shellfish", "crustacean": "shellfish", "mollusc": "shellfish",
+    "shrimp": "shellfish", "crab": "shellfish", "lobster": "shellfish",
+    "sesame": "sesame",
+}
+
+# Compound words that really do contain a keyword, e.g. the "en:soybeans" tag.
+# With word boundaries they would otherwise stop matching.
+COMPOUND_ALIASES = {
+    "soybean": "soy",
+    "soymilk": "soy",
+    "buttermilk": "milk",
+}
+
+WORD_REGEX = re.compile(r'[^\W_]+')
+WORD_GAP = r'[\W_]+'                # Any separator between the words of a phrase
+PLURAL_SUFFIX = r'(?:e?s)?'         # "eggs", "fishes"
+PLURAL_ENDINGS = ('', 's', 'es')    # The same, for the word lookup fast path
+_END = ''                           # Trie key marking a complete pattern
+# bytes.translate table lower-casing ASCII text and turning separators into spaces
+_ASCII_WORDS = bytes(ord(chr(c).lower()) if c < 0x80 and chr(c).isalnum() else ord(' ') for c in range(256))
+
+
+def normalize_phrase(text):
+    """Lower-cased words joined by single spaces"""
+    return ' '.join(WORD_REGEX.findall(text.lower()))
+
+
+def _trie_to_regex(node, word_gap=WORD_GAP):
+    """Emits a trie as a prefix-sharing regex alternation"""
+    branches = []
+    for char, child in sorted((k, v) for k, v in node.items() if k != _END):
+        branches.append((word_gap if char == ' ' else re.escape(char)) + _trie_to_regex(child, word_gap))
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # Greedy optional tail: the longest registered pattern wins
+    return '(?:' + body + ')?' if _END in node else body
+
+
+def phrase_regex(phrases, word_gap=WORD_GAP):
+    """
+    Regex body matching any of the normalized phrases, longest first where
+    one is a prefix of another ("cocoa butter" before "cocoa")
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[_END] = True
+    return _trie_to_regex(trie, word_gap) if trie else r'(?!)'
+
+
+class AllergenMatcher:
+    """
+    Compiled keyword matcher. Each pattern maps to a (keyword, category) label.
+    """
+    def __init__(self, keywords=None):
+        self._patterns = {}
+        self._regex = None
+        self._labels = {}
+        self._word_lookup = None  # {word bytes: pattern}, only for sets of single words
+        self._word_keywords = None  # {word bytes: keyword}, the same words
+        if keywords:
+            self.add_keywords(keywords)
+
+    def add_keyword(self, pattern, category, keyword=None):
+        """Registers one pattern; `keyword` is what find_keywords reports (default: the pattern)"""
+        phrase = normalize_phrase(pattern)
+        if not phrase:
+            return
+        self._patterns[phrase] = (keyword or phrase, category)
+        self._regex = None  # Rebuilt lazily on next lookup
+
+    def add_keywords(self, keywords):
+        """Registers a {pattern: category} mapping"""
+        for pattern, category in keywords.items():
+            self.add_keyword(pattern, category)
+
+    def rebuild(self):
+        """Compiles the registered patterns into one boundary-anchored regex"""
+        # A phrase match also counts for registered phrases it starts with
+        # ("sesame seed" -> "sesame seed" and "sesame")
+        self._labels = {}
+        for phrase in self._patterns:
+            words = phrase.split(' ')
+            prefixes = (' '.join(words[:n]) for n in range(len(words), 0, -1))
+            self._labels[phrase] = [self._patterns[p] for p in prefixes if p in self._patterns]
+
+        body = phrase_regex(self._patterns)
+        self._word_lookup = self._word_keywords = None
+        if any(' ' in phrase for phrase in self._patterns):
+            # Zero-width lookahead so overlapping matches ("tree nut" / "nut") are all found
+            self._regex = re.compile(r'\b(?=(' + body + ')' + PLURAL_SUFFIX + r'\b)')
+        else:
+            # Matches of single words never overlap, and consuming them is faster
+            self._regex = re.compile(r'\b(' + body + ')' + PLURAL_SUFFIX + r'\b')
+            # A match is then a whole word: a pattern plus a plural ending.
+            # Longer patterns are added last and win, as in the trie.
+            self._word_lookup = {}
+            for phrase in sorted(self._patterns, key=len):
+                for ending in PLURAL_ENDINGS:
+                    self._word_lookup[(phrase + ending).encode('utf-8')] = phrase
+            self._word_keywords = {word: self._patterns[phrase][0] for word, phrase in self._word_lookup.items()}
+
+    def _find(self, text):
+        """Registered patterns matched in the text, in text order"""
+        if self._regex is None:
+            self.rebuild()
+        if not text:
+            return []
+        lookup = self._word_lookup
+        if lookup is not None and text.isascii():
+            words = text.encode('ascii').translate(_ASCII_WORDS).split()
+            return [lookup[word] for word in words if word in lookup]
+
+        # \b counts "_" as a letter; here it separates words
+        matches = self._regex.findall(text.lower().replace('_', ' '))
+        # Single words come back already normalized; phrases may have odd separators
+        labels = self._labels
+        return [match if match in labels else normalize_phrase(match) for match in matches]
+
+    def iter_matches(self, text):
+        """Yields (keyword, category) for every match, in text order"""
+        phrases = self._find(text)  # Rebuilds the labels if needed
+        labels = self._labels
+        for phrase in phrases:
+            yield from labels[phrase]
+
+    def find_keywords(self, text):
+        """Matched keywords, unique, in order of first appearance"""
+        if self._regex is None:
+            self.rebuild()
+        lookup = self._word_keywords
+        if lookup is not None and text and text.isascii():
+            # The collector's case, kept to C-level calls: one per product
+            words = text.encode('ascii').translate(_ASCII_WORDS).split()
+            return list(dict.fromkeys(filter(None, map(lookup.get, words))))
+
+        phrases = self._find(text)
+        labels = self._labels
+        return list(dict.fromkeys(keyword for phrase in phrases for keyword, _ in labels[phrase]))
+
+    def find_categories(self, text):
+        """Matched categories, standard ones first in STANDARD_CATEGORIES order"""
+        found = {category for _, category in self.iter_matches(text)}
+        return [c for c in STANDARD_CATEGORIES if c in found] + sorted(c for c in found if c not in STANDARD_CATEGORIES)
+
+    def matches(self, text):
+        """True if any keyword occurs in the text"""
+        if self._regex is None:
+            self.rebuild()
+        # The regex stops at the first match, faster than splitting the whole text
+        return bool(text) and self._regex.search(text.lower().replace('_', ' ')) is not None
+
+
+def build_keyword_matcher(keywords, categories=KEYWORD_CATEGORIES, aliases=COMPOUND_ALIASES):
+    """
+    Matcher for a keyword list such as TARGET_ALLERGEN_KEYWORDS.
+    find_keywords reports the keyword itself; compound aliases report their base keyword.
+    """
+    matcher = AllergenMatcher()
+    for keyword in keywords:
+        matcher.add_keyword(keyword, categories.get(keyword))
+    for alias, keyword in aliases.items():
+        if keyword in keywords:
+            matcher.add_keyword(alias, categories.get(keyword), keyword=keyword)
+    return matcher
+
+
+def naive_keywords(text, keywords):
+    """The original substring loop, kept for comparison"""
+    text_lower = text.lower()
+    return [keyword for keyword in keywords if keyword in text_lower]
@@ -0,0 +1,167 @@
+# allergen_taxonomy.py
+"""
+Local dictionary mapper from raw allergen text to the 9 standard categories.
+
+Most allergensraw values ("milk", "en:gluten", "soybeans", "cashew nuts")
+map trivially, so activity03_mapping resolves them here instantly and
+offline, and only sends the tokens this table doesn't know to Gemini.
+"""
+import re
+
+from allergen_matcher import STANDARD_CATEGORIES
+
+# Normalized term -> category. "" marks known terms that are not one of the 9
+# categories (e.g. celery, mustard), so they are never sent to the model.
+SYNONYMS = {}
+
+_CATEGORY_TERMS = {
+    "milk": [
+        "milk", "dairy", "lactose", "cream", "whey", "butter", "buttermilk", "cheese",
+        "yogurt", "yoghurt", "casein", "caseinate", "sodium caseinate", "ghee", "curd",
+        "lactoserum", "milk powder", "skimmed milk", "skimmed milk powder", "whole milk",
+        "milk protein", "milk fat", "milk solid", "milk and milk product",
+    ],
+    "egg": [
+        "egg", "egg white", "egg yolk", "whole egg", "albumen", "albumin",
+        "ovalbumin", "lysozyme", "egg powder",
+    ],
+    "peanut": [
+        "peanut", "groundnut", "arachis", "peanut butter", "peanut oil",
+    ],
+    "tree nut": [
+        "nut", "tree nut", "almond", "cashew", "cashew nut", "walnut", "pecan", "pecan nut",
+        "hazelnut", "pistachio", "macadamia", "macadamia nut", "brazil nut", "pine nut",
+        "filbert", "queensland nut",
+    ],
+    "wheat": [
+        "wheat", "gluten", "barley", "rye", "spelt", "kamut", "khorasan", "semolina",
+        "durum", "durum wheat", "farro", "einkorn", "emmer", "triticale", "bulgur",
+        "couscous", "wheat flour", "wheat gluten", "cereals containing gluten",
+        "gluten containing cereal", "cereal containing gluten",
+    ],
+    "soy": [
+        "soy", "soya", "soybean", "soya bean", "soy bean", "soja", "soy lecithin",
+        "soya lecithin", "edamame", "tofu", "tempeh", "miso", "soy sauce", "soy protein",
+    ],
+    "fish": [
+        "fish", "anchovy", "salmon", "tuna", "cod", "sardine", "mackerel", "haddock",
+        "trout", "pollock", "herring", "tilapia", "hake", "fish sauce", "fish oil",
+    ],
+    "shellfish": [
+        "shellfish", "crustacean", "mollusc", "mollusk", "shrimp", "prawn", "crab",
+        "lobster", "crayfish", "krill", "scampi", "langoustine", "oyster", "mussel",
+        "clam", "scallop", "squid", "octopus", "cuttlefish", "snail", "whelk",
+    ],
+    "sesame": [
+        "sesame", "sesame seed", "sesame oil", "tahini", "tahina", "benne",
+    ],
+    "": [
+        "celery", "celeriac", "mustard", "lupin", "lupine", "sulphite", "sulfite",
+        "sulphur dioxide", "sulfur dioxide", "sulphur dioxide and sulphite",
+        "sulfur dioxide and sulfite", "gelatin", "gelatine", "none", "no allergen",
+        "empty", "n/a", "na",
+    ],
+}
+
+for _category, _terms in _CATEGORY_TERMS.items():
+    for _term in _terms:
+        SYNONYMS[_term] = _category
+
+CATEGORY_BITS = {c: 1 << i for i, c in enumerate(STANDARD_CATEGORIES)}
+
+# Language/taxonomy prefixes such as "en:" on Open Food Facts tags
+TAG_PREFIX_REGEX = re.compile(r'^[a-z]{2}:')
+NON_WORD_REGEX = re.compile(r'[^a-z0-9/ ]+')
+
+
+def normalize_term(term):
+    """Lower-cases, strips tag prefixes and punctuation, collapses spaces"""
+    term = TAG_PREFIX_REGEX.sub('', term.strip().lower())
+    term = NON_WORD_REGEX.sub(' ', term.replace('-', ' ').replace('_', ' '))
+    return ' '.join(term.split())
+
+
+def singular_forms(term):
+    """The term plus candidate singulars of its last word ("berries" -> "berry")"""
+    head, _, last = term.rpartition(' ')
+    prefix = head + ' ' if head else ''
+    forms = [term]
+    if last.endswith('ies'):
+        forms.append(prefix + last[:-3] + 'y')
+    if last.endswith('es'):
+        forms.append(prefix + last[:-2])
+    if last.endswith('s'):
+        forms.append(prefix + last[:-1])
+    return forms
+
+
+def lookup_term(term):
+    """Category for a normalized term ("" if known but not one of the 9), None if unknown"""
+    for form in singular_forms(term):
+        if form in SYNONYMS:
+            return SYNONYMS[form]
+    return None
+
+
+def map_allergen_text(text):
+    """
+    Maps one allergensraw value.
+    Returns (set_of_categories, [unknown_tokens]) where unknown tokens still need the model.
+    """
+    categories = set()
+    unknown = []
+    if not text:
+        return categories, unknown
+
+    for raw_token in str(text).split(','):
+        token = normalize_term(raw_token)
+        if not token:
+            continue
+        category = lookup_term(token)
+        if category is None:
+            unknown.append(token)
+        elif category:
+            categories.add(category)
+    return categories, unknown
+
+
+def _mapping_parts(value):
+    """Normalized comma parts of a mapped value (model output may be a string or list)"""
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(str(v) for v in value)
+    return [normalize_term(p) for p in str(value or '').split(',')]
+
+
+def parse_categories(value):
+    """Standard categories named in a mapped value ("tree nuts" counts as "tree nut")"""
+    categories = set()
+    for part in _mapping_parts(value):
+        category = lookup_term(part) if part else None
+        if category in STANDARD_CATEGORIES:
+            categories.add(category)
+    return categories
+
+
+def is_valid_mapping(value):
+    """True if a model answer is a string/list naming only terms this table knows"""
+    if not isinstance(value, (str, list, tuple)):
+        return False
+    return all(not part or lookup_term(part) is not None for part in _mapping_parts(value))
+
+
+def categories_mask(value):
+    """9-bit mask of the standard categories named in a mapped value (bit i = STANDARD_CATEGORIES[i])"""
+    mask = 0
+    for category in parse_categories(value):
+        mask |= CATEGORY_BITS[category]
+    return mask
+
+
+def mask_categories(mask):
+    """Categories of a mask, in the standard order"""
+    return [c for i, c in enumerate(STANDARD_CATEGORIES) if mask >> i & 1]
+
+
+def format_categories(categories):
+    """Joins categories in the standard order, e.g. "milk, egg, wheat" """
+    return ', '.join(c for c in STANDARD_CATEGORIES if c in categories)
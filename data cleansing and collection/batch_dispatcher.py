@@ -0,0 +1,121 @@
+# batch_dispatcher.py
+"""
+Concurrent, order-preserving batch dispatcher for activity03_mapping.
+
+Keeps several mapping batches in flight on a thread pool and adapts how many
+(AIMD, like TCP congestion control): every successful batch nudges the limit
+up by 1/limit (about +1 per round of batches), and a rate-limit response
+halves it and pauses new submissions for a cool-down. Throughput therefore
+settles just under the real quota ceiling instead of a fixed sleep.
+Results come back in the original order whatever order batches finish in.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+_END = object()  # Marks the end of the item source
+
+
+class RateLimited(Exception):
+    """Raised by a batch function when the API reports its quota is exhausted"""
+    def __init__(self, message="rate limited", retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveDispatcher:
+    """
+    Runs fn(item) for every item with an adaptive number of concurrent calls.
+    """
+    def __init__(self, max_concurrency=8, initial_concurrency=2, min_concurrency=1,
+                 increase=1.0, decrease=0.5, cooldown=10.0, max_attempts=5):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts
+
+        # Run statistics
+        self.peak_limit = self.limit
+        self.rate_limit_events = 0
+        self.retries = 0
+
+    def _on_success(self):
+        # Additive increase: about +1 after a full window of successes
+        self.limit = min(self.max_concurrency, self.limit + self.increase / self.limit)
+        self.peak_limit = max(self.peak_limit, self.limit)
+
+    def _on_rate_limit(self):
+        # Multiplicative decrease
+        self.limit = max(self.min_concurrency, self.limit * self.decrease)
+        self.rate_limit_events += 1
+
+    def run(self, fn, items, on_result=None, fallback=None):
+        """
+        Returns [fn(item) for item in items] in input order.
+        on_result(index, item, result) is called in this thread as each item
+        finishes; fallback(item) supplies the result for items still rate
+        limited after max_attempts (None if not given).
+        items may be a generator: it is read lazily, one item per free slot,
+        so later items can be shaped by the results of earlier ones.
+        """
+        source = iter(items)
+        items = []
+        results = []
+        attempts = []
+        queue = deque()
+        exhausted = False
+        in_flight = {}
+        paused_until = 0.0
+        # Calls started before the last decrease belong to the same congestion
+        # event, so their 429s must not shrink the window again
+        epoch = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while queue or in_flight or not exhausted:
+                now = time.monotonic()
+                while len(in_flight) < int(self.limit) and now >= paused_until:
+                    if not queue:
+                        item = next(source, _END)
+                        if item is _END:
+                            exhausted = True
+                            break
+                        items.append(item)
+                        results.append(None)
+                        attempts.append(0)
+                        queue.append(len(items) - 1)
+                    index = queue.popleft()
+                    attempts[index] += 1
+                    in_flight[executor.submit(fn, items[index])] = (index, epoch)
+
+                timeout = paused_until - now if now < paused_until else None
+                if not in_flight:
+                    time.sleep(timeout or 0)
+                    continue
+
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, started_epoch = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except RateLimited as e:
+                        if started_epoch == epoch:
+                            self._on_rate_limit()
+                            epoch += 1
+                            wait_time = e.retry_after if e.retry_after is not None else self.cooldown
+                            paused_until = max(paused_until, time.monotonic() + wait_time)
+                        if attempts[index] < self.max_attempts:
+                            self.retries += 1
+                            queue.appendleft(index)  # Retry before newer work
+                            continue
+                        result = fallback(items[index]) if fallback else None
+                    else:
+                        self._on_success()
+
+                    results[index] = result
+                    if on_result:
+                        on_result(index, items[index], result)
+
+        return results
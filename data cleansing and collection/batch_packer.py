@@ -0,0 +1,161 @@
+# batch_packer.py
+"""
+Token-budget batch packing for activity03_mapping's model prompts.
+
+A fixed number of items per prompt wastes calls on short tags ("lupin")
+and risks truncated or mismatched replies for long allergensraw strings.
+Here each item gets an estimated token cost (its JSON in the prompt, plus
+the key echoed back and a short category list in the reply) and batches
+are filled up to a token budget instead.
+
+The budget adapts to the replies, AIMD style like batch_dispatcher:
+- a reply missing some of the items (length mismatch, truncated JSON)
+  halves the budget, measured from the size of the batch that failed, so
+  concurrent failures of one size don't compound;
+- a complete reply for a batch that used at least half the budget grows
+  it by a step, up to max_budget.
+
+Tokens are estimated at about 4 characters each, the usual figure for
+Gemini and other BPE tokenizers on English text; no tokenizer is needed.
+"""
+import json
+import math
+import threading
+
+CHARS_PER_TOKEN = 4
+OUTPUT_VALUE_TOKENS = 6   # A category list such as "milk, tree nut, wheat"
+ITEM_SYNTAX_TOKENS = 3    # Quotes, colon and comma around each pair
+
+DEFAULT_BUDGET = 1500
+DEFAULT_MAX_BUDGET = 4000
+DEFAULT_MAX_ITEMS = 500
+
+
+def estimate_tokens(text):
+    """Rough token count of a string"""
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def item_cost(text):
+    """Estimated prompt + reply tokens one item adds to a mapping call"""
+    quoted = estimate_tokens(json.dumps(text))
+    return 2 * quoted + OUTPUT_VALUE_TOKENS + ITEM_SYNTAX_TOKENS
+
+
+class TokenBudgetPacker:
+    """
+    Packs items into batches that fit the current token budget.
+    overhead: tokens of the prompt around the items, counted in every call.
+    Safe to use from the dispatcher's worker threads.
+    """
+    def __init__(self, budget=DEFAULT_BUDGET, max_budget=DEFAULT_MAX_BUDGET, overhead=0,
+                 max_items=DEFAULT_MAX_ITEMS, decrease=0.5, increase=0.1):
+        self.overhead = overhead
+        self.max_budget = max(budget, max_budget)
+        self.budget = float(budget)
+        self.min_budget = overhead + item_cost('')  # Always room for one item
+        self.max_items = max_items
+        self.decrease = decrease
+        self.step = budget * increase
+        self._lock = threading.Lock()
+
+        # Run statistics
+        self.calls = 0
+        self.items = 0
+        self.tokens = 0
+        self.min_items = None
+        self.max_items_seen = 0
+        self.mismatches = 0
+        self.shrinks = 0
+        self.grows = 0
+        self.low_budget = self.budget
+        self.peak_budget = self.budget
+
+    def batch_cost(self, texts):
+        """Estimated tokens of one call for these items"""
+        return self.overhead + sum(item_cost(t) for t in texts)
+
+    def split(self, texts):
+        """Distinct texts packed in order into batches within the current budget"""
+        batches = []
+        current = []
+        used = self.overhead
+        limit = self.budget
+        for text in texts:
+            cost = item_cost(text)
+            if current and (used + cost > limit or len(current) >= self.max_items):
+                batches.append(current)
+                current = []
+                used = self.overhead
+            current.append(text)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def iter_batches(self, rows, row_texts):
+        """
+        Yields batches of rows whose model items (row_texts(row), counted
+        once per batch) fit the budget read when each batch is cut, so a
+        lazy consumer gets batches sized by the replies so far. Rows with
+        no model items only count against max_items.
+        """
+        current = []
+        seen = set()
+        used = self.overhead
+        for row in rows:
+            new = [t for t in dict.fromkeys(row_texts(row)) if t not in seen]
+            cost = sum(item_cost(t) for t in new)
+            if current and (used + cost > self.budget or len(current) >= self.max_items):
+                yield current
+                current = []
+                seen = set()
+                used = self.overhead
+                new = list(dict.fromkeys(row_texts(row)))
+                cost = sum(item_cost(t) for t in new)
+            current.append(row)
+            seen.update(new)
+            used += cost
+        if current:
+            yield current
+
+    def report(self, asked, answered, tokens):
+        """
+        Records one model reply: `asked` items sent at an estimated `tokens`,
+        `answered` came back usable. Returns the new budget if it changed,
+        else None.
+        """
+        with self._lock:
+            self.calls += 1
+            self.items += asked
+            self.tokens += tokens
+            self.min_items = asked if self.min_items is None else min(self.min_items, asked)
+            self.max_items_seen = max(self.max_items_seen, asked)
+
+            before = self.budget
+            if answered < asked:
+                self.mismatches += 1
+                if asked > 1:
+                    self.budget = max(self.min_budget, min(self.budget, tokens * self.decrease))
+            elif tokens >= self.budget / 2:
+                self.budget = min(self.max_budget, self.budget + self.step)
+
+            if self.budget < before:
+                self.shrinks += 1
+            elif self.budget > before:
+                self.grows += 1
+            self.low_budget = min(self.low_budget, self.budget)
+            self.peak_budget = max(self.peak_budget, self.budget)
+            return self.budget if self.budget != before else None
+
+    def summary(self):
+        """Printable lines describing the batches sent so far"""
+        if not self.calls:
+            return ["No model calls"]
+        return [
+            f"Model calls: {self.calls} | items per call: min {self.min_items}, "
+            f"mean {self.items / self.calls:.1f}, max {self.max_items_seen}",
+            f"Estimated tokens per call: {self.tokens / self.calls:.0f} (budget {self.low_budget:.0f}"
+            f"-{self.peak_budget:.0f}, now {self.budget:.0f}; {self.shrinks} shrinks, {self.grows} grows, "
+            f"{self.mismatches} incomplete replies)",
+        ]
@@ -0,0 +1,312 @@
+# benchmark.py
+"""
+Reproducible benchmarks for the cleaning, validation and mapping hot paths.
+
+Synthetic Open Food Facts records (synthetic_data.py) are generated from
+a fixed seed, with a mix of plain English, non-English, measurement-heavy
+(mineral water analysis) and unicode-heavy (accents, combining marks,
+symbols) products. Every benchmark runs at each requested size and keeps the best of
+--repeat runs, so numbers are stable enough to compare between commits:
+
+    python benchmark.py --save bench_baseline.json
+    python benchmark.py --compare bench_baseline.json
+
+Compare mode prints the change per benchmark and exits with status 1 when
+one got slower than --threshold. The activity03_mapping pipeline runs with
+an in-process stub model, so no API key or network is needed.
+
+product_records is a memory measurement, not a timing: it prints the bytes
+per collected product for the old product dicts and for ProductRecord.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from synthetic_data import SEED, generate_records, generate_allergen_values, StubModel
+
+# --- CONFIGURATION ---
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10  # Slowdown ratio reported as a regression
+
+
+def best_time(fn, repeat):
+    """Fastest of `repeat` runs, in seconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def text_benchmarks(records):
+    """(name, callable) pairs over the raw records"""
+    import openfoodfacts_to_txt as collector
+    import text_engine
+    from ingredient_index import get_index
+
+    ingredients = [r['ingredients_text'] for r in records]
+    cleaned = [text_engine.clean_text(t) for t in ingredients]
+    index = get_index()
+
+    return [
+        ('clean_text', lambda: [collector.clean_text(t) for t in ingredients]),
+        ('text_engine.clean_text', lambda: [text_engine.clean_text(t) for t in ingredients]),
+        ('is_english_alphabet_text', lambda: [collector.is_english_alphabet_text(t) for t in ingredients]),
+        ('text_engine.is_english_alphabet_text',
+         lambda: [text_engine.is_english_alphabet_text(t) for t in ingredients]),
+        ('is_valid_ingredient_text', lambda: [collector.is_valid_ingredient_text(t) for t in cleaned]),
+        ('text_engine.is_valid_ingredient_text',
+         lambda: [text_engine.is_valid_ingredient_text(t) for t in cleaned]),
+        ('validate_product_data', lambda: [collector.validate_product_data(r) for r in records]),
+        ('validate_products_batch', lambda: collector.validate_products_batch(records)),
+        ('get_product_allergens', lambda: [collector.get_product_allergens(r) for r in records]),
+        ('ingredient_index.infer_column', lambda: index.infer_column(ingredients)),
+    ]
+
+
+def matcher_benchmarks(records):
+    """
+    (name, callable) pairs for the allergen keyword matcher against the
+    substring loop it replaced: over the allergen fields the collector
+    matches with its 26 keywords, and over ingredient text with those
+    keywords and with 300 more, where the loop's cost has grown and the
+    matcher's hasn't
+    """
+    from allergen_matcher import build_keyword_matcher, naive_keywords
+    from openfoodfacts_to_txt import TARGET_ALLERGEN_KEYWORDS
+
+    fields = [r[f] for r in records for f in ('allergens_from_ingredients', 'allergens') if r[f]]
+    texts = [r['ingredients_text'] for r in records]
+    extended = TARGET_ALLERGEN_KEYWORDS + [f"additive{i}" for i in range(300)]
+    benchmarks = []
+    for suffix, keywords, inputs in (('[allergen fields]', TARGET_ALLERGEN_KEYWORDS, fields),
+                                     ('', TARGET_ALLERGEN_KEYWORDS, texts),
+                                     (f'[{len(extended)} keywords]', extended, texts)):
+        matcher = build_keyword_matcher(keywords)
+        matcher.rebuild()
+        benchmarks += [
+            ('naive_keywords' + suffix,
+             lambda keywords=keywords, inputs=inputs: [naive_keywords(t, keywords) for t in inputs]),
+            ('allergen_matcher.find_keywords' + suffix,
+             lambda matcher=matcher, inputs=inputs: [matcher.find_keywords(t) for t in inputs]),
+        ]
+    return benchmarks
+
+
+def product_dict(record):
+    """The product dict the collector built before ProductRecord"""
+    return {'id': record.id, 'name': record.name, 'ingredients': record.ingredients,
+            'allergens': record.allergens, 'link': record.link}
+
+
+def allocated_bytes(build):
+    """Bytes still allocated by what build() returns"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        return tracemalloc.get_traced_memory()[0] - before, kept
+    finally:
+        tracemalloc.stop()
+
+
+def product_memory(records):
+    """
+    (products, dict bytes, record bytes, text bytes) for the validated
+    products of `records`. Name and ingredient strings are the same for both
+    forms and counted once in text bytes; the allergen string is rebuilt per
+    product, as get_product_allergens does.
+    """
+    import openfoodfacts_to_txt as collector
+    from product_record import ProductRecord
+
+    fields = [(p.id, p.name, p.ingredients, p.allergens.split(', '))
+              for ok, p in collector.validate_products_batch(records) if ok]
+    dict_bytes, _ = allocated_bytes(lambda: [
+        product_dict(ProductRecord(i, n, ing, ', '.join(a))) for i, n, ing, a in fields])
+    record_bytes, _ = allocated_bytes(lambda: [
+        ProductRecord(i, n, ing, ', '.join(a)) for i, n, ing, a in fields])
+    text_bytes = sum(sys.getsizeof(n) + sys.getsizeof(ing) for _, n, ing, _ in fields)
+    return len(fields), dict_bytes, record_bytes, text_bytes
+
+
+def install_stub_model(mapping):
+    """Routes the mapper's model calls to StubModel instead of the API"""
+    from model_router import ModelRouter
+    mapping._router = ModelRouter(['stub'], lambda name: StubModel())
+    mapping._router_built = True
+
+
+def mapping_benchmark(values):
+    """
+    The activity03_mapping batch pipeline between reading and writing:
+    dedup by mapping_key, local taxonomy + stub model through the adaptive
+    dispatcher, then the fan-out back to every row. No cache is used.
+    """
+    import activity03_mapping as mapping
+    from batch_dispatcher import AdaptiveDispatcher
+    from mapping_cache import mapping_key
+
+    install_stub_model(mapping)
+
+    def run():
+        unique_keys = list(dict.fromkeys(mapping_key(v) for v in values))
+        mapped = {"": ""}
+        pending = [k for k in unique_keys if k not in mapped]
+        batches = mapping.get_packer().iter_batches(pending, lambda key: mapping.map_allergen_text(key)[1])
+
+        def on_batch_done(index, batch, outcome):
+            mapped.update(zip(batch, outcome[0]))
+
+        dispatcher = AdaptiveDispatcher(max_concurrency=mapping.MAX_CONCURRENT_BATCHES,
+                                        initial_concurrency=mapping.INITIAL_CONCURRENT_BATCHES)
+        dispatcher.run(lambda batch: mapping.map_allergens_batch_detailed(batch, raise_on_quota=True),
+                       batches, on_result=on_batch_done,
+                       fallback=lambda batch: ([""] * len(batch), [False] * len(batch)))
+        return [mapped[mapping_key(v)] for v in values]
+
+    return run
+
+
+def evaluation_benchmark(values):
+    """
+    evaluate_predictions on `values` as the mapped column, scored against
+    shifted copies of it as the predictions of three model variants
+    """
+    from evaluate_predictions import evaluate_values
+
+    truth = values * 3
+    predicted = values[1:] + values[:1] + values[7:] + values[:7] + values
+    models = ['a'] * len(values) + ['b'] * len(values) + ['c'] * len(values)
+    return lambda: evaluate_values(truth, predicted, models)
+
+
+def run_benchmarks(sizes, repeat, only=None):
+    """{name: {size: seconds}} for every benchmark and size"""
+    results = {}
+
+    def record(name, size, seconds):
+        results.setdefault(name, {})[str(size)] = seconds
+        print(f"   {name:<40} {size:>9,}  {seconds:9.4f}s  {seconds / size * 1e6:9.2f} µs/item")
+
+    for size in sizes:
+        print(f"\n📦 {size:,} records (seed {SEED})")
+        records = generate_records(size)
+        for name, fn in text_benchmarks(records) + matcher_benchmarks(records):
+            if only and name not in only:
+                continue
+            record(name, size, best_time(fn, repeat))
+
+        if not only or 'product_records' in only:
+            count, dict_bytes, record_bytes, text_bytes = product_memory(records)
+            print(f"   {'product_records (memory)':<40} {count:>9,}  dict {dict_bytes / count:5.0f} B/product"
+                  f"  record {record_bytes / count:5.0f} B/product  ({1 - record_bytes / dict_bytes:.0%} less, "
+                  f"{1 - (record_bytes + text_bytes) / (dict_bytes + text_bytes):.0%} with the text)")
+
+        if not only or 'mapping_pipeline' in only:
+            run = mapping_benchmark(generate_allergen_values(size))
+            record('mapping_pipeline', size, best_time(run, repeat))
+
+        if not only or 'evaluate_predictions' in only:
+            run = evaluation_benchmark(generate_allergen_values(size))
+            record('evaluate_predictions', size * 3, best_time(run, repeat))
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints the change against a baseline; returns the regressed (name, size) pairs"""
+    regressions = []
+    print(f"\n📊 Compared with baseline from {baseline.get('created', '?')} (threshold +{threshold:.0%})")
+    if baseline.get('environment') != environment():
+        print("   ⚠️ Baseline was recorded on a different Python/platform, compare with care")
+    for name, by_size in results.items():
+        for size, seconds in by_size.items():
+            before = baseline.get('results', {}).get(name, {}).get(size)
+            if not before:
+                print(f"   {name:<40} {int(size):>9,}  new")
+                continue
+            change = seconds / before - 1
+            flag = ""
+            if change > threshold:
+                flag = "  ❌ slower"
+                regressions.append((name, size))
+            elif change < -threshold:
+                flag = "  ✅ faster"
+            print(f"   {name:<40} {int(size):>9,}  {before:9.4f}s -> {seconds:9.4f}s  {change:+7.1%}{flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Benchmark the cleaning, validation and mapping hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Numbers of records to benchmark with")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="Runs per benchmark; the fastest one is kept")
+    parser.add_argument('--only', nargs='+',
+                        help="Run only these benchmarks (e.g. clean_text mapping_pipeline)")
+    parser.add_argument('--save', metavar='FILE',
+                        help="Write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="Compare the results with a saved baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown (0.10 = 10%%) counted as a regression in compare mode")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("=" * 60)
+    print("  PIPELINE BENCHMARKS")
+    print("=" * 60)
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Error reading baseline: {e}")
+            return 2
+
+    results = run_benchmarks(args.sizes, args.repeat, args.only)
+
+    if args.save:
+        report = {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'seed': SEED,
+            'repeat': args.repeat,
+            'environment': environment(),
+            'results': results,
+        }
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) above {args.threshold:.0%}")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
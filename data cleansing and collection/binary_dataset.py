@@ -0,0 +1,325 @@
+# binary_dataset.py
+"""
+Offset-indexed binary export of the app dataset, next to the
+foodpreprocessed.csv that CsvReader parses line by line (quote-aware split
+and a replace per field) at every app start.
+
+Layout, all integers little-endian:
+
+    header      64 bytes, fixed: magic "FDSB", version, field count,
+                record count, record size, string table offset/size,
+                record table offset
+    strings     UTF-8 text of every field, back to back; repeated values
+                of the low-cardinality columns (allergensraw, the mapped
+                categories) are stored once
+    records     one fixed-size entry per product: (offset, length) of each
+                text field in the string table, then the allergensmapped
+                and allergensinferred categories as 9-bit masks
+                (bit i = STANDARD_CATEGORIES[i])
+
+Record i sits at records_offset + i * record_size, so a reader can map
+the file and decode just the products it shows, and the masks of the
+whole dataset are one strided array without touching any text.
+
+    python binary_dataset.py --input foodpreprocessed.csv --output foodpreprocessed.bin
+    python binary_dataset.py --input foodpreprocessed.csv --output foodpreprocessed.bin --check
+
+--check reads the file back, compares every record with the CSV and
+times a CsvReader-style parse against the binary reader.
+
+numpy is imported on first use (it comes with pandas).
+"""
+import argparse
+import mmap
+import struct
+import sys
+import time
+
+from allergen_taxonomy import categories_mask
+from table_io import iter_table, DEFAULT_CHUNK_ROWS
+
+# --- CONFIGURATION ---
+INPUT_FILE = 'foodpreprocessed.csv'   # activity02_cleansing output
+OUTPUT_FILE = 'foodpreprocessed.bin'  # Copy to mobile_slm5/assets/ next to the CSV
+TEXT_FIELDS = ['id', 'name', 'link', 'ingredients', 'allergensraw', 'allergensmapped']
+MASK_FIELDS = ['allergensmapped', 'allergensinferred']
+# Columns with few distinct values, written to the string table once per value
+SHARED_FIELDS = {'allergensraw', 'allergensmapped'}
+
+MAGIC = b'FDSB'
+VERSION = 1
+# magic, version, text fields, mask fields, records, record size,
+# strings offset, strings size, records offset, padding to 64 bytes
+HEADER = struct.Struct('<4sHHHxxIIQQQ20x')
+
+
+def record_dtype(text_fields=len(TEXT_FIELDS), mask_fields=len(MASK_FIELDS)):
+    """numpy dtype of one record table entry"""
+    import numpy as np
+    return np.dtype([('offsets', '<u4', (text_fields,)), ('lengths', '<u4', (text_fields,)),
+                     ('masks', '<u2', (mask_fields,))])
+
+
+class BinaryDatasetWriter:
+    """
+    Streams DataFrame chunks into the binary format. The string table is
+    written as chunks arrive, the record table and the header on close.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._file.write(bytes(HEADER.size))  # Rewritten on close
+        self._string_size = 0
+        self._shared = {}
+        self._masks_cache = {}
+        self._records = []
+        self._dtype = record_dtype()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _add_string(self, text):
+        data = text.encode('utf-8')
+        offset = self._string_size
+        self._file.write(data)
+        self._string_size += len(data)
+        return offset, len(data)
+
+    def _add_shared(self, text):
+        ref = self._shared.get(text)
+        if ref is None:
+            ref = self._shared[text] = self._add_string(text)
+        return ref
+
+    def _mask(self, value):
+        mask = self._masks_cache.get(value)
+        if mask is None:
+            mask = self._masks_cache[value] = categories_mask(value)
+        return mask
+
+    def write(self, df):
+        import numpy as np
+        records = np.zeros(len(df), dtype=self._dtype)
+        for f, field in enumerate(TEXT_FIELDS):
+            values = df[field].tolist() if field in df.columns else [''] * len(df)
+            add = self._add_shared if field in SHARED_FIELDS else self._add_string
+            refs = [add(str(v)) for v in values]
+            if refs:
+                records['offsets'][:, f], records['lengths'][:, f] = zip(*refs)
+        for m, field in enumerate(MASK_FIELDS):
+            if field in df.columns:
+                records['masks'][:, m] = [self._mask(v) for v in df[field].tolist()]
+        if self._string_size >= 1 << 32:
+            raise ValueError("String table over 4 GiB, the 32-bit offsets can't address it")
+        self._records.append(records)
+        self.rows += len(df)
+
+    def close(self):
+        if self._file is None:
+            return
+        import numpy as np
+        records = np.concatenate(self._records) if self._records else np.zeros(0, self._dtype)
+        records_offset = HEADER.size + self._string_size
+        self._file.write(records.tobytes())
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(TEXT_FIELDS), len(MASK_FIELDS), self.rows,
+                                     self._dtype.itemsize, HEADER.size, self._string_size, records_offset))
+        self._file.close()
+        self._file = None
+
+
+class BinaryDataset:
+    """
+    Memory-mapped reader. dataset[i] decodes one record as a dict of the
+    text fields; masks is an (n, 2) uint16 view of the mapped/inferred
+    masks, read without decoding any text.
+    """
+    def __init__(self, path):
+        import numpy as np
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, text_fields, mask_fields, self.count, record_size,
+         self._strings_offset, strings_size, records_offset) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary dataset (magic {magic!r})")
+        if version != VERSION:
+            raise ValueError(f"{path} has format version {version}, this reader knows {VERSION}")
+        dtype = record_dtype(text_fields, mask_fields)
+        if dtype.itemsize != record_size:
+            raise ValueError(f"{path} has {record_size}-byte records, expected {dtype.itemsize}")
+        self.records = np.frombuffer(self._map, dtype=dtype, count=self.count, offset=records_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        record = self.records[index]
+        base = self._strings_offset
+        data = self._map
+        return {field: data[base + offset:base + offset + length].decode('utf-8')
+                for field, offset, length in zip(TEXT_FIELDS, record['offsets'].tolist(),
+                                                 record['lengths'].tolist())}
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    @property
+    def masks(self):
+        return self.records['masks']
+
+    def close(self):
+        if self._map is not None:
+            self.records = None  # Release the buffer view before unmapping
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+
+def export_dataset(input_path, output_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Writes any table_io table with the app columns as a binary dataset; returns the record count"""
+    with BinaryDatasetWriter(output_path) as writer:
+        for chunk in iter_table(input_path, chunk_rows):
+            writer.write(chunk)
+    return writer.rows
+
+
+def parse_app_csv_line(line):
+    """CsvReader.parseCsvLine, ported as-is: quotes toggle, commas split"""
+    tokens = []
+    current = []
+    in_quotes = False
+    for char in line:
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ',' and not in_quotes:
+            tokens.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    tokens.append(''.join(current))
+    return tokens
+
+
+def read_app_csv(path):
+    """Records as CsvReader.readFoodItemsFromAssets builds them"""
+    items = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        f.readline()  # Header
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                continue
+            cols = parse_app_csv_line(line)
+            if len(cols) >= 5:
+                cols = [c.strip().replace('"', '') for c in cols]
+                items.append(dict(zip(TEXT_FIELDS, cols[:5] + [cols[5] if len(cols) > 5 else ''])))
+    return items
+
+
+def check_round_trip(csv_path, binary_path, samples=1000):
+    """
+    Compares every binary record with the CSV (read with pandas, so quoted
+    commas are kept) and times a CsvReader-style load against the binary
+    reader. Returns the number of mismatching records.
+    """
+    import random
+
+    expected = [row for chunk in iter_table(csv_path) for row in chunk.to_dict('records')]
+    mismatches = 0
+    with BinaryDataset(binary_path) as dataset:
+        if len(dataset) != len(expected):
+            print(f"   ❌ {len(dataset):,} records in {binary_path}, {len(expected):,} in {csv_path}")
+            return abs(len(dataset) - len(expected))
+        for i, row in enumerate(expected):
+            record = dataset[i]
+            wanted = {f: str(row.get(f, '')) for f in TEXT_FIELDS}
+            masks = [categories_mask(row.get(f, '')) for f in MASK_FIELDS]
+            if record != wanted or dataset.masks[i].tolist() != masks:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"   ❌ Record {i} differs: {record} != {wanted}")
+
+        started = time.perf_counter()
+        read_app_csv(csv_path)
+        csv_time = time.perf_counter() - started
+
+        picks = random.Random(0).sample(range(len(dataset)), min(samples, len(dataset)))
+        started = time.perf_counter()
+        for i in picks:
+            dataset[i]
+        random_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        list(dataset)
+        full_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with_allergens = int((dataset.masks[:, 0] != 0).sum())
+        mask_time = time.perf_counter() - started
+
+    print(f"   CSV parse like CsvReader (all records) : {csv_time:.3f}s")
+    print(f"   Binary decode (all records)            : {full_time:.3f}s")
+    print(f"   Binary random access (sampled records) : {random_time:.4f}s ({len(picks):,} records)")
+    print(f"   Mapped-allergen count from the masks   : {mask_time:.4f}s ({with_allergens:,} products)")
+    return mismatches
+
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Export the app dataset as an offset-indexed binary file")
+    parser.add_argument('--input', default=INPUT_FILE,
+                        help="App table to export (.txt/.csv, .parquet, .arrow or .xlsx)")
+    parser.add_argument('--output', default=OUTPUT_FILE,
+                        help="Binary dataset to write")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Rows processed per chunk")
+    parser.add_argument('--check', action='store_true',
+                        help="Read the file back, compare it with the input and time both readers")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("=" * 60)
+    print("  BINARY DATASET EXPORT")
+    print("=" * 60)
+
+    try:
+        print(f"📂 Exporting {args.input}...")
+        start = time.perf_counter()
+        rows = export_dataset(args.input, args.output, args.chunk_size)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Saved {rows} records to {args.output} in {elapsed:.2f}s")
+    except Exception as e:
+        print(f"❌ Error exporting file: {e}")
+        return 1
+
+    if args.check:
+        print("🔍 Checking the export against the input...")
+        mismatches = check_round_trip(args.input, args.output)
+        if mismatches:
+            print(f"❌ {mismatches} record(s) differ")
+            return 1
+        print("✅ Every record matches")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# checkpoint.py
+"""
+Append-only JSON-lines journal used to make long runs restart-safe.
+
+openfoodfacts_to_txt journals every accepted product and finished search
+term, activity03_mapping every finished mapping batch. Each record is one
+line written and flushed as soon as the work is done, so a crashed or
+killed process loses at most the record being written. fsync, which only
+matters if the machine itself goes down, runs every `sync_every` records
+and on sync() (e.g. at the end of a search term), so small records don't
+pay for a disk flush each. A torn last line is ignored and cut off when the
+journal is reopened with resume=True.
+"""
+import json
+import os
+
+
+class CheckpointJournal:
+    """
+    records: what an earlier run left behind (empty unless resume=True).
+    sync_every: appends between fsyncs (1 = every record, 0 = only on sync()).
+    """
+    def __init__(self, path, resume=False, sync_every=1):
+        self.path = path
+        self.sync_every = sync_every
+        self.records = []
+        self._unsynced = 0
+        if resume:
+            self._load()
+        else:
+            open(path, 'w', encoding='utf-8').close()  # Fresh run: drop the old journal
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        try:
+            f = open(self.path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            # Keep records up to the first torn line (interrupted mid-write)
+            good_end = 0
+            for line in iter(f.readline, ''):
+                if not line.endswith('\n'):
+                    break
+                try:
+                    self.records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+                good_end = f.tell()
+            f.truncate(good_end)
+
+    def append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if self.sync_every and self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        """Forces the records written so far to disk"""
+        if self._unsynced and not self._file.closed:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def remove(self):
+        """Deletes the journal once its run has completed"""
+        self._unsynced = 0  # No point flushing a file about to be deleted
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
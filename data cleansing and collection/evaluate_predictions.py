@@ -0,0 +1,261 @@
+# evaluate_predictions.py
+"""
+Scores allergen predictions against allergensmapped, as the app's
+ResultsActivity compares them one item at a time, but for whole result
+exports at once.
+
+Both columns are free-text comma lists ("milk, tree nuts", "None"). Each
+distinct string is parsed once into a 9-bit mask (bit i =
+STANDARD_CATEGORIES[i]), so a column becomes one uint16 array and every
+metric is a bit operation over arrays:
+
+    per category   true/false positives and negatives, precision, recall,
+                   F1 and support, plus micro and macro averages
+    per item       exact-match ratio and Hamming loss (differing bits / 9)
+    confusion      9 x 9 counts of (mapped category, predicted category)
+                   pairs on the same item
+
+Items are first counted per distinct (group, mapped mask, predicted
+mask) triple with one bincount, and the metrics are computed from those
+counts, so millions of predictions cost one pass over the mask arrays.
+Exports from several model variants can be scored together with
+--group-by (e.g. a model column).
+
+    python evaluate_predictions.py --input predictions.csv
+    python evaluate_predictions.py --input predictions.csv --group-by model --output scores.json
+
+numpy and pandas are imported on first use.
+"""
+import argparse
+import json
+import sys
+import time
+
+from allergen_matcher import STANDARD_CATEGORIES
+from allergen_taxonomy import categories_mask
+from table_io import read_header, iter_table, DEFAULT_CHUNK_ROWS
+
+# --- CONFIGURATION ---
+INPUT_FILE = 'predictions.csv'
+# Firestore field names first (FirebaseService), then the pipeline column names
+TRUTH_COLUMNS = ['mappedAllergens', 'allergensmapped']
+PREDICTED_COLUMNS = ['predictedAllergens', 'allergenspredicted']
+
+NUM_CATEGORIES = len(STANDARD_CATEGORIES)
+PAIR_TABLE_LIMIT = 1 << 24  # Largest dense (group, truth, predicted) count table; bigger ones sort instead
+_popcount = None
+
+
+def popcount_table():
+    """Set-bit count of every 9-bit mask"""
+    global _popcount
+    if _popcount is None:
+        import numpy as np
+        _popcount = np.array([bin(m).count('1') for m in range(1 << NUM_CATEGORIES)], dtype=np.uint8)
+    return _popcount
+
+
+def encode_masks(values):
+    """uint16 mask of every comma-list value; each distinct string is parsed once"""
+    import numpy as np
+    import pandas as pd
+
+    codes, distinct = pd.factorize(pd.Series(values, dtype=object))
+    lookup = np.fromiter((categories_mask(v) for v in distinct), dtype=np.uint16, count=len(distinct))
+    # Missing values get code -1, which picks the trailing 0
+    return np.append(lookup, np.uint16(0))[codes]
+
+
+def mask_bits(masks):
+    """(n, 9) bool matrix, column i = STANDARD_CATEGORIES[i] present"""
+    import numpy as np
+    return (masks[:, None] >> np.arange(NUM_CATEGORIES, dtype=np.uint16)) & 1 == 1
+
+
+def _ratio(numerator, denominator):
+    """Element-wise numerator / denominator, 0 where the denominator is 0"""
+    import numpy as np
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def score_counts(tp, fp, fn, items, exact, hamming_bits, confusion):
+    """Metric dict from the raw counts of one group"""
+    import numpy as np
+
+    precision = _ratio(tp, tp + fp)
+    recall = _ratio(tp, tp + fn)
+    f1 = _ratio(2 * precision * recall, precision + recall)
+    micro_p = float(_ratio(tp.sum(), tp.sum() + fp.sum()))
+    micro_r = float(_ratio(tp.sum(), tp.sum() + fn.sum()))
+    return {
+        'items': int(items),
+        'exact_match': float(_ratio(exact, items)),
+        'hamming_loss': float(_ratio(hamming_bits, items * NUM_CATEGORIES)),
+        'micro': {'precision': micro_p, 'recall': micro_r,
+                  'f1': float(_ratio(2 * micro_p * micro_r, micro_p + micro_r))},
+        'macro': {'precision': float(np.mean(precision)), 'recall': float(np.mean(recall)),
+                  'f1': float(np.mean(f1))},
+        'categories': {
+            category: {'precision': float(precision[i]), 'recall': float(recall[i]), 'f1': float(f1[i]),
+                       'tp': int(tp[i]), 'fp': int(fp[i]), 'fn': int(fn[i]),
+                       'tn': int(items - tp[i] - fp[i] - fn[i]), 'support': int(tp[i] + fn[i])}
+            for i, category in enumerate(STANDARD_CATEGORIES)
+        },
+        'confusion': confusion.astype(int).tolist(),
+    }
+
+
+def pair_counts(groups, truth, predicted, size):
+    """
+    Distinct (group, truth mask, predicted mask) triples and how many items
+    have each. Every metric depends only on these, so the rest of the
+    scoring works on at most size * 512 * 512 rows whatever the item count.
+    """
+    import numpy as np
+
+    keys = (groups.astype(np.int64) << 18) | (truth.astype(np.int64) << 9) | predicted
+    if size << 18 <= PAIR_TABLE_LIMIT:
+        counts = np.bincount(keys, minlength=size << 18)
+        pairs = np.flatnonzero(counts)
+        counts = counts[pairs]
+    else:
+        pairs, counts = np.unique(keys, return_counts=True)
+    return pairs >> 18, ((pairs >> 9) & 0x1ff).astype(np.uint16), (pairs & 0x1ff).astype(np.uint16), counts
+
+
+def evaluate_masks(truth, predicted, groups=None, group_names=None):
+    """
+    Scores mask arrays. groups: optional int array of group codes per item
+    (0..len(group_names)-1). Returns {group name: metrics}, or the metrics
+    alone without groups.
+    """
+    import numpy as np
+
+    truth = np.asarray(truth, dtype=np.uint16)
+    predicted = np.asarray(predicted, dtype=np.uint16)
+    grouped = groups is not None
+    if not grouped:
+        groups = np.zeros(len(truth), dtype=np.intp)
+        group_names = ['all']
+    size = len(group_names)
+
+    pair_groups, pair_truth, pair_predicted, counts = pair_counts(np.asarray(groups), truth, predicted, size)
+    truth_bits = mask_bits(pair_truth)
+    predicted_bits = mask_bits(pair_predicted)
+    weights = counts.astype(np.float64)[:, None]
+    weighted_truth = truth_bits * weights
+    # Per pair: items, exact matches, differing bits, then hits / predicted / mapped per category
+    features = np.hstack([weights, (pair_truth == pair_predicted)[:, None] * weights,
+                          popcount_table()[pair_truth ^ pair_predicted][:, None] * weights,
+                          weighted_truth * predicted_bits, predicted_bits * weights, weighted_truth])
+
+    # Pairs come out sorted by group, so each group is one slice
+    bounds = np.searchsorted(pair_groups, np.arange(size + 1))
+    totals = np.zeros((size, features.shape[1]))
+    confusion = np.zeros((size, NUM_CATEGORIES, NUM_CATEGORIES))
+    for g in range(size):
+        lo, hi = bounds[g], bounds[g + 1]
+        totals[g] = features[lo:hi].sum(axis=0)
+        # Sum of the outer products of mapped and predicted bits
+        confusion[g] = weighted_truth[lo:hi].T @ predicted_bits[lo:hi]
+
+    items, exact, hamming_bits = totals[:, 0], totals[:, 1], totals[:, 2]
+    tp = totals[:, 3:3 + NUM_CATEGORIES]
+    fp = totals[:, 3 + NUM_CATEGORIES:3 + 2 * NUM_CATEGORIES] - tp
+    fn = totals[:, 3 + 2 * NUM_CATEGORIES:] - tp
+
+    scores = {name: score_counts(tp[g], fp[g], fn[g], items[g], exact[g], hamming_bits[g], confusion[g])
+              for g, name in enumerate(group_names)}
+    return scores if grouped else scores['all']
+
+
+def evaluate_values(truth_values, predicted_values, group_values=None):
+    """Scores comma-list columns (optionally grouped by a column of labels)"""
+    import pandas as pd
+
+    truth = encode_masks(truth_values)
+    predicted = encode_masks(predicted_values)
+    if group_values is None:
+        return evaluate_masks(truth, predicted)
+    groups, names = pd.factorize(pd.Series(group_values, dtype=object).fillna(''), sort=True)
+    return evaluate_masks(truth, predicted, groups, [str(n) for n in names])
+
+
+def pick_column(columns, wanted, candidates):
+    """The requested column, or the first candidate present"""
+    if wanted:
+        if wanted not in columns:
+            raise ValueError(f"No '{wanted}' column (have: {', '.join(columns)})")
+        return wanted
+    for column in candidates:
+        if column in columns:
+            return column
+    raise ValueError(f"None of {', '.join(candidates)} found (have: {', '.join(columns)})")
+
+
+def print_scores(name, scores):
+    """Console summary of one group's metrics"""
+    print(f"\n📊 {name}: {scores['items']:,} items")
+    print(f"   Exact match {scores['exact_match']:.3f}   Hamming loss {scores['hamming_loss']:.4f}")
+    for label in ('micro', 'macro'):
+        s = scores[label]
+        print(f"   {label:<5} P {s['precision']:.3f}  R {s['recall']:.3f}  F1 {s['f1']:.3f}")
+    print(f"   {'category':<10} {'P':>6} {'R':>6} {'F1':>6} {'support':>9}")
+    for category, s in scores['categories'].items():
+        print(f"   {category:<10} {s['precision']:6.3f} {s['recall']:6.3f} {s['f1']:6.3f} {s['support']:9,}")
+
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Score allergen predictions against allergensmapped")
+    parser.add_argument('--input', default=INPUT_FILE,
+                        help="Prediction export (.txt/.csv, .parquet, .arrow or .xlsx)")
+    parser.add_argument('--truth', help=f"Mapped column (default: {' or '.join(TRUTH_COLUMNS)})")
+    parser.add_argument('--predicted', help=f"Prediction column (default: {' or '.join(PREDICTED_COLUMNS)})")
+    parser.add_argument('--group-by', help="Score each value of this column separately (e.g. the model)")
+    parser.add_argument('--output', metavar='FILE', help="Write the scores as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import pandas as pd
+
+    args = parse_args(argv)
+
+    print("=" * 60)
+    print("  ALLERGEN PREDICTION EVALUATION")
+    print("=" * 60)
+
+    try:
+        print(f"📂 Reading file: {args.input}...")
+        columns = read_header(args.input)
+        truth_column = pick_column(columns, args.truth, TRUTH_COLUMNS)
+        predicted_column = pick_column(columns, args.predicted, PREDICTED_COLUMNS)
+        used = [truth_column, predicted_column] + ([args.group_by] if args.group_by else [])
+        if args.group_by and args.group_by not in columns:
+            raise ValueError(f"No '{args.group_by}' column")
+        df = pd.concat(list(iter_table(args.input, DEFAULT_CHUNK_ROWS, columns=used)), ignore_index=True)
+    except Exception as e:
+        print(f"❌ Error reading file: {e}")
+        return 1
+
+    start = time.perf_counter()
+    scores = evaluate_values(df[truth_column].tolist(), df[predicted_column].tolist(),
+                             df[args.group_by].tolist() if args.group_by else None)
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ Scored {len(df):,} predictions ({predicted_column} vs {truth_column}) in {elapsed:.3f}s")
+
+    for name, group_scores in (scores.items() if args.group_by else [('all', scores)]):
+        print_scores(name, group_scores)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(scores, f, indent=2)
+        print(f"\n💾 Scores saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
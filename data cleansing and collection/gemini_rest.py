@@ -0,0 +1,81 @@
+# gemini_rest.py
+"""
+Minimal Gemini REST client with the parts of the google.generativeai API
+that activity03_mapping uses (list_models, GenerativeModel.generate_content).
+
+It lets the mapper talk to any server speaking the Gemini REST protocol,
+e.g. a local stand-in or record/replay proxy from standin_server.py
+(activity03_mapping.py --model-url http://127.0.0.1:8766), without the SDK.
+Quota errors (HTTP 429) raise ResourceExhausted like the SDK does, with
+the server's Retry-After (seconds) as its retry_after attribute.
+"""
+import requests
+
+try:
+    from google.api_core.exceptions import ResourceExhausted
+except ImportError:
+    class ResourceExhausted(Exception):
+        """HTTP 429 from the model endpoint (google.api_core's class when installed)"""
+
+API_VERSION = 'v1beta'
+REQUEST_TIMEOUT = 60
+
+
+class ModelInfo:
+    def __init__(self, name, supported_generation_methods):
+        self.name = name
+        self.supported_generation_methods = supported_generation_methods
+
+
+class TextResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class RestGenAI:
+    """Drop-in for the google.generativeai module, bound to one endpoint"""
+    def __init__(self, base_url, api_key="", pool_size=16):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _call(self, method, path, body=None):
+        params = {'key': self.api_key} if self.api_key else None
+        response = self.session.request(method, f"{self.base_url}/{API_VERSION}/{path}",
+                                        params=params, json=body, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 429:
+            error = ResourceExhausted(f"429 {response.text[:200]}")
+            try:
+                error.retry_after = float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                error.retry_after = None
+            raise error
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def list_models(self):
+        data = self._call('GET', 'models')
+        return [ModelInfo(m['name'], m.get('supportedGenerationMethods', []))
+                for m in data.get('models', [])]
+
+    def GenerativeModel(self, name):
+        return RestModel(self, name)
+
+
+class RestModel:
+    def __init__(self, client, name):
+        self.client = client
+        self.model_name = name if name.startswith('models/') else f"models/{name}"
+
+    def generate_content(self, prompt):
+        data = self.client._call('POST', f"{self.model_name}:generateContent",
+                                 {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]})
+        candidates = data.get('candidates') or []
+        if not candidates:
+            raise RuntimeError(f"No candidates in response: {str(data)[:200]}")
+        parts = candidates[0].get('content', {}).get('parts', [])
+        return TextResponse(''.join(part.get('text', '') for part in parts))
@@ -0,0 +1,216 @@
+# ingredient_index.py
+"""
+Allergen inference from ingredient text, for rows whose allergensraw is
+"EMPTY" although the ingredients plainly name wheat flour, milk powder or
+soy lecithin.
+
+The index maps normalized ingredient terms and n-grams ("whey",
+"soy lecithin", "semolina") to the 9 standard categories. It starts from
+the allergen_taxonomy synonyms and adds ingredient-only terms, plus
+phrases that name no allergen but contain one ("cocoa butter",
+"coconut milk", "gluten free"). All terms are compiled into one
+prefix-sharing regex (allergen_matcher.phrase_regex) whose matches
+consume the longest phrase, so "cocoa butter" hides its "butter".
+
+A whole column is scanned at once: the values are joined with a
+separator the regex also reports, findall runs over the joined string,
+and the row of each match is the running count of separators before it.
+Distinct matched strings are resolved to category bits once, and the rows
+are OR-ed together with numpy, so the cost grows linearly with the text
+and no model is called.
+
+    python ingredient_index.py --input foodpreprocessed.txt --output foodinferred.txt
+
+numpy and pandas are imported on first use.
+"""
+import argparse
+import re
+import time
+
+from allergen_matcher import STANDARD_CATEGORIES, PLURAL_SUFFIX, phrase_regex, normalize_phrase
+from allergen_taxonomy import SYNONYMS, CATEGORY_BITS, singular_forms
+from table_io import read_header, iter_table, TableWriter, DEFAULT_CHUNK_ROWS
+
+# --- CONFIGURATION ---
+INPUT_FILE = 'foodpreprocessed.txt'
+OUTPUT_FILE = 'foodinferred.txt'
+TEXT_COLUMN = 'ingredients'
+INFERRED_COLUMN = 'allergensinferred'
+
+# Ingredient names that are not allergen labels, so the taxonomy lacks them
+INGREDIENT_TERMS = {
+    "milk": ["milk powder", "milk chocolate", "skim milk", "condensed milk", "lactalbumin",
+             "mascarpone", "mozzarella", "parmesan", "cheddar", "ricotta", "kefir", "paneer",
+             "custard", "ice cream"],
+    "egg": ["mayonnaise", "meringue", "egg noodle"],
+    "peanut": ["monkey nut"],
+    "tree nut": ["chestnut", "praline", "marzipan", "nut oil", "almond flour", "walnut oil"],
+    # Only flours that are wheat: oat, rice, pea, cassava... flour are not
+    "wheat": ["white flour", "plain flour", "bread flour", "self raising flour", "self rising flour",
+              "enriched flour", "durum flour", "malt", "malt extract", "barley malt", "breadcrumb", "seitan",
+              "graham", "wheat starch", "rye flour", "spelt flour", "oat gluten"],
+    "soy": ["lecithin soy", "soya flour", "soy flour", "soybean oil", "bean curd", "natto"],
+    "fish": ["fish gelatin", "fish gelatine", "bonito", "surimi"],
+    "shellfish": ["shrimp paste", "oyster sauce", "crab stick"],
+    "sesame": ["sesame paste", "gomasio"],
+}
+
+# Phrases that contain an allergen word without naming the allergen.
+# They map to no category and, being longer, win over the word inside.
+NEUTRAL_TERMS = [
+    "cocoa butter", "shea butter", "mango butter", "butter bean", "coconut milk", "coconut cream",
+    "cream of tartar", "oat milk", "rice milk", "water chestnut", "nutmeg", "rice flour",
+    "corn flour", "maize flour", "potato flour", "chickpea flour", "gram flour", "tapioca flour",
+    "coconut flour", "buckwheat flour", "gluten free", "milk free", "dairy free", "egg free",
+    "nut free", "peanut free", "soy free", "wheat free", "sunflower lecithin", "rapeseed lecithin",
+]
+
+_SEPARATOR = '\x1f'                      # Joins a column; never part of a term
+_WORD_GAP = r'(?:[^\w\x1f]|_)+'          # Like WORD_GAP, but never across rows
+
+
+def build_term_index():
+    """{normalized term: category} ("" for neutral phrases)"""
+    index = {term: category for term, category in SYNONYMS.items() if category}
+    for category, terms in INGREDIENT_TERMS.items():
+        for term in terms:
+            index[term] = category
+    for term in NEUTRAL_TERMS:
+        index[term] = ""
+    normalized = ((normalize_phrase(term), category) for term, category in index.items())
+    return {term: category for term, category in normalized if term}
+
+
+class IngredientIndex:
+    """
+    Compiled term -> category index. infer_masks scans a column into 9-bit
+    masks (bit i = STANDARD_CATEGORIES[i]); infer_column formats them.
+    """
+    def __init__(self, terms=None):
+        self.terms = build_term_index() if terms is None else dict(terms)
+        self._match_bits = {_SEPARATOR: 0}
+        # The separator is an alternative of its own, so findall reports every row boundary
+        self._regex = re.compile(
+            _SEPARATOR + r'|(?<![^\W_])(?:' + phrase_regex(self.terms, _WORD_GAP) + ')'
+            + PLURAL_SUFFIX + r'(?![^\W_])'
+        )
+        self._labels = [', '.join(c for i, c in enumerate(STANDARD_CATEGORIES) if mask >> i & 1)
+                        for mask in range(1 << len(STANDARD_CATEGORIES))]
+
+    def term_bits(self, match):
+        """Category bit of one matched string ("Eggs", "soy  lecithin"), 0 for neutral ones"""
+        bits = self._match_bits.get(match)
+        if bits is None:
+            bits = 0
+            for form in singular_forms(normalize_phrase(match)):
+                if form in self.terms:
+                    bits = CATEGORY_BITS.get(self.terms[form], 0)
+                    break
+            self._match_bits[match] = bits
+        return bits
+
+    def infer_masks(self, texts):
+        """numpy uint16 array with the category mask of every text"""
+        import numpy as np
+        import pandas as pd
+
+        values = [str(t).replace(_SEPARATOR, ' ') if t else '' for t in texts]
+        masks = np.zeros(len(values), dtype=np.uint16)
+        if not values:
+            return masks
+
+        found = np.array(self._regex.findall(_SEPARATOR.join(values).lower()), dtype=object)
+        if not len(found):
+            return masks
+        is_separator = found == _SEPARATOR
+        rows = np.cumsum(is_separator)[~is_separator]
+        terms = found[~is_separator]
+
+        # Few distinct strings match, so each is resolved once
+        codes, distinct = pd.factorize(terms)
+        bits = np.fromiter((self.term_bits(t) for t in distinct), dtype=np.uint16, count=len(distinct))
+        np.bitwise_or.at(masks, rows, bits[codes])
+        return masks
+
+    def format_masks(self, masks):
+        """Masks -> "milk, wheat" style strings in the standard order"""
+        labels = self._labels
+        return [labels[m] for m in masks.tolist()]
+
+    def infer_column(self, texts):
+        """Inferred categories of every text, as allergensmapped-style strings"""
+        return self.format_masks(self.infer_masks(texts))
+
+
+_default_index = None
+
+
+def get_index():
+    """Shared index with the built-in terms, compiled on first use"""
+    global _default_index
+    if _default_index is None:
+        _default_index = IngredientIndex()
+    return _default_index
+
+
+def infer_frame(df, text_column=TEXT_COLUMN, output_column=INFERRED_COLUMN):
+    """Adds the inferred-allergen column to a DataFrame (blank if it has no text column)"""
+    if text_column in df.columns:
+        df[output_column] = get_index().infer_column(df[text_column].tolist())
+    else:
+        df[output_column] = ""
+    return df
+
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Infer allergen categories from the ingredient text")
+    parser.add_argument('--input', default=INPUT_FILE,
+                        help="Table to read (.txt/.csv, .parquet, .arrow or .xlsx)")
+    parser.add_argument('--output', default=OUTPUT_FILE,
+                        help="Table to write, the input columns plus " + INFERRED_COLUMN)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Rows processed per chunk")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("=" * 60)
+    print("  INGREDIENT ALLERGEN INFERENCE")
+    print("=" * 60)
+
+    try:
+        print(f"📂 Reading file: {args.input}...")
+        columns = read_header(args.input)
+    except Exception as e:
+        print(f"❌ Error reading file: {e}")
+        return
+    if TEXT_COLUMN not in columns:
+        print(f"❌ No '{TEXT_COLUMN}' column in {args.input}")
+        return
+
+    try:
+        start = time.perf_counter()
+        empty_rows = filled_rows = 0
+        with TableWriter(args.output) as writer:
+            for chunk in iter_table(args.input, args.chunk_size):
+                chunk = infer_frame(chunk)
+                if 'allergensraw' in chunk.columns:
+                    empty = chunk['allergensraw'].str.strip().str.lower().isin(['', 'empty'])
+                    empty_rows += int(empty.sum())
+                    filled_rows += int((empty & (chunk[INFERRED_COLUMN] != '')).sum())
+                writer.write(chunk)
+                print(f"   Processed {writer.rows} rows...", end="\r")
+        elapsed = time.perf_counter() - start
+
+        print(f"\n✅ Success! Saved {writer.rows} rows to {args.output} in {elapsed:.2f}s")
+        if empty_rows:
+            print(f"   {filled_rows:,} of {empty_rows:,} rows with EMPTY allergensraw got inferred allergens")
+    except Exception as e:
+        print(f"❌ Error saving file: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# mapping_cache.py
+"""
+Persistent cache of allergen mapping results for activity03_mapping.
+
+Keys are normalized allergensraw values (see mapping_key), stored in SQLite
+with a last-used timestamp so the cache can be capped with LRU eviction.
+The whole cache is tied to a version string built from the prompt and the
+category/synonym tables: change any of them and old answers are dropped.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+from allergen_taxonomy import normalize_term
+
+
+def mapping_key(value):
+    """
+    Cache key for one allergensraw value: normalized, de-duplicated and sorted
+    comma tokens, so "Eggs, milk" and "milk, eggs" share one entry.
+    Empty / "empty" / NaN values give "".
+    """
+    if value is None or value != value:  # None or NaN
+        return ""
+    text = str(value).strip()
+    if not text or text.lower() == "empty":
+        return ""
+    tokens = {normalize_term(t) for t in text.split(',')}
+    tokens.discard("")
+    return ', '.join(sorted(tokens))
+
+
+def cache_version(*parts):
+    """Short hash of everything that influences a mapping result"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class MappingCache:
+    """
+    SQLite key -> mapped value store with a size cap and LRU eviction.
+    With shared=True it may be used from several threads; callers then
+    serialize access themselves (mapping_service.py holds a lock).
+    """
+    def __init__(self, path, version, max_entries=100000, shared=False):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=not shared)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS mappings "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS mappings_last_used ON mappings (last_used)")
+
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row is None or row[0] != version:
+            # Prompt or category list changed: old answers no longer apply
+            self.conn.execute("DELETE FROM mappings")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Returns {key: value} for the cached keys and marks them as recently used"""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):  # Stay under SQLite's variable limit
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, value FROM mappings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            found.update(rows)
+
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE mappings SET last_used = ? WHERE key = ?",
+                                  [(now, k) for k in found])
+            self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, mapping):
+        """Stores {key: value} and evicts the least recently used entries over the cap"""
+        if not mapping:
+            return
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO mappings VALUES (?, ?, ?)",
+                              [(k, v, now) for k, v in mapping.items()])
+        self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        """Drops the oldest entries beyond max_entries"""
+        count = self.conn.execute("SELECT COUNT(*) FROM mappings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM mappings WHERE key IN "
+                "(SELECT key FROM mappings ORDER BY last_used ASC LIMIT ?)", (excess,)
+            )
+
+    def close(self):
+        self.conn.close()
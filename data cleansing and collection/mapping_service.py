@@ -0,0 +1,366 @@
+# mapping_service.py
+"""
+Long-running allergen mapping service on localhost, for callers that map
+single items as they arrive (ingestion jobs, the app's backend) instead of
+running activity03_mapping over a whole table.
+
+    python mapping_service.py --port 8770 --max-batch-size 20 --max-wait-ms 25
+
+    POST /map   {"allergens": "Milk, hazelnuts"}
+             -> {"allergens": "Milk, hazelnuts", "allergensmapped": "milk, tree nut", "resolved": true}
+    POST /map   {"items": ["milk", "cashew"]}  -> {"allergensmapped": [...], "resolved": [...]}
+    GET  /stats    request latency p50/p90/p99, batches, batch fill rate
+    GET  /metrics  the same in Prometheus text format
+    GET  /health
+
+Values go through the same path as the batch mapper: mapping_key, the
+SQLite mapping cache (fronted by an in-memory copy of the answers this
+process has seen, so a hot value never waits on SQLite), the local
+taxonomy, then the model for unknown tokens. Cache hits and values the taxonomy fully knows are answered
+straight away. The rest are queued and coalesced into micro-batches: a batch
+is sent when it holds --max-batch-size values or --max-wait-ms after its
+oldest value arrived, whichever comes first, with up to --concurrency
+batches in flight. Concurrent requests for the same value share one slot.
+Unresolved answers (model failed) are returned with "resolved": false and
+not cached.
+"""
+import argparse
+import json
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import activity03_mapping as mapping
+from allergen_taxonomy import map_allergen_text, format_categories
+from mapping_cache import MappingCache, mapping_key
+from metrics import METRICS
+
+# --- CONFIGURATION ---
+SERVICE_PORT = 8770
+MAX_BATCH_SIZE = mapping.BATCH_SIZE                 # Values per model batch
+MAX_WAIT_MS = 25                                    # Longest a value waits for its batch to fill
+MAX_CONCURRENT_BATCHES = mapping.MAX_CONCURRENT_BATCHES
+LATENCY_WINDOW = 10000                              # Recent requests kept for the percentiles
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (None if empty)"""
+    if not sorted_values:
+        return None
+    rank = max(1, round(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads into batches for
+    run_batch(items) -> results (aligned with items). Each submit returns
+    a Future. One collector thread builds the batches; a pool runs them.
+    When every slot is busy the collector waits, and items keep queueing,
+    so batches fill up under load instead of piling up in flight.
+    """
+    def __init__(self, run_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 concurrency=MAX_CONCURRENT_BATCHES, on_batch=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.on_batch = on_batch
+        self.queue = queue.Queue()
+        self.slots = threading.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.thread = threading.Thread(target=self._collect, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((time.perf_counter(), item, future))
+        return future
+
+    def _collect(self):
+        stopping = False
+        while not stopping:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = entry[0] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    entry = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True  # Send what was collected, then stop
+                    break
+                batch.append(entry)
+            self.slots.acquire()
+            self.executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            items = [item for _, item, _ in batch]
+            try:
+                results = self.run_batch(items)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                return
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            if self.on_batch:
+                self.on_batch(len(batch), time.perf_counter() - batch[0][0])
+        finally:
+            self.slots.release()
+
+    def close(self):
+        """Sends the queued items, waits for running batches and stops"""
+        self.queue.put(None)
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+
+
+class MappingService:
+    """Cache lookups, request coalescing and micro-batched model mapping"""
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 concurrency=MAX_CONCURRENT_BATCHES, cache_file=mapping.CACHE_FILE):
+        self.cache = MappingCache(cache_file, mapping.CACHE_VERSION, mapping.CACHE_MAX_ENTRIES, shared=True)
+        self.cache_lock = threading.Lock()
+        self.answers = {}   # key -> mapped value already read from or written to the cache
+        self.inflight = {}  # key -> Future shared by concurrent requests for it
+        self.inflight_lock = threading.Lock()
+        self.batcher = MicroBatcher(self._map_batch, max_batch_size, max_wait_ms, concurrency,
+                                    on_batch=self._count_batch)
+
+        # Statistics for /stats
+        self.stats_lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+        self.requests = 0
+        self.sources = {'empty': 0, 'cache': 0, 'local': 0, 'coalesced': 0, 'batched': 0}
+        self.batches = 0
+        self.batched_items = 0
+        self.batch_latencies = deque(maxlen=LATENCY_WINDOW)  # Oldest item's arrival to batch done
+
+    def _map_batch(self, keys):
+        results, resolved = mapping.map_allergens_batch_detailed(keys)
+        finished = {k: r for k, r, ok in zip(keys, results, resolved) if ok}
+        if finished:
+            with self.cache_lock:
+                self.cache.put_many(finished)
+            self._remember(finished)
+        return list(zip(results, resolved))
+
+    def _remember(self, answers):
+        if len(self.answers) + len(answers) > mapping.CACHE_MAX_ENTRIES:
+            self.answers.clear()  # Same cap as the cache; it refills from SQLite
+        self.answers.update(answers)
+
+    def _count_batch(self, size, latency):
+        with self.stats_lock:
+            self.batches += 1
+            self.batched_items += size
+            self.batch_latencies.append(latency)
+        METRICS.inc('service_batches')
+        METRICS.inc('service_batched_items', size)
+
+    def _lookup(self, key):
+        """(future, source) for one normalized value"""
+        if key == "":
+            future = Future()
+            future.set_result(("", True))
+            return future, 'empty'
+        answer = self.answers.get(key)
+        if answer is None:
+            with self.cache_lock:
+                answer = self.cache.get_many([key]).get(key)
+            if answer is not None:
+                self._remember({key: answer})
+        if answer is not None:
+            future = Future()
+            future.set_result((answer, True))
+            return future, 'cache'
+        categories, unknown = map_allergen_text(key)
+        if not unknown:
+            future = Future()
+            future.set_result((format_categories(categories), True))
+            return future, 'local'
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                return future, 'coalesced'
+            future = self.batcher.submit(key)
+            self.inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key))
+        return future, 'batched'
+
+    def _forget(self, key):
+        with self.inflight_lock:
+            self.inflight.pop(key, None)
+
+    def map_values(self, values):
+        """[(mapped, resolved)] for raw allergen values; blocks until all are answered"""
+        started = time.perf_counter()
+        lookups = [self._lookup(mapping_key(v)) for v in values]
+        results = [future.result() for future, _ in lookups]
+        latency = time.perf_counter() - started
+        with self.stats_lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            for _, source in lookups:
+                self.sources[source] += 1
+        source = lookups[0][1] if len(lookups) == 1 else 'multi'
+        METRICS.observe('service_request', latency, source=source)
+        return results
+
+    def stats(self):
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            batch_latencies = sorted(self.batch_latencies)
+            mean_batch = self.batched_items / self.batches if self.batches else None
+            return {
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'requests': self.requests,
+                'values_by_source': dict(self.sources),
+                'latency_ms': {f"p{q}": round(percentile(latencies, q) * 1000, 2) if latencies else None
+                               for q in (50, 90, 99)},
+                'batches': self.batches,
+                'mean_batch_size': round(mean_batch, 2) if mean_batch else None,
+                'batch_fill_rate': round(mean_batch / self.batcher.max_batch_size, 3) if mean_batch else None,
+                'batch_latency_ms_p50': round(percentile(batch_latencies, 50) * 1000, 2) if batch_latencies else None,
+                'max_batch_size': self.batcher.max_batch_size,
+                'max_wait_ms': round(self.batcher.max_wait * 1000, 1),
+                'model_calls': mapping.MAPPING_STATS['model_calls'],
+            }
+
+    def close(self):
+        self.batcher.close()
+        with self.cache_lock:
+            self.cache.close()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, payload, content_type='application/json'):
+        body = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/stats':
+            self._send(200, service.stats())
+        elif self.path == '/metrics':
+            self._send(200, METRICS.to_prometheus('mapping_service'), 'text/plain; version=0.0.4')
+        elif self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/map':
+            self._send(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            if 'items' in body:
+                values = body['items']
+                if not isinstance(values, list):
+                    raise ValueError("'items' must be a list")
+            elif 'allergens' in body:
+                values = [body['allergens']]
+            else:
+                raise ValueError("expected 'allergens' or 'items'")
+        except (ValueError, AttributeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        try:
+            results = self.server.service.map_values(values)
+        except Exception as e:
+            self._send(502, {'error': f"mapping failed: {e}"})
+            return
+        if 'items' in body:
+            self._send(200, {'allergensmapped': [r for r, _ in results], 'resolved': [ok for _, ok in results]})
+        else:
+            mapped, resolved = results[0]
+            self._send(200, {'allergens': body['allergens'], 'allergensmapped': mapped, 'resolved': resolved})
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the console
+
+
+class MappingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Localhost HTTP service mapping allergens with micro-batching")
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help="Port to listen on (127.0.0.1)")
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE,
+                        help="Values per model batch")
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help="Longest a value waits for its batch to fill before it is sent")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENT_BATCHES,
+                        help="Batches in flight at once")
+    parser.add_argument('--model-url',
+                        help="Gemini REST endpoint to call instead of the SDK, e.g. a local stand-in server")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Write the service metrics as JSON on shutdown")
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help="Write the same metrics in Prometheus text format on shutdown")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.model_url:
+        mapping.MODEL_URL = args.model_url
+    METRICS.enable()  # Served on /metrics
+
+    service = MappingService(args.max_batch_size, args.max_wait_ms, args.concurrency)
+    server = MappingServer(('127.0.0.1', args.port), service)
+    print("=" * 60)
+    print("  ALLERGEN MAPPING SERVICE")
+    print("=" * 60)
+    print(f"🚀 Listening on {server.base_url} (batches of up to {args.max_batch_size}, "
+          f"max wait {args.max_wait_ms:g} ms, {args.concurrency} in flight)")
+    print(f"   👉 curl -d '{{\"allergens\": \"milk, cashew\"}}' {server.base_url}/map")
+    # Stop cleanly on kill / service manager stop, like on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        stats = service.stats()
+        print(f"\n📊 {stats['requests']} requests | latency p50 {stats['latency_ms']['p50']} ms, "
+              f"p99 {stats['latency_ms']['p99']} ms | {stats['batches']} batches, "
+              f"fill rate {stats['batch_fill_rate']}")
+        METRICS.write('mapping_service', args.metrics, args.prometheus)
+
+
+if __name__ == "__main__":
+    main()
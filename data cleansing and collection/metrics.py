@@ -0,0 +1,214 @@
+# metrics.py
+"""
+Run metrics for the pipeline scripts: counters, latency histograms and
+per-stage timings, written at the end of a run as a JSON summary and/or
+Prometheus text format (e.g. for node_exporter's textfile collector).
+
+Collection is off by default. Every call first checks METRICS.enabled,
+so a run without --metrics / --prometheus only pays for that check;
+code on hot paths checks it once per batch rather than per item.
+"""
+import json
+import threading
+import time
+
+PREFIX = 'allergen_pipeline_'
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram of observed durations"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'buckets': {str(b): c for b, c in zip(list(self.buckets) + ['+Inf'], self.counts)},
+        }
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics, kind, name, labels):
+        self.metrics = metrics
+        self.kind = kind
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if self.kind == 'stage':
+            self.metrics.add_stage(self.name, elapsed)
+        else:
+            self.metrics.observe(self.name, elapsed, **self.labels)
+        return False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """
+    counters:   name -> {labels: value}
+    histograms: name -> {labels: Histogram}
+    stages:     stage name -> seconds (summed if a stage runs twice)
+    Safe to update from worker threads.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.histograms = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def inc_many(self, name, counts, label):
+        """Adds a {label_value: count} tally, e.g. rejections counted in a worker process"""
+        if not self.enabled:
+            return
+        for value, count in counts.items():
+            self.inc(name, count, **{label: value})
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    def timer(self, name, **labels):
+        """Context manager observing its duration into a histogram"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, 'histogram', name, labels)
+
+    def stage(self, name):
+        """Context manager adding its duration to a stage timing"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, 'stage', name, None)
+
+    def add_stage(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def summary(self, script):
+        """JSON-ready snapshot of everything recorded"""
+        def series_list(series, value):
+            return [dict(labels=dict(key), **value(v)) for key, v in series.items()]
+
+        with self._lock:
+            return {
+                'script': script,
+                'generated_at': time.time(),
+                'stages_seconds': {name: round(s, 6) for name, s in self.stages.items()},
+                'counters': {name: series_list(series, lambda v: {'value': v})
+                             for name, series in sorted(self.counters.items())},
+                'histograms': {name: series_list(series, Histogram.summary)
+                               for name, series in sorted(self.histograms.items())},
+            }
+
+    def to_prometheus(self, script):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def labels_text(pairs):
+            pairs = [('script', script)] + list(pairs)
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+        with self._lock:
+            name = PREFIX + 'stage_seconds'
+            lines.append(f"# TYPE {name} gauge")
+            for stage, seconds in self.stages.items():
+                lines.append(f"{name}{labels_text([('stage', stage)])} {seconds:.6f}")
+
+            for counter, series in sorted(self.counters.items()):
+                name = PREFIX + counter + '_total'
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{labels_text(key)} {value}")
+
+            for histogram, series in sorted(self.histograms.items()):
+                name = PREFIX + histogram + '_seconds'
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(list(h.buckets) + ['+Inf'], h.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{labels_text(list(key) + [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{labels_text(key)} {h.sum:.6f}")
+                    lines.append(f"{name}_count{labels_text(key)} {h.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, script, json_path=None, prometheus_path=None):
+        """Writes the requested outputs; errors are printed, never raised"""
+        for path, render in ((json_path, lambda: json.dumps(self.summary(script), indent=2)),
+                             (prometheus_path, lambda: self.to_prometheus(script))):
+            if not path:
+                continue
+            try:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(render())
+                print(f"📊 Metrics written to {path}")
+            except OSError as e:
+                print(f"⚠️ Could not write metrics to {path}: {e}")
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Shared by every module of a run
+METRICS = Metrics()
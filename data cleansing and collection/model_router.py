@@ -0,0 +1,116 @@
+# model_router.py
+"""
+Quota-aware router over several Gemini models for activity03_mapping.
+
+Every model in the priority list keeps its own health and quota state:
+- a quota error puts the model in cool-down (doubling on repeat, capped),
+  and the next request fails over to another model straight away;
+- other errors lower its health score, which recovers with time;
+- when a cool-down expires the model is tried again with real traffic, and
+  a success resets it.
+Each request goes to the healthiest available model, ties broken by priority.
+"""
+import math
+import threading
+import time
+
+
+class ModelState:
+    """Health and quota bookkeeping for one model"""
+    def __init__(self, name, priority):
+        self.name = name
+        self.priority = priority
+        self.model = None              # Created on first use
+        self.health = 1.0              # Success EWMA, 1.0 = healthy
+        self.last_failure = 0.0
+        self.cooldown = 0.0            # Current cool-down length (seconds)
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.successes = 0
+        self.quota_errors = 0
+        self.errors = 0
+        self.latency = None            # EWMA of successful call latency (seconds)
+
+
+class ModelRouter:
+    """
+    Picks a model per request and learns from the outcome.
+    """
+    def __init__(self, model_names, factory, cooldown=60.0, max_cooldown=900.0,
+                 heal_time=120.0, smoothing=0.3):
+        self.states = [ModelState(name, i) for i, name in enumerate(model_names)]
+        self.factory = factory
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.heal_time = heal_time
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def _current_health(self, state, now):
+        # Past failures fade out, so a model that had a bad minute gets traffic again
+        if state.health >= 1.0:
+            return 1.0
+        fade = math.exp(-(now - state.last_failure) / self.heal_time)
+        return 1.0 - (1.0 - state.health) * fade
+
+    def acquire(self, exclude=()):
+        """
+        The healthiest model not in cool-down and not named in `exclude`,
+        or None if all of those are cooling down
+        """
+        with self._lock:
+            now = time.monotonic()
+            available = [s for s in self.states if now >= s.cooldown_until and s.name not in exclude]
+            if not available:
+                return None
+            state = max(available, key=lambda s: (round(self._current_health(s, now), 2), -s.priority))
+            if state.model is None:
+                state.model = self.factory(state.name)
+            state.calls += 1
+            return state
+
+    def seconds_until_available(self, exclude=()):
+        """
+        Wait until the first cool-down of a model not named in `exclude` ends
+        (0 if one is free, None if there are no such models)
+        """
+        with self._lock:
+            states = [s for s in self.states if s.name not in exclude]
+            if not states:
+                return None
+            now = time.monotonic()
+            return max(0.0, min(s.cooldown_until for s in states) - now)
+
+    def report_success(self, state, latency):
+        with self._lock:
+            state.successes += 1
+            state.health = min(1.0, state.health + self.smoothing * (1.0 - state.health))
+            state.cooldown = 0.0  # Recovered from any earlier quota lockout
+            if state.latency is None:
+                state.latency = latency
+            else:
+                state.latency += self.smoothing * (latency - state.latency)
+
+    def report_quota(self, state, retry_after=None):
+        """Quota exhausted: cool the model down and let traffic fail over"""
+        with self._lock:
+            state.quota_errors += 1
+            state.cooldown = min(self.max_cooldown, state.cooldown * 2 or self.base_cooldown)
+            wait = retry_after if retry_after is not None else state.cooldown
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + wait)
+
+    def report_error(self, state):
+        with self._lock:
+            now = time.monotonic()
+            state.errors += 1
+            state.health = self._current_health(state, now) * (1.0 - self.smoothing)
+            state.last_failure = now
+
+    def summary(self):
+        """One line per model for the end-of-run report"""
+        lines = []
+        for s in self.states:
+            latency = f"{s.latency:.2f}s" if s.latency is not None else "-"
+            lines.append(f"{s.name}: {s.calls} calls, {s.successes} ok, "
+                         f"{s.quota_errors} quota, {s.errors} errors, avg latency {latency}")
+        return lines
@@ -0,0 +1,137 @@
+# near_duplicates.py
+"""
+Incremental near-duplicate index for the collector (MinHash + LSH).
+
+Open Food Facts lists many products more than once: the same item under
+several barcodes, or with small name variants ("Crunchy Peanut Butter" /
+"Crunchy peanut butter"). Barcode dedup can't see those, so each copy
+takes a quota slot. Here every kept product is reduced to its set of
+normalized name + ingredient words, summarized by a MinHash signature and
+filed under LSH bands. A new candidate is compared only against products
+sharing at least one band bucket with it, so a check costs about the same
+at 100 or 100k products instead of growing with every pairwise comparison.
+
+The band layout is picked from the threshold so that pairs above it almost
+always collide and pairs well below it rarely do.
+
+numpy is imported on first use (it comes with pandas).
+"""
+import hashlib
+import re
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_PERMUTATIONS = 64
+WORD_REGEX = re.compile(r'[a-z]{3,}')
+
+
+def product_words(name, ingredients):
+    """Normalized word set: lower-case a-z words of 3+ letters, naive plural stripped"""
+    words = set()
+    for word in WORD_REGEX.findall(f"{name} {ingredients}".lower()):
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+def _collision_probability(similarity, bands, rows):
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def choose_bands(threshold, num_perm, steps=100):
+    """
+    (bands, rows) with bands * rows <= num_perm minimizing the chance of
+    missed pairs above the threshold plus false candidates below it
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        below = sum(_collision_probability(threshold * i / steps, bands, rows) for i in range(steps)) / steps
+        above = sum(1 - _collision_probability(threshold + (1 - threshold) * i / steps, bands, rows)
+                    for i in range(steps)) / steps
+        error = below * threshold + above * (1 - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """
+    find(name, ingredients) -> key of a stored near-duplicate or None;
+    add(key, name, ingredients) files a product. Both look at O(bands)
+    buckets; the candidates found there are checked in one vectorized
+    signature comparison (the fraction of equal MinHash values estimates
+    the Jaccard similarity of the word sets).
+    """
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_PERMUTATIONS, seed=1):
+        import numpy as np
+        self.np = np
+        self.threshold = threshold
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        self.num_perm = self.bands * self.rows
+        # Multiply-shift hashing: (a * h + b) mod 2**64 with odd a, keeping the high 32 bits
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 64, size=self.num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 64, size=self.num_perm, dtype=np.uint64)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.keys = []
+        self.signatures = np.empty((1024, self.num_perm), dtype=np.uint64)
+        self.checks = 0
+        self.comparisons = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def signature(self, name, ingredients):
+        """MinHash signature of the product's word set"""
+        np = self.np
+        words = product_words(name, ingredients)
+        if not words:
+            return np.full(self.num_perm, 1 << 32, dtype=np.uint64)
+        hashes = np.fromiter((int.from_bytes(hashlib.blake2b(w.encode('utf-8'), digest_size=8).digest(), 'little')
+                              for w in words), dtype=np.uint64, count=len(words))
+        return ((np.outer(hashes, self.a) + self.b) >> np.uint64(32)).min(axis=0)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _find(self, signature, band_keys):
+        self.checks += 1
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, band_keys):
+            candidates.update(bucket.get(band_key, ()))
+        if not candidates:
+            return None
+        self.comparisons += len(candidates)
+        rows = self.np.fromiter(candidates, dtype=self.np.int64, count=len(candidates))
+        similarity = (self.signatures[rows] == signature).mean(axis=1)
+        best = int(similarity.argmax())
+        if similarity[best] >= self.threshold:
+            return self.keys[rows[best]]
+        return None
+
+    def _add(self, key, signature, band_keys):
+        row = len(self.keys)
+        if row == len(self.signatures):
+            self.signatures = self.np.concatenate([self.signatures, self.np.empty_like(self.signatures)])
+        self.signatures[row] = signature
+        self.keys.append(key)
+        for bucket, band_key in zip(self.buckets, band_keys):
+            bucket.setdefault(band_key, []).append(row)
+
+    def find(self, name, ingredients):
+        signature = self.signature(name, ingredients)
+        return self._find(signature, self._band_keys(signature))
+
+    def add(self, key, name, ingredients):
+        signature = self.signature(name, ingredients)
+        self._add(key, signature, self._band_keys(signature))
+
+    def check_and_add(self, key, name, ingredients):
+        """Files the product unless it is a near-duplicate; returns the duplicate's key or None"""
+        signature = self.signature(name, ingredients)
+        band_keys = self._band_keys(signature)
+        duplicate = self._find(signature, band_keys)
+        if duplicate is None:
+            self._add(key, signature, band_keys)
+        return duplicate
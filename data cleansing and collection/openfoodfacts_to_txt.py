@@ -4,6 +4,25 @@ import time
 import re
 import unicodedata
 import random
+import argparse
+import asyncio
+import functools
+import email.utils
+import os
+import gzip
+import json
+import csv
+import itertools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import text_engine
+from product_store import ProductStore, content_hash
+from product_record import ProductRecord
+from checkpoint import CheckpointJournal
+from allergen_matcher import build_keyword_matcher
+from metrics import METRICS
+from near_duplicates import NearDuplicateIndex
 
 # --- CONFIGURATION ---
 OUTPUT_FILE = 'foodraw.txt'
@@ -11,6 +30,35 @@ TARGET_ALLERGENS = 150
 TARGET_NO_ALLERGENS = 50
 API_URL = "https://world.openfoodfacts.org/cgi/search.pl"
 MAX_ITEMS_PER_KEYWORD = 20  
+PAGE_SIZE = 50              # Max results per search page
+MAX_PAGES_PER_TERM = 10     # Stop paging a term after this many pages
+PAGE_DELAY = 1.5            # Seconds between page requests for one term
+
+# Async collection mode (python openfoodfacts_to_txt.py --async)
+ASYNC_CONCURRENCY = 8       # Search requests kept in flight at once
+RATE_LIMIT_PER_SEC = 0.5    # Token bucket refill rate (requests per second)
+RATE_LIMIT_BURST = 4        # Token bucket capacity
+
+# Offline dump mode (python openfoodfacts_to_txt.py --dump products.jsonl.gz)
+DUMP_CHUNK_SIZE = 2000                  # Records validated per worker task
+DUMP_WORKERS = os.cpu_count() or 1      # Validation processes
+DUMP_PROGRESS_EVERY = 100000            # Records between progress lines
+
+# Restart safety (python openfoodfacts_to_txt.py --resume)
+CHECKPOINT_FILE = 'collector_journal.jsonl'  # Append-only log of collected products
+CHECKPOINT_SYNC_EVERY = 50   # Journal records between fsyncs (plus one per finished term)
+
+# Incremental refresh (python openfoodfacts_to_txt.py --incremental)
+PRODUCT_STORE_FILE = 'product_store.sqlite'  # Kept products with their hashes and modification times
+REFRESH_OVERLAP = 60 * 60                   # Seconds re-checked before the last refresh (clock skew)
+
+# Near-duplicate filter: same product under another barcode or a slightly different name
+NEAR_DUP_THRESHOLD = 0.8     # Word-set Jaccard similarity counted as a duplicate (0 = off)
+NEAR_DUP_PERMUTATIONS = 64   # MinHash signature length
+
+# Raw fields a product row is built from; a change in any of them means re-cleaning
+CONTENT_FIELDS = ('product_name_en', 'product_name', 'ingredients_text_en', 'ingredients_text',
+                  'allergens_tags', 'allergens_from_ingredients', 'allergens')
 
 # Allergen keywords (these are what we're looking for)
 TARGET_ALLERGEN_KEYWORDS = [
@@ -25,6 +73,52 @@ TARGET_ALLERGEN_KEYWORDS = [
     "sesame"
 ]
 
+# Search terms - broad categories
+ALLERGEN_SEARCH_TERMS = [
+    "milk", "cheese", "yogurt", "butter", "cream",
+    "egg", "mayonnaise", "omelette",
+    "peanut", "peanut butter",
+    "nuts", "almond", "cashew", "hazelnut", "walnut",
+    "bread", "pasta", "cereal", "wheat", "flour",
+    "soy", "tofu", "soy sauce",
+    "fish", "salmon", "tuna", "sardines",
+    "shrimp", "crab", "lobster", "shellfish",
+    "sesame", "sesame oil", "tahini"
+]
+
+SAFE_SEARCH_TERMS = [
+    "rice", "basmati rice", "brown rice",
+    "salt", "sea salt", "himalayan salt",
+    "sugar", "brown sugar", "cane sugar",
+    "honey", "maple syrup",
+    "olive oil", "coconut oil", "vegetable oil",
+    "tea", "black tea", "green tea", "herbal tea",
+    "coffee", "ground coffee", "coffee beans",
+    "vinegar", "apple cider vinegar", "balsamic vinegar",
+    "fruits", "apple", "banana", "orange", "berries",
+    "vegetables", "carrot", "potato", "tomato", "onion",
+    "water", "sparkling water", "mineral water"
+]
+
+# Fallbacks when the terms above don't reach the targets
+ALLERGEN_FALLBACK_TERMS = [
+    "chocolate", "cookies", "biscuits", "cake", "pastry",
+    "sausage", "bacon", "ham", "deli meat",
+    "sauce", "dressing", "condiment",
+    "snack", "chips", "crackers", "pretzels"
+]
+
+SAFE_FALLBACK_TERMS = [
+    "herbs", "spices", "pepper", "cinnamon", "ginger",
+    "beans", "lentils", "chickpeas",
+    "mushrooms", "garlic", "ginger",
+    "lemon", "lime", "grapefruit"
+]
+
+# Word-boundary matcher over the keywords above ("nut" no longer hits "coconut").
+# Extend at runtime with ALLERGEN_MATCHER.add_keyword(pattern, category).
+ALLERGEN_MATCHER = build_keyword_matcher(TARGET_ALLERGEN_KEYWORDS)
+
 # Allowed characters (strict English alphabet + common food symbols)
 ALLOWED_CHARS_REGEX = r'^[a-zA-Z0-9\s,\-\.%()\[\]/\+&:\'"]+$'
 
@@ -135,9 +229,8 @@ def get_product_allergens(product):
         for text_source in allergen_sources[1:]:
             if text_source and isinstance(text_source, str):
                 # Simple parsing of text allergens
-                text_lower = text_source.lower()
-                for keyword in TARGET_ALLERGEN_KEYWORDS:
-                    if keyword in text_lower and keyword not in english_allergens:
+                for keyword in ALLERGEN_MATCHER.find_keywords(text_source):
+                    if keyword not in english_allergens:
                         english_allergens.append(keyword)
     
     # Deduplicate and sort
@@ -153,149 +246,812 @@ def matches_target_allergens(allergen_text):
     if not allergen_text or allergen_text == "EMPTY":
         return False
     
-    text_lower = allergen_text.lower()
-    return any(keyword in text_lower for keyword in TARGET_ALLERGEN_KEYWORDS)
+    return ALLERGEN_MATCHER.matches(allergen_text)
+
+def parse_retry_after(value, default):
+    """
+    Converts a Retry-After header (seconds or HTTP date) into seconds to wait.
+    Falls back to `default` when the header is missing or unreadable.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
 
 def fetch_with_retry(url, params, retries=3):
     """Retry logic for network requests"""
     for i in range(retries):
+        if i:
+            METRICS.inc('http_retries', mode='sync')
         try:
-            response = requests.get(url, params=params, timeout=25)
+            with METRICS.timer('http_request', mode='sync'):
+                response = requests.get(url, params=params, timeout=25)
+            METRICS.inc('http_responses', mode='sync', status=response.status_code)
             if response.status_code == 200:
                 return response.json()
             elif response.status_code == 429:  # Rate limit
-                wait_time = 30 * (i + 1)  # Exponential backoff
-                print(f"      [!] Rate limited. Waiting {wait_time} seconds...")
+                # Honour the server's Retry-After, otherwise back off linearly
+                wait_time = parse_retry_after(response.headers.get('Retry-After'), 30 * (i + 1))
+                print(f"      [!] Rate limited. Waiting {wait_time:.0f} seconds...")
                 time.sleep(wait_time)
         except requests.RequestException as e:
+            METRICS.inc('http_errors', mode='sync', error=type(e).__name__)
             print(f"      [!] Network error: {e}. Retrying ({i+1}/{retries})...")
             time.sleep(5)
+    METRICS.inc('http_failures', mode='sync')
     return None
 
-def validate_product_data(product):
+class TokenBucket:
     """
-    Comprehensive validation of product data
-    Returns (is_valid, cleaned_data_dict) or (False, None)
+    Asyncio token bucket shared by every in-flight search request.
+    A 429 pauses the whole bucket for the server's Retry-After instead of
+    each request sleeping on its own.
     """
-    # Get all available fields
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = None  # Created on first use so it binds to the running loop
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Waiters queue on the lock, so tokens are handed out in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds` and drops any saved-up burst"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = max(self.updated, self.blocked_until)
+
+class AsyncSearchClient:
+    """
+    Keep-alive connection pool for the async collector.
+    Requests run on a small thread pool so the event loop never blocks.
+    """
+    def __init__(self, concurrency):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def get(self, url, params):
+        loop = asyncio.get_running_loop()
+        request = functools.partial(self.session.get, url, params=params, timeout=25)
+        return await loop.run_in_executor(self.executor, request)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+async def fetch_with_retry_async(client, limiter, url, params, retries=3):
+    """Async counterpart of fetch_with_retry, paced by the shared token bucket"""
+    for i in range(retries):
+        if i:
+            METRICS.inc('http_retries', mode='async')
+        await limiter.acquire()
+        try:
+            with METRICS.timer('http_request', mode='async'):
+                response = await client.get(url, params)
+            METRICS.inc('http_responses', mode='async', status=response.status_code)
+            if response.status_code == 200:
+                return response.json()
+            elif response.status_code == 429:  # Rate limit
+                wait_time = parse_retry_after(response.headers.get('Retry-After'), 30 * (i + 1))
+                print(f"      [!] Rate limited. Pausing all requests for {wait_time:.0f} seconds...")
+                limiter.pause(wait_time)
+        except (requests.RequestException, ValueError) as e:
+            METRICS.inc('http_errors', mode='async', error=type(e).__name__)
+            print(f"      [!] Network error: {e}. Retrying ({i+1}/{retries})...")
+            await asyncio.sleep(5)
+    METRICS.inc('http_failures', mode='async')
+    return None
+
+def product_text_fields(product):
+    """Returns (id, name, ingredients), prioritizing the English fields"""
     product_id = product.get('code')
-    
-    # Try multiple language fields, prioritizing English
     name = product.get('product_name_en') or product.get('product_name') or ""
     ingredients = product.get('ingredients_text_en') or product.get('ingredients_text') or ""
+    return product_id, name, ingredients
+
+def build_product_data(product, product_id, clean_name, clean_ing):
+    """Assembles the cleaned product record written to the output file"""
+    return ProductRecord(product_id, clean_name, clean_ing, get_product_allergens(product))
+
+def validate_product_data(product):
+    """
+    Comprehensive validation of product data
+    Returns (is_valid, ProductRecord) or (False, None)
     
-    # Critical: Must have both name and ingredients
-    if not product_id or not name or not ingredients:
+    Language check, cleaning and ingredient QC run through text_engine,
+    which matches is_english_alphabet_text / clean_text / is_valid_ingredient_text
+    above while making far fewer passes over the text.
+    """
+    product_id, name, ingredients = product_text_fields(product)
+    
+    # Critical: Must have an id (name/ingredients are checked by the engine)
+    if not product_id:
         return False, None
     
-    # Check language - both must be primarily English alphabet
-    if not is_english_alphabet_text(name) or not is_english_alphabet_text(ingredients):
+    cleaned = text_engine.validate_texts(name, ingredients)
+    if cleaned is None:
         return False, None
     
-    # Clean the text
-    clean_name = clean_text(name)
-    clean_ing = clean_text(ingredients)
+    return True, build_product_data(product, product_id, *cleaned)
+
+def validate_products_batch(products, rejections=None):
+    """
+    validate_product_data over a whole search page / dump chunk.
+    Returns a list of (is_valid, ProductRecord) aligned with `products`.
+    If a Counter is given, rejected products are tallied in it by reason.
+    """
+    results = []
+    for product in products:
+        product_id, name, ing = product_text_fields(product)
+        cleaned = text_engine.validate_texts(name, ing) if product_id else None
+        if cleaned is None:
+            results.append((False, None))
+            if rejections is not None:
+                rejections['missing_id' if not product_id else text_engine.rejection_reason(name, ing)] += 1
+        else:
+            results.append((True, build_product_data(product, product_id, *cleaned)))
+    return results
+
+def validate_and_count(products):
+    """validate_products_batch, with rejection reasons recorded when metrics are on"""
+    if not METRICS.enabled:
+        return validate_products_batch(products)
+    rejections = Counter()
+    results = validate_products_batch(products, rejections)
+    METRICS.inc('products_validated', len(products))
+    METRICS.inc_many('products_rejected', rejections, 'reason')
+    return results
+
+def build_search_params(term, page=1, sort_by=None):
+    """Search request parameters for one page of a term"""
+    # Request all potentially relevant fields
+    params = {
+        'search_terms': term,
+        'page': page,
+        'page_size': PAGE_SIZE,
+        'json': 1,
+        'lc': 'en',  # Prefer English
+        'fields': 'code,product_name,product_name_en,ingredients_text,ingredients_text_en,allergens,allergens_tags,allergens_from_ingredients,last_modified_t'
+    }
+    if sort_by:
+        params['sort_by'] = sort_by
+    return params
+
+def has_next_page(items, page):
+    """A short page means the term is exhausted"""
+    return len(items) >= PAGE_SIZE and page < MAX_PAGES_PER_TERM
+
+def iter_validated(items):
+    """Yields cleaned product records for the raw search results that pass validation"""
+    for is_valid, product_data in validate_and_count(items):
+        if is_valid and product_data:
+            yield product_data
+
+def fetch_page(api_url, term, page, delay=0, sort_by=None):
+    """Fetches one results page, optionally waiting first to stay polite to the API"""
+    if delay:
+        time.sleep(delay)
+    return fetch_with_retry(api_url, build_search_params(term, page, sort_by))
+
+def iter_search_products(term, api_url=API_URL, start_page=1, on_page=None):
+    """
+    Lazily yields validated products for a term across result pages, from
+    start_page on; on_page(page) is called before a page's products are
+    yielded. The next page is fetched in the background while the current
+    one is being validated, and closing the generator stops paging.
+    """
+    prefetcher = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = start_page
+        future = prefetcher.submit(fetch_page, api_url, term, page)
+        while future is not None:
+            data = future.result()
+            items = data.get('products', []) if data else []
+            
+            if on_page:
+                on_page(page)
+            future = None
+            if has_next_page(items, page):
+                future = prefetcher.submit(fetch_page, api_url, term, page + 1, PAGE_DELAY)
+                page += 1
+            
+            yield from iter_validated(items)
+    finally:
+        # Consumer stopped early: don't wait for a page nobody will read
+        prefetcher.shutdown(wait=False, cancel_futures=True)
+
+def product_group(require_allergens):
+    return 'allergen' if require_allergens else 'safe'
+
+def term_quota_reached(term_count, require_allergens):
+    """True once a term has given MAX_ITEMS_PER_KEYWORD allergen products"""
+    return require_allergens and term_count >= MAX_ITEMS_PER_KEYWORD
+
+def shuffled_terms(terms):
+    """A shuffled copy of a search term list, for diversity"""
+    terms = list(terms)
+    random.shuffle(terms)
+    return terms
+
+class CollectionCheckpoint:
+    """
+    Collector progress journaled to CHECKPOINT_FILE: every accepted product,
+    the shuffled term order, the result page each term is on, every fully
+    searched term and the dump read position. With --resume the journal is
+    replayed, so collected products, collected_ids and finished terms are
+    restored, the terms are walked in the same order and a term is picked up
+    at the page it was on, giving the products an uninterrupted run would.
+    """
+    def __init__(self, path, resume=False):
+        self.journal = CheckpointJournal(path, resume, sync_every=CHECKPOINT_SYNC_EVERY)
+        self.source = None
+        self.products = {'allergen': [], 'safe': []}
+        self.done_terms = {'allergen': set(), 'safe': set()}
+        self.term_counts = {}
+        self.term_pages = {}
+        self.term_orders = {}
+        self.dump_position = 0
+        
+        for record in self.journal.records:
+            kind = record.get('type')
+            if kind == 'run':
+                self.source = record['source']
+            elif kind == 'product':
+                self.products[record['group']].append(ProductRecord.from_dict(record['product']))
+                key = (record['group'], record.get('term'))
+                self.term_counts[key] = self.term_counts.get(key, 0) + 1
+            elif kind == 'term':
+                self.done_terms[record['group']].add(record['term'])
+            elif kind == 'page':
+                self.term_pages[(record['group'], record['term'])] = record['page']
+            elif kind == 'order':
+                self.term_orders[(record['group'], frozenset(record['terms']))] = record['terms']
+            elif kind == 'dump':
+                self.dump_position = record['records_seen']
     
-    # Verify cleaning didn't remove essential content
-    if len(clean_name) < 3 or len(clean_ing) < 10:
-        return False, None
+    def start(self, source):
+        """Marks which API/dump this journal belongs to"""
+        self.source = source
+        self.journal.append({'type': 'run', 'source': source})
     
-    # Ensure ingredients are valid and complete
-    if not is_valid_ingredient_text(clean_ing):
-        return False, None
+    def collected_ids(self):
+        return {p['id'] for group in self.products.values() for p in group}
     
-    # Get allergens
-    allergens = get_product_allergens(product)
+    def term_order(self, terms, require_allergens):
+        """
+        The terms shuffled, in the order the first run used for this list.
+        The shuffle runs either way, so a seeded run draws the same random
+        numbers whether or not it resumed.
+        """
+        shuffled = shuffled_terms(terms)
+        key = (product_group(require_allergens), frozenset(terms))
+        if key in self.term_orders:
+            return list(self.term_orders[key])
+        self.term_orders[key] = shuffled
+        self.journal.append({'type': 'order', 'group': key[0], 'terms': shuffled})
+        return shuffled
     
-    return True, {
-        'id': product_id,
-        'name': clean_name,
-        'ingredients': clean_ing,
-        'allergens': allergens,
-        'link': f"https://world.openfoodfacts.org/product/{product_id}"
-    }
+    def pending_terms(self, terms, require_allergens):
+        """Search terms not fully searched, and not at their quota, after an earlier run"""
+        done = self.done_terms[product_group(require_allergens)]
+        return [t for t in terms if t not in done
+                and not term_quota_reached(self.term_count(t, require_allergens), require_allergens)]
+    
+    def term_count(self, term, require_allergens):
+        return self.term_counts.get((product_group(require_allergens), term), 0)
+    
+    def term_page(self, term, require_allergens):
+        """Result page to start a term from (the one an earlier run was on)"""
+        return self.term_pages.get((product_group(require_allergens), term), 1)
+    
+    def page_started(self, term, require_allergens, page):
+        """Journals that a term moved on to a later result page"""
+        if page > self.term_page(term, require_allergens):
+            group = product_group(require_allergens)
+            self.term_pages[(group, term)] = page
+            self.journal.append({'type': 'page', 'group': group, 'term': term, 'page': page})
+    
+    def add_product(self, product_data, require_allergens, term=None):
+        self.journal.append({'type': 'product', 'group': product_group(require_allergens),
+                             'term': term, 'product': product_data.to_dict()})
+    
+    def finish_term(self, term, require_allergens):
+        self.journal.append({'type': 'term', 'group': product_group(require_allergens), 'term': term})
+        self.journal.sync()
+    
+    def dump_progress(self, records_seen):
+        self.journal.append({'type': 'dump', 'records_seen': records_seen})
+        self.journal.sync()
+
+def is_near_duplicate(product_data, near_dups):
+    """
+    True if an already collected product has (almost) the same name and
+    ingredient words; otherwise files this one in the index
+    """
+    if near_dups is None:
+        return False
+    duplicate = near_dups.check_and_add(product_data['id'], product_data['name'], product_data['ingredients'])
+    if duplicate is None:
+        return False
+    METRICS.inc('products_rejected', reason='near_duplicate')
+    return True
+
+def consume_term_products(validated, term, products, target_count, require_allergens, collected_ids,
+                          term_count=0, checkpoint=None, near_dups=None):
+    """
+    Deduplicates and filters one term's validated products into `products`.
+    Shared by the sync and async collectors so both keep identical semantics.
+    Returns (term_count, done) where done means the term or the target is finished.
+    """
+    if len(products) >= target_count or term_quota_reached(term_count, require_allergens):
+        return term_count, True
+    
+    for product_data in validated:
+        # Check for duplicates
+        if product_data['id'] in collected_ids:
+            METRICS.inc('products_rejected', reason='duplicate')
+            continue
+        
+        # Apply allergen filter
+        has_allergens = product_data['allergens'] != "EMPTY"
+        
+        if require_allergens:
+            if not has_allergens:
+                METRICS.inc('products_rejected', reason='wrong_group')
+                continue
+            if not matches_target_allergens(product_data['allergens']):
+                METRICS.inc('products_rejected', reason='non_target_allergen')
+                continue
+        else:
+            if has_allergens:
+                METRICS.inc('products_rejected', reason='wrong_group')
+                continue
+        
+        if is_near_duplicate(product_data, near_dups):
+            continue
+        
+        # Add to collection
+        METRICS.inc('products_accepted', group=product_group(require_allergens))
+        products.append(product_data)
+        collected_ids.add(product_data['id'])
+        term_count += 1
+        if checkpoint:
+            checkpoint.add_product(product_data, require_allergens, term)
+        
+        print(f"     + [{len(products)}/{target_count}] {product_data['name'][:30]}...")
+        print(f"        Ingredients: {product_data['ingredients'][:50]}...")
+        if has_allergens:
+            print(f"        Allergens: {product_data['allergens']}")
+        
+        if len(products) >= target_count:
+            return term_count, True
+        
+        if term_quota_reached(term_count, require_allergens):
+            print(f"      -> Hit quota for '{term}'. Moving to next term.")
+            return term_count, True
+    
+    return term_count, False
 
-def fetch_products_batch(search_terms, target_count, require_allergens, collected_ids):
+def fetch_products_batch(search_terms, target_count, require_allergens, collected_ids, api_url=API_URL,
+                         checkpoint=None, near_dups=None):
     """
-    Fetch products with comprehensive validation
+    Fetch products with comprehensive validation, searching the terms in the
+    order given (collect_from_api shuffles them)
     """
     products = []
     category_label = "WITH ALLERGENS" if require_allergens else "NO ALLERGENS"
     
     print(f"\n--- Searching for {target_count} products [{category_label}] ---")
     
-    # Shuffle search terms for diversity
-    search_terms_shuffled = search_terms.copy()
-    random.shuffle(search_terms_shuffled)
-    
-    for term in search_terms_shuffled:
+    for term in search_terms:
         if len(products) >= target_count:
             break
             
         print(f"   > Searching term: '{term}'...")
-        term_count = 0
-        
-        # Request all potentially relevant fields
-        params = {
-            'search_terms': term,
-            'page_size': 50,  # Max per page
-            'json': 1,
-            'lc': 'en',  # Prefer English
-            'fields': 'code,product_name,product_name_en,ingredients_text,ingredients_text_en,allergens,allergens_tags,allergens_from_ingredients'
-        }
         
-        data = fetch_with_retry(API_URL, params)
-        if not data:
-            continue
+        # Pages are pulled only while this term still has quota left
+        start_page, on_page = 1, None
+        if checkpoint:
+            start_page = checkpoint.term_page(term, require_allergens)
+            on_page = lambda page, term=term: checkpoint.page_started(term, require_allergens, page)
+        validated = iter_search_products(term, api_url, start_page, on_page)
+        term_count = checkpoint.term_count(term, require_allergens) if checkpoint else 0
+        try:
+            consume_term_products(validated, term, products, target_count, require_allergens,
+                                  collected_ids, term_count, checkpoint, near_dups)
+        finally:
+            validated.close()
         
-        items = data.get('products', [])
+        # Stopped short of the target: this term has nothing more to give
+        if checkpoint and len(products) < target_count:
+            checkpoint.finish_term(term, require_allergens)
         
-        for p in items:
+        # Be respectful to API
+        time.sleep(1.5)
+    
+    return products
+
+async def fetch_products_batch_async(search_terms, target_count, require_allergens, collected_ids,
+                                     client, limiter, concurrency=ASYNC_CONCURRENCY, api_url=API_URL,
+                                     checkpoint=None, near_dups=None):
+    """
+    Async version of fetch_products_batch.
+    Up to `concurrency` terms are fetched ahead, but results are consumed strictly
+    in the given order so collected_ids dedup matches the sequential collector.
+    Within a term the next page is requested while the current one is validated.
+    """
+    products = []
+    category_label = "WITH ALLERGENS" if require_allergens else "NO ALLERGENS"
+    
+    print(f"\n--- Searching for {target_count} products [{category_label}] (async x{concurrency}) ---")
+    
+    def start_page(term):
+        return checkpoint.term_page(term, require_allergens) if checkpoint else 1
+    
+    def request_page(term, page):
+        return asyncio.ensure_future(
+            fetch_with_retry_async(client, limiter, api_url, build_search_params(term, page))
+        )
+    
+    pending = {}
+    next_index = 0
+    page_task = None
+    try:
+        for index, term in enumerate(search_terms):
             if len(products) >= target_count:
                 break
-                
-            if require_allergens and term_count >= MAX_ITEMS_PER_KEYWORD:
-                print(f"      -> Hit quota for '{term}'. Moving to next term.")
-                break
             
-            # Validate product
-            is_valid, product_data = validate_product_data(p)
+            # Keep the look-ahead window full with first pages
+            while next_index < len(search_terms) and next_index < index + concurrency:
+                next_term = search_terms[next_index]
+                pending[next_index] = request_page(next_term, start_page(next_term))
+                next_index += 1
             
-            if not is_valid or not product_data:
-                continue
+            print(f"   > Searching term: '{term}'...")
+            term_count = checkpoint.term_count(term, require_allergens) if checkpoint else 0
+            page = start_page(term)
+            page_task = pending.pop(index)
+            while page_task is not None:
+                data = await page_task
+                items = data.get('products', []) if data else []
+                if checkpoint:
+                    checkpoint.page_started(term, require_allergens, page)
+                
+                page_task = None
+                if has_next_page(items, page):
+                    page += 1
+                    page_task = request_page(term, page)
+                
+                term_count, done = consume_term_products(
+                    iter_validated(items), term, products, target_count,
+                    require_allergens, collected_ids, term_count, checkpoint, near_dups
+                )
+                if done:
+                    break
             
-            # Check for duplicates
-            if product_data['id'] in collected_ids:
-                continue
+            if page_task is not None:
+                page_task.cancel()
+                page_task = None
             
-            # Apply allergen filter
-            has_allergens = product_data['allergens'] != "EMPTY"
+            if checkpoint and len(products) < target_count:
+                checkpoint.finish_term(term, require_allergens)
+    finally:
+        # Target reached: drop look-ahead requests that are no longer needed
+        leftovers = list(pending.values()) + ([page_task] if page_task else [])
+        for task in leftovers:
+            task.cancel()
+        await asyncio.gather(*leftovers, return_exceptions=True)
+    
+    return products
+
+def open_dump(path):
+    """Opens a dump as text, transparently handling .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+def csv_row_to_product(row):
+    """
+    Maps a CSV dump row onto the API field names used by validate_product_data.
+    The CSV export stores allergen tags comma-separated in 'allergens'.
+    """
+    product = dict(row)
+    if not product.get('allergens_tags'):
+        tags = [t.strip() for t in (product.get('allergens') or '').split(',')]
+        product['allergens_tags'] = [t for t in tags if t.startswith('en:')]
+    elif isinstance(product['allergens_tags'], str):
+        product['allergens_tags'] = [t.strip() for t in product['allergens_tags'].split(',') if t.strip()]
+    return product
+
+def iter_dump_records(path):
+    """
+    Streams product records from a JSONL or CSV/TSV dump (optionally gzipped)
+    one at a time, so memory stays flat however big the file is.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    with open_dump(path) as f:
+        if name.endswith(('.jsonl', '.json')):
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Truncated/corrupt line, skip it
+        else:
+            # Official CSV export is tab-separated; foodraw-style files use ';'
+            csv.field_size_limit(2**31 - 1)
+            header = f.readline()
+            delimiter = max(['\t', ';', ','], key=header.count)
+            fieldnames = next(csv.reader([header], delimiter=delimiter))
+            for row in csv.DictReader(f, fieldnames=fieldnames, delimiter=delimiter):
+                yield csv_row_to_product(row)
+
+def iter_chunks(records, size):
+    """Groups a record stream into lists of `size`"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def classify_dump_chunk(records, count_rejections=False):
+    """
+    Process-pool worker: runs the validation chain over one chunk.
+    Returns (records_seen, [(product_data, is_target_allergen, has_allergens), ...],
+    rejections) with products that can't be used by either list already dropped.
+    Workers can't update the parent's metrics, so with count_rejections the
+    dropped products come back as a Counter by reason (else None).
+    """
+    rejections = Counter() if count_rejections else None
+    results = []
+    for is_valid, product_data in validate_products_batch(records, rejections):
+        if not is_valid or not product_data:
+            continue
+        has_allergens = product_data['allergens'] != "EMPTY"
+        is_target = has_allergens and matches_target_allergens(product_data['allergens'])
+        if has_allergens and not is_target:
+            if rejections is not None:
+                rejections['non_target_allergen'] += 1
+            continue
+        results.append((product_data, is_target, has_allergens))
+    return len(records), results, rejections
+
+def imap_bounded(executor, fn, iterable, max_pending):
+    """
+    Ordered executor.map that keeps at most `max_pending` tasks queued,
+    unlike Pool.imap which drains the whole input iterator up front.
+    """
+    pending = []
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.pop(0).result()
+    while pending:
+        yield pending.pop(0).result()
+
+def collect_from_dump(path, target_allergens, target_safe, collected_ids,
+                      workers=DUMP_WORKERS, chunk_size=DUMP_CHUNK_SIZE, checkpoint=None, near_dups=None):
+    """
+    Fills both product lists from a local dump instead of the search API.
+    Validation runs on a process pool; dedup and quotas are applied here
+    in file order. With a checkpoint, restored products are kept and the
+    records an earlier run already scanned are skipped unvalidated.
+    """
+    list_with = list(checkpoint.products['allergen']) if checkpoint else []
+    list_safe = list(checkpoint.products['safe']) if checkpoint else []
+    records_seen = checkpoint.dump_position if checkpoint else 0
+    
+    print(f"\n--- Streaming dump {path} ({workers} workers, chunks of {chunk_size}) ---")
+    if records_seen:
+        print(f"   > Resuming after record {records_seen:,}")
+    start = time.perf_counter()
+    start_seen = records_seen
+    
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        records = itertools.islice(iter_dump_records(path), records_seen, None)
+        chunks = iter_chunks(records, chunk_size)
+        classify = functools.partial(classify_dump_chunk, count_rejections=METRICS.enabled)
+        for seen, results, rejections in imap_bounded(executor, classify, chunks, workers * 2):
+            records_seen += seen
+            if rejections is not None:
+                METRICS.inc('products_validated', seen)
+                METRICS.inc_many('products_rejected', rejections, 'reason')
             
-            if require_allergens:
-                if not has_allergens:
+            added = 0
+            for product_data, is_target, has_allergens in results:
+                if product_data['id'] in collected_ids:
+                    METRICS.inc('products_rejected', reason='duplicate')
                     continue
-                if not matches_target_allergens(product_data['allergens']):
+                if is_target and len(list_with) < target_allergens:
+                    target_list = list_with
+                elif not has_allergens and len(list_safe) < target_safe:
+                    target_list = list_safe
+                else:
                     continue
-            else:
-                if has_allergens:
+                if is_near_duplicate(product_data, near_dups):
                     continue
+                target_list.append(product_data)
+                METRICS.inc('products_accepted', group=product_group(is_target))
+                collected_ids.add(product_data['id'])
+                added += 1
+                if checkpoint:
+                    checkpoint.add_product(product_data, is_target)
             
-            # Add to collection
-            products.append(product_data)
-            collected_ids.add(product_data['id'])
-            term_count += 1
+            if checkpoint and (added or records_seen % DUMP_PROGRESS_EVERY < seen):
+                checkpoint.dump_progress(records_seen)
             
-            print(f"     + [{len(products)}/{target_count}] {product_data['name'][:30]}...")
-            print(f"        Ingredients: {product_data['ingredients'][:50]}...")
-            if has_allergens:
-                print(f"        Allergens: {product_data['allergens']}")
-        
-        # Be respectful to API
-        time.sleep(1.5)
+            if records_seen % DUMP_PROGRESS_EVERY < seen:
+                print(f"   > {records_seen:,} records scanned | allergen {len(list_with)}/{target_allergens} | safe {len(list_safe)}/{target_safe}", end="\r")
+            
+            if len(list_with) >= target_allergens and len(list_safe) >= target_safe:
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
     
-    return products
+    elapsed = time.perf_counter() - start
+    rate = (records_seen - start_seen) / elapsed if elapsed > 0 else 0.0
+    print(f"\n   ⏱️ Scanned {records_seen - start_seen:,} records in {elapsed:.1f}s ({rate:,.0f} records/s)")
+    
+    return list_with, list_safe
+
+def raw_content_hash(product):
+    """Hash of the raw API fields, to spot products whose text really changed"""
+    return content_hash(*(product.get(field) for field in CONTENT_FIELDS))
+
+def store_group(product_data):
+    """'allergen', 'safe' or None, with the same rules as the full collector"""
+    if product_data['allergens'] == "EMPTY":
+        return 'safe'
+    if matches_target_allergens(product_data['allergens']):
+        return 'allergen'
+    return None
+
+def apply_product_changes(items, store, since, targets, stats):
+    """
+    Applies raw products modified after `since` to the store.
+    Products whose raw text hash is unchanged only get their timestamp
+    updated; new or changed ones are validated and added, updated, or
+    dropped if they no longer qualify.
+    """
+    fresh = {}
+    for product in items:
+        modified = int(product.get('last_modified_t') or 0)
+        if product.get('code') and modified > since:
+            fresh[str(product['code'])] = product
+    stats['seen'] += len(fresh)
+    if not fresh:
+        return
+    
+    stored = store.lookup(fresh)
+    changed = []
+    for code, product in fresh.items():
+        digest = raw_content_hash(product)
+        if code in stored and stored[code][1] == digest:
+            store.touch(code, int(product['last_modified_t']))
+            stats['unchanged'] += 1
+        else:
+            changed.append((code, product, digest))
+    
+    validated = validate_and_count([product for _, product, _ in changed])
+    for (code, product, digest), (is_valid, product_data) in zip(changed, validated):
+        old_group = stored[code][0] if code in stored else None
+        group = store_group(product_data) if is_valid and product_data else None
+        if group is not None and group != old_group and store.count(group) >= targets[group]:
+            group = None  # No room left in the new group
+        
+        if group is None:
+            if old_group is not None:
+                store.remove(code)
+                stats['removed'] += 1
+            else:
+                stats['rejected'] += 1
+            continue
+        
+        store.put(product_data, group, int(product['last_modified_t']), digest)
+        stats['updated' if old_group else 'added'] += 1
+    store.commit()
+
+def iter_modified_pages(term, api_url, since):
+    """Result pages for a term, newest modification first, until older than `since`"""
+    page = 1
+    while True:
+        data = fetch_page(api_url, term, page, PAGE_DELAY if page > 1 else 0, sort_by='last_modified_t')
+        items = data.get('products', []) if data else []
+        yield items
+        if not items or int(items[-1].get('last_modified_t') or 0) <= since:
+            return
+        if not has_next_page(items, page):
+            return
+        page += 1
+
+def collect_incremental(args):
+    """
+    Refreshes the stored corpus with only the products modified since the
+    last run, then returns the stored (allergen, safe) lists.
+    """
+    store = ProductStore(PRODUCT_STORE_FILE)
+    try:
+        # foodraw.txt rewritten by a full run: the store no longer matches it
+        output_mtime = int(os.path.getmtime(OUTPUT_FILE)) if os.path.exists(OUTPUT_FILE) else None
+        if store.count() and output_mtime != store.get_meta('output_mtime'):
+            print(f"   ⚠️ {OUTPUT_FILE} changed outside incremental mode. Rebuilding the store from it.")
+            store.close()
+            os.remove(PRODUCT_STORE_FILE)
+            store = ProductStore(PRODUCT_STORE_FILE)
+        if not store.count() and output_mtime is not None:
+            print(f"   > Seeded the store with {store.import_foodraw(OUTPUT_FILE)} products from {OUTPUT_FILE}")
+        
+        since = store.get_meta('last_refresh_t', 0)
+        run_started = int(time.time())
+        targets = {'allergen': args.target_allergens, 'safe': args.target_safe}
+        stats = dict.fromkeys(['seen', 'unchanged', 'added', 'updated', 'removed', 'rejected'], 0)
+        print(f"   > Fetching products modified since {time.strftime('%Y-%m-%d %H:%M', time.localtime(since))}")
+        
+        if args.dump:
+            for chunk in iter_chunks(iter_dump_records(args.dump), args.chunk_size):
+                apply_product_changes(chunk, store, since, targets, stats)
+        else:
+            terms = dict.fromkeys(ALLERGEN_SEARCH_TERMS + ALLERGEN_FALLBACK_TERMS +
+                                  SAFE_SEARCH_TERMS + SAFE_FALLBACK_TERMS)
+            for term in terms:
+                print(f"   > Checking term: '{term}'...")
+                for items in iter_modified_pages(term, args.api_url, since):
+                    apply_product_changes(items, store, since, targets, stats)
+        
+        store.set_meta('last_refresh_t', run_started - REFRESH_OVERLAP)
+        store.commit()
+        print(f"   ✅ {stats['seen']} modified products: {stats['unchanged']} unchanged (skipped), "
+              f"{stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, "
+              f"{stats['rejected']} rejected")
+        METRICS.inc_many('incremental_products', stats, 'outcome')
+        return store.products('allergen'), store.products('safe')
+    finally:
+        store.close()
+
+def record_output_written():
+    """Remembers which foodraw.txt the store was written to"""
+    store = ProductStore(PRODUCT_STORE_FILE)
+    store.set_meta('output_mtime', int(os.path.getmtime(OUTPUT_FILE)))
+    store.commit()
+    store.close()
 
-def save_to_file(list_with, list_without):
+def save_to_file(list_with, list_without, target_with=TARGET_ALLERGENS, target_without=TARGET_NO_ALLERGENS):
     """
     Save collected data to file in SPECIFIC ORDER:
     1. First 50: Safe Products (No Allergens)
@@ -303,6 +1059,7 @@ def save_to_file(list_with, list_without):
     
     This ensures the 'Last 10' data points (191-200) contain allergens
     for the lab demonstration requirement.
+    Returns True if the file was written.
     """
     print(f"\n--- Saving Data to {OUTPUT_FILE} ---")
     try:
@@ -311,13 +1068,13 @@ def save_to_file(list_with, list_without):
             f.write("id;name;link;ingredients;allergensraw\n")
             
             # 1. WRITE SAFE PRODUCTS FIRST (IDs 1-50)
-            print("   > Writing 50 SAFE products first...")
+            print(f"   > Writing {len(list_without)} SAFE products first...")
             for i, p in enumerate(list_without, 1):
                 f.write(f"{i};{p['name']};{p['link']};{p['ingredients']};{p['allergens']}\n")
             
             # 2. WRITE ALLERGEN PRODUCTS SECOND (IDs 51-200)
             # Start counting from where the safe list ended (len(list_without) + 1)
-            print("   > Writing 150 ALLERGEN products next...")
+            print(f"   > Writing {len(list_with)} ALLERGEN products next...")
             start_id = len(list_without) + 1
             for i, p in enumerate(list_with, start_id):
                 f.write(f"{i};{p['name']};{p['link']};{p['ingredients']};{p['allergens']}\n")
@@ -328,107 +1085,215 @@ def save_to_file(list_with, list_without):
         
         # Show statistics
         print(f"\n📊 Statistics:")
-        print(f"  Safe Products: {len(list_without)}/{TARGET_NO_ALLERGENS}")
-        print(f"  Allergen Products: {len(list_with)}/{TARGET_ALLERGENS}")
+        print(f"  Safe Products: {len(list_without)}/{target_without}")
+        print(f"  Allergen Products: {len(list_with)}/{target_with}")
+        return True
             
     except IOError as e:
         print(f"  ❌ Error writing file: {e}")
     except Exception as e:
         print(f"  ❌ Unexpected error: {e}")
+    return False
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Open Food Facts collector")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Fetch search terms concurrently over a pooled keep-alive client")
+    parser.add_argument('--concurrency', type=int, default=ASYNC_CONCURRENCY,
+                        help="Search requests kept in flight in async mode")
+    parser.add_argument('--rate', type=float, default=RATE_LIMIT_PER_SEC,
+                        help="Token bucket refill rate in requests per second (async mode)")
+    parser.add_argument('--burst', type=int, default=RATE_LIMIT_BURST,
+                        help="Token bucket capacity (async mode)")
+    parser.add_argument('--api-url', default=API_URL,
+                        help="Search endpoint, e.g. a local stand-in server for testing")
+    parser.add_argument('--seed', type=int,
+                        help="Seed the search term shuffle, so runs against a stand-in server are repeatable")
+    parser.add_argument('--dump',
+                        help="Read products from a local Open Food Facts JSONL/CSV dump (.gz ok) instead of the API")
+    parser.add_argument('--workers', type=int, default=DUMP_WORKERS,
+                        help="Validation processes in dump mode")
+    parser.add_argument('--chunk-size', type=int, default=DUMP_CHUNK_SIZE,
+                        help="Records per worker task in dump mode")
+    parser.add_argument('--target-allergens', type=int, default=TARGET_ALLERGENS,
+                        help="Number of products with allergens to collect")
+    parser.add_argument('--target-safe', type=int, default=TARGET_NO_ALLERGENS,
+                        help="Number of products without allergens to collect")
+    parser.add_argument('--near-dup-threshold', type=float, default=NEAR_DUP_THRESHOLD,
+                        help="Skip products whose name + ingredient words are this similar (Jaccard) "
+                             "to one already collected; 0 turns the check off")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Continue an interrupted run from {CHECKPOINT_FILE} instead of starting over")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Only fetch products modified since the last run and update {OUTPUT_FILE} "
+                             f"from {PRODUCT_STORE_FILE}")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Write run metrics (stage timings, rejection reasons, HTTP latency) as JSON")
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help="Write the same metrics in Prometheus text format")
+    return parser.parse_args(argv)
+
+def collect_from_api(args, global_ids, checkpoint=None, near_dups=None):
+    """
+    Fills both product lists from the search API (keyword searches plus fallbacks)
+    """
+    # Every term list is shuffled up front, before finished terms are
+    # dropped, so a resumed or seeded run walks the terms like a full one
+    order = checkpoint.term_order if checkpoint else (lambda terms, _: shuffled_terms(terms))
+    allergen_terms = order(ALLERGEN_SEARCH_TERMS, True)
+    allergen_fallback_terms = order(ALLERGEN_FALLBACK_TERMS, True)
+    safe_terms = order(SAFE_SEARCH_TERMS, False)
+    safe_fallback_terms = order(SAFE_FALLBACK_TERMS, False)
+    
+    # Pick the collection engine; both share the same validation and dedup
+    loop = None
+    client = None
+    if args.use_async:
+        loop = asyncio.new_event_loop()
+        client = AsyncSearchClient(args.concurrency)
+        limiter = TokenBucket(args.rate, args.burst)
+        
+        def fetch_batch(terms, target_count, require_allergens, collected_ids):
+            if checkpoint:
+                terms = checkpoint.pending_terms(terms, require_allergens)
+            return loop.run_until_complete(fetch_products_batch_async(
+                terms, target_count, require_allergens, collected_ids,
+                client, limiter, args.concurrency, args.api_url, checkpoint, near_dups
+            ))
+    else:
+        def fetch_batch(terms, target_count, require_allergens, collected_ids):
+            if checkpoint:
+                terms = checkpoint.pending_terms(terms, require_allergens)
+            return fetch_products_batch(terms, target_count, require_allergens, collected_ids,
+                                        args.api_url, checkpoint, near_dups)
+    
+    try:
+        # Products restored from the journal count towards the targets
+        list_allergens = list(checkpoint.products['allergen']) if checkpoint else []
+        list_safe = list(checkpoint.products['safe']) if checkpoint else []
+    
+        # Step 1: Fetch products WITH allergens
+        print("\n🔍 COLLECTING PRODUCTS WITH ALLERGENS")
+        if len(list_allergens) < args.target_allergens:
+            list_allergens.extend(fetch_batch(
+                allergen_terms, 
+                args.target_allergens - len(list_allergens), 
+                True, 
+                global_ids
+            ))
+    
+        # Fallback search if we need more
+        if len(list_allergens) < args.target_allergens:
+            print(f"\n   ⚠️ Need {args.target_allergens - len(list_allergens)} more allergen products...")
+            additional = fetch_batch(
+                allergen_fallback_terms, 
+                args.target_allergens - len(list_allergens), 
+                True, 
+                global_ids
+            )
+            list_allergens.extend(additional)
+    
+        # Step 2: Fetch products WITHOUT allergens
+        print("\n🔍 COLLECTING SAFE PRODUCTS (NO ALLERGENS)")
+        if len(list_safe) < args.target_safe:
+            list_safe.extend(fetch_batch(
+                safe_terms, 
+                args.target_safe - len(list_safe), 
+                False, 
+                global_ids
+            ))
+    
+        # Fallback for safe products
+        if len(list_safe) < args.target_safe:
+            print(f"\n   ⚠️ Need {args.target_safe - len(list_safe)} more safe products...")
+            additional_safe = fetch_batch(
+                safe_fallback_terms,
+                args.target_safe - len(list_safe),
+                False,
+                global_ids
+            )
+            list_safe.extend(additional_safe)
 
-def main():
+        return list_allergens, list_safe
+    finally:
+        # Also on errors and Ctrl-C, so the session and the event loop never leak
+        if client is not None:
+            client.close()
+        if loop is not None:
+            loop.close()
+
+def main(argv=None):
     """
     Main execution function
     """
+    args = parse_args(argv)
+    
     print("="*70)
     print("  OPEN FOOD FACTS COLLECTOR - DEMO OPTIMIZED")
     print("="*70)
     
-    # Initialize tracking
-    global_ids = set()
-    
-    # Search terms - broad categories
-    allergen_keywords = [
-        "milk", "cheese", "yogurt", "butter", "cream",
-        "egg", "mayonnaise", "omelette",
-        "peanut", "peanut butter",
-        "nuts", "almond", "cashew", "hazelnut", "walnut",
-        "bread", "pasta", "cereal", "wheat", "flour",
-        "soy", "tofu", "soy sauce",
-        "fish", "salmon", "tuna", "sardines",
-        "shrimp", "crab", "lobster", "shellfish",
-        "sesame", "sesame oil", "tahini"
-    ]
+    if args.metrics or args.prometheus:
+        METRICS.enable()
+    if args.seed is not None:
+        random.seed(args.seed)
     
-    safe_keywords = [
-        "rice", "basmati rice", "brown rice",
-        "salt", "sea salt", "himalayan salt",
-        "sugar", "brown sugar", "cane sugar",
-        "honey", "maple syrup",
-        "olive oil", "coconut oil", "vegetable oil",
-        "tea", "black tea", "green tea", "herbal tea",
-        "coffee", "ground coffee", "coffee beans",
-        "vinegar", "apple cider vinegar", "balsamic vinegar",
-        "fruits", "apple", "banana", "orange", "berries",
-        "vegetables", "carrot", "potato", "tomato", "onion",
-        "water", "sparkling water", "mineral water"
-    ]
+    if args.incremental:
+        print("\n🔄 INCREMENTAL REFRESH")
+        with METRICS.stage('collect'):
+            list_allergens, list_safe = collect_incremental(args)
+        with METRICS.stage('save'):
+            if save_to_file(list_allergens, list_safe, args.target_allergens, args.target_safe):
+                record_output_written()
+        METRICS.write('openfoodfacts_to_txt', args.metrics, args.prometheus)
+        return
     
-    # Step 1: Fetch products WITH allergens
-    print("\n🔍 COLLECTING PRODUCTS WITH ALLERGENS")
-    list_allergens = fetch_products_batch(
-        allergen_keywords, 
-        TARGET_ALLERGENS, 
-        True, 
-        global_ids
-    )
+    # Initialize tracking (restored from the journal with --resume)
+    source = args.dump or args.api_url
+    checkpoint = CollectionCheckpoint(CHECKPOINT_FILE, resume=args.resume)
+    if checkpoint.source not in (None, source):
+        print(f"\n⚠️ {CHECKPOINT_FILE} belongs to another source ({checkpoint.source}). Starting over.")
+        checkpoint.journal.close()
+        checkpoint = CollectionCheckpoint(CHECKPOINT_FILE)
+    if checkpoint.source is None:
+        checkpoint.start(source)
+    global_ids = checkpoint.collected_ids()
+    near_dups = None
+    if args.near_dup_threshold > 0:
+        near_dups = NearDuplicateIndex(args.near_dup_threshold, NEAR_DUP_PERMUTATIONS)
+        for group in ('allergen', 'safe'):
+            for product_data in checkpoint.products[group]:
+                near_dups.add(product_data['id'], product_data['name'], product_data['ingredients'])
+    if args.resume:
+        print(f"\n♻️ Resuming: {len(checkpoint.products['allergen'])} allergen + "
+              f"{len(checkpoint.products['safe'])} safe products restored, "
+              f"{sum(len(t) for t in checkpoint.done_terms.values())} terms already searched")
     
-    # Fallback search if we need more
-    if len(list_allergens) < TARGET_ALLERGENS:
-        print(f"\n   ⚠️ Need {TARGET_ALLERGENS - len(list_allergens)} more allergen products...")
-        extra_terms = [
-            "chocolate", "cookies", "biscuits", "cake", "pastry",
-            "sausage", "bacon", "ham", "deli meat",
-            "sauce", "dressing", "condiment",
-            "snack", "chips", "crackers", "pretzels"
-        ]
-        additional = fetch_products_batch(
-            extra_terms, 
-            TARGET_ALLERGENS - len(list_allergens), 
-            True, 
-            global_ids
-        )
-        list_allergens.extend(additional)
-    
-    # Step 2: Fetch products WITHOUT allergens
-    print("\n🔍 COLLECTING SAFE PRODUCTS (NO ALLERGENS)")
-    list_safe = fetch_products_batch(
-        safe_keywords, 
-        TARGET_NO_ALLERGENS, 
-        False, 
-        global_ids
-    )
-    
-    # Fallback for safe products
-    if len(list_safe) < TARGET_NO_ALLERGENS:
-        print(f"\n   ⚠️ Need {TARGET_NO_ALLERGENS - len(list_safe)} more safe products...")
-        extra_safe = [
-            "herbs", "spices", "pepper", "cinnamon", "ginger",
-            "beans", "lentils", "chickpeas",
-            "mushrooms", "garlic", "ginger",
-            "lemon", "lime", "grapefruit"
-        ]
-        additional_safe = fetch_products_batch(
-            extra_safe,
-            TARGET_NO_ALLERGENS - len(list_safe),
-            False,
-            global_ids
-        )
-        list_safe.extend(additional_safe)
+    with METRICS.stage('collect'):
+        if args.dump:
+            print("\n📦 COLLECTING FROM LOCAL DUMP")
+            list_allergens, list_safe = collect_from_dump(
+                args.dump,
+                args.target_allergens,
+                args.target_safe,
+                global_ids,
+                args.workers,
+                args.chunk_size,
+                checkpoint,
+                near_dups
+            )
+        else:
+            list_allergens, list_safe = collect_from_api(args, global_ids, checkpoint, near_dups)
     
     # Step 3: Save results
     # Function will handle the ordering: Safe first, then Allergens
-    save_to_file(list_allergens, list_safe)
+    with METRICS.stage('save'):
+        saved = save_to_file(list_allergens, list_safe, args.target_allergens, args.target_safe)
+    if saved:
+        checkpoint.journal.remove()  # Output is complete, nothing left to resume
+    else:
+        checkpoint.journal.close()
+        print(f"  👉 Progress kept in {CHECKPOINT_FILE}; rerun with --resume to try again.")
     
     # Final summary
     print(f"\n🎯 MISSION COMPLETE!")
@@ -441,6 +1306,8 @@ def main():
         print(f"  Average ingredient length (Allergen): {sum(len(p['ingredients']) for p in list_allergens) / len(list_allergens):.0f} chars")
     if list_safe:
         print(f"  Average ingredient length (Safe): {sum(len(p['ingredients']) for p in list_safe) / len(list_safe):.0f} chars")
+    
+    METRICS.write('openfoodfacts_to_txt', args.metrics, args.prometheus)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
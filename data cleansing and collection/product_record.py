@@ -0,0 +1,71 @@
+# product_record.py
+"""
+Compact record for one cleaned product, used by the collector instead of
+a dict per product.
+
+A dict with id/name/ingredients/allergens/link costs a hash table plus a
+full product URL string per product. ProductRecord keeps the four real
+fields in __slots__, derives the link from the code when it is read, and
+interns the allergen string (the same few combinations, e.g.
+"milk, soybeans", repeat across thousands of products). That is about
+72 bytes per product instead of about 290, before the name and ingredient
+text; python benchmark.py --only product_records measures it.
+
+Records still read like the old dicts (record['name'], record.get('link')),
+so the writers and the product store work with either.
+"""
+import sys
+
+PRODUCT_URL = "https://world.openfoodfacts.org/product/"
+FIELDS = ('id', 'name', 'ingredients', 'allergens')
+
+
+class ProductRecord:
+    __slots__ = FIELDS
+
+    def __init__(self, id, name, ingredients, allergens):
+        self.id = id
+        self.name = name
+        self.ingredients = ingredients
+        self.allergens = sys.intern(allergens)
+
+    @property
+    def link(self):
+        return PRODUCT_URL + str(self.id)
+
+    def __getitem__(self, key):
+        if key == 'link' or key in FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if not isinstance(other, ProductRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in FIELDS)
+
+    def __repr__(self):
+        return f"ProductRecord(id={self.id!r}, name={self.name!r})"
+
+    def __getstate__(self):
+        # Sent to/from the dump worker processes as a plain tuple
+        return tuple(getattr(self, f) for f in FIELDS)
+
+    def __setstate__(self, state):
+        for field, value in zip(FIELDS, state):
+            setattr(self, field, value)
+        self.allergens = sys.intern(self.allergens)
+
+    def to_dict(self):
+        """JSON-ready form (the link is left out, it is rebuilt from the id)"""
+        return {f: getattr(self, f) for f in FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        """From to_dict() output or an old-style product dict (its link is ignored)"""
+        return cls(data['id'], data['name'], data['ingredients'], data['allergens'])
@@ -0,0 +1,123 @@
+# product_store.py
+"""
+Persistent product corpus for incremental refreshes of openfoodfacts_to_txt.
+
+Every kept product is stored in SQLite with the Open Food Facts
+last_modified_t it was seen with and a hash of its raw API text, plus the
+time of the last refresh. An incremental run then only fetches products
+modified since that time, and of those only the ones whose hash changed
+are cleaned and validated again; foodraw.txt is rewritten from the store.
+The first run bootstraps the store from an existing foodraw.txt.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+
+from product_record import ProductRecord
+
+GROUPS = ('safe', 'allergen')
+
+
+def content_hash(*parts):
+    """Short hash of the raw fields a product's cleaned row is built from"""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class ProductStore:
+    """
+    code -> cleaned product row (group, name, link, ingredients, allergens).
+    Rows keep their insertion order, so product IDs in foodraw.txt only
+    shift when products are removed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT UNIQUE NOT NULL, grp TEXT NOT NULL, "
+            "name TEXT, link TEXT, ingredients TEXT, allergens TEXT, "
+            "last_modified_t INTEGER, content_hash TEXT)"
+        )
+        self.conn.commit()
+
+    def get_meta(self, name, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, name, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, json.dumps(value)))
+
+    def count(self, group=None):
+        if group is None:
+            return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM products WHERE grp = ?", (group,)).fetchone()[0]
+
+    def lookup(self, codes):
+        """{code: (group, content_hash)} for the stored codes"""
+        found = {}
+        codes = list(codes)
+        for start in range(0, len(codes), 500):  # Stay under SQLite's variable limit
+            chunk = codes[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for code, group, digest in self.conn.execute(
+                    f"SELECT code, grp, content_hash FROM products WHERE code IN ({placeholders})", chunk):
+                found[code] = (group, digest)
+        return found
+
+    def put(self, product_data, group, last_modified_t=None, digest=None):
+        """Inserts a product, or updates it in place (keeping its position)"""
+        self.conn.execute(
+            "INSERT INTO products (code, grp, name, link, ingredients, allergens, last_modified_t, content_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(code) DO UPDATE SET grp = excluded.grp, name = excluded.name, link = excluded.link, "
+            "ingredients = excluded.ingredients, allergens = excluded.allergens, "
+            "last_modified_t = excluded.last_modified_t, content_hash = excluded.content_hash",
+            (product_data['id'], group, product_data['name'], product_data['link'],
+             product_data['ingredients'], product_data['allergens'], last_modified_t, digest)
+        )
+
+    def touch(self, code, last_modified_t):
+        """Records a newer modification time for an unchanged product"""
+        self.conn.execute("UPDATE products SET last_modified_t = ? WHERE code = ?", (last_modified_t, code))
+
+    def remove(self, code):
+        self.conn.execute("DELETE FROM products WHERE code = ?", (code,))
+
+    def products(self, group):
+        """Stored products of a group as collector product records, in insertion order"""
+        rows = self.conn.execute(
+            "SELECT code, name, ingredients, allergens FROM products WHERE grp = ? ORDER BY seq", (group,))
+        return [ProductRecord(code, name, ingredients, allergens) for code, name, ingredients, allergens in rows]
+
+    def import_foodraw(self, path):
+        """
+        Seeds an empty store from a foodraw.txt written by save_to_file.
+        Those rows carry no hash, so each is revalidated the first time it changes.
+        Returns the number of products imported.
+        """
+        imported = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            f.readline()  # Header
+            for line in f:
+                parts = line.rstrip('\n').split(';')
+                if len(parts) < 5:
+                    continue
+                _, name, link, ingredients, allergens = parts[:5]
+                code = link.rstrip('/').rsplit('/', 1)[-1]
+                group = 'safe' if allergens == "EMPTY" else 'allergen'
+                self.put({'id': code, 'name': name, 'link': link, 'ingredients': ingredients,
+                          'allergens': allergens}, group)
+                imported += 1
+        # Only products modified after the file was written can differ from it
+        self.set_meta('last_refresh_t', int(os.path.getmtime(path)))
+        self.commit()
+        return imported
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,406 @@
+# standin_server.py
+"""
+Local stand-in servers for the Open Food Facts search API and the Gemini
+REST API, plus a record/replay proxy, so the collector and the mapper can
+be load- and concurrency-tested offline and repeatably.
+
+    python standin_server.py search --port 8765 --latency 0.3 --rate 2 --malformed 0.01
+    python openfoodfacts_to_txt.py --api-url http://127.0.0.1:8765/cgi/search.pl
+
+    python standin_server.py gemini --port 8766 --rpm 60 --exhausted models/gemini-2.5-flash
+    python activity03_mapping.py --model-url http://127.0.0.1:8766
+
+Emulation serves synthetic data (synthetic_data.py) and can add a
+lognormal latency distribution, token-bucket 429 rate limiting with
+Retry-After, and a share of truncated (malformed) JSON bodies, all seeded.
+
+--record DIR forwards every request to --upstream and saves each response
+as a fixture file; --replay DIR serves those fixtures back (the latency,
+rate limit and malformed options apply on top, so a real traffic sample
+can be replayed under stress). Fixtures are keyed on method, path, query
+and body with the API key left out, so they are safe to share.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from synthetic_data import SEED, make_record, RECORD_MIX, prompt_items, stub_answers
+
+# --- CONFIGURATION ---
+SEARCH_PORT = 8765
+GEMINI_PORT = 8766
+SEARCH_UPSTREAM = 'https://world.openfoodfacts.org'
+GEMINI_UPSTREAM = 'https://generativelanguage.googleapis.com'
+CATALOGUE_SIZE = 5000        # Synthetic products behind the search endpoint
+PAGES_PER_TERM = 6           # Result pages per search term (the last one is short)
+MAX_PAGE_SIZE = 100          # Open Food Facts caps page_size
+CATALOGUE_EPOCH = 1700000000 # last_modified_t of the oldest synthetic product
+GEMINI_MODELS = ["models/gemini-2.5-flash", "models/gemini-1.5-flash", "models/gemini-1.5-pro"]
+IGNORED_QUERY_KEYS = {'key'}  # Never part of a fixture key or file
+
+QUOTA_ERROR = {'error': {'code': 429, 'message': "Resource has been exhausted (e.g. check quota).",
+                         'status': 'RESOURCE_EXHAUSTED'}}
+
+
+def fixture_key(method, path, query, body):
+    """Stable name for one request (API key excluded)"""
+    pairs = sorted((k, v) for k, v in query if k not in IGNORED_QUERY_KEYS)
+    raw = json.dumps([method, path, pairs, body], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+class FixtureStore:
+    """One JSON file per recorded request/response pair"""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, request, status, headers, body):
+        fixture = {'request': request, 'status': status, 'headers': headers, 'body': body}
+        tmp = self._path(key) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self._path(key))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; take() returns 0 or the seconds until a token is free"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class Response:
+    def __init__(self, status, body, content_type='application/json', headers=None):
+        self.status = status
+        self.body = body
+        self.headers = {'Content-Type': content_type}
+        self.headers.update(headers or {})
+
+
+def json_response(data, status=200, headers=None):
+    return Response(status, json.dumps(data, ensure_ascii=False), headers=headers)
+
+
+class SearchApp:
+    """Emulates /cgi/search.pl over a seeded synthetic catalogue"""
+    def __init__(self, seed=SEED, catalogue_size=CATALOGUE_SIZE, pages_per_term=PAGES_PER_TERM,
+                 max_page_size=MAX_PAGE_SIZE):
+        rnd = random.Random(seed)
+        kinds = [kind for kind, _ in RECORD_MIX]
+        weights = [weight for _, weight in RECORD_MIX]
+        self.catalogue = []
+        for i in range(catalogue_size):
+            product = make_record(rnd, i, rnd.choices(kinds, weights)[0])
+            product['last_modified_t'] = CATALOGUE_EPOCH + i * 60
+            self.catalogue.append(product)
+        self.seed = seed
+        self.pages_per_term = pages_per_term
+        self.max_page_size = max_page_size
+
+    def results_for(self, term, page_size):
+        """Every result for a term, in the API's default order"""
+        rnd = random.Random(f"{self.seed}:{term}")
+        count = page_size * (self.pages_per_term - 1) + rnd.randint(0, page_size - 1)
+        return rnd.sample(self.catalogue, min(count, len(self.catalogue)))
+
+    def handle(self, method, path, query, body):
+        if method != 'GET' or not path.endswith('/search.pl'):
+            return json_response({'error': 'not found'}, 404)
+        params = dict(query)
+        term = params.get('search_terms', '')
+        page = max(1, int(params.get('page', 1)))
+        page_size = max(1, min(self.max_page_size, int(params.get('page_size', 24))))
+
+        results = self.results_for(term, page_size)
+        if params.get('sort_by') == 'last_modified_t':
+            results = sorted(results, key=lambda p: -p['last_modified_t'])
+        products = results[(page - 1) * page_size:page * page_size]
+        return json_response({'count': len(results), 'page': page, 'page_size': page_size,
+                              'products': products})
+
+
+class GeminiApp:
+    """
+    Emulates the Gemini REST endpoints the mapper uses. Models listed in
+    `exhausted` always answer 429, `rpm` rate-limits each model on its own,
+    and `bad_answers` is the share of replies whose JSON answer is cut short
+    (inside a valid envelope, like a model stopping mid-answer).
+    `max_output_chars` cuts every longer answer there, like a model hitting
+    its output token limit on a large batch.
+    """
+    def __init__(self, seed=SEED, models=GEMINI_MODELS, exhausted=(), rpm=None, bad_answers=0.0,
+                 max_output_chars=None):
+        self.models = list(models)
+        self.exhausted = set(exhausted)
+        self.limits = {m: TokenBucket(rpm / 60.0, max(1, rpm // 6)) for m in self.models} if rpm else {}
+        self.bad_answers = bad_answers
+        self.max_output_chars = max_output_chars
+        self.rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle(self, method, path, query, body):
+        if method == 'GET' and re.fullmatch(r'/v1(beta)?/models/?', path):
+            return json_response({'models': [{'name': m, 'supportedGenerationMethods': ['generateContent']}
+                                             for m in self.models]})
+
+        match = re.fullmatch(r'/v1(?:beta)?/(models/[^/:]+):generateContent', path)
+        if method != 'POST' or not match:
+            return json_response({'error': {'code': 404, 'message': 'not found'}}, 404)
+        model = match.group(1)
+        if model not in self.models:
+            return json_response({'error': {'code': 404, 'message': f"{model} is not found"}}, 404)
+        if model in self.exhausted:
+            return json_response(QUOTA_ERROR, 429)
+        if model in self.limits:
+            wait = self.limits[model].take()
+            if wait:
+                return json_response(QUOTA_ERROR, 429, {'Retry-After': str(math.ceil(wait))})
+
+        try:
+            request = json.loads(body or '{}')
+            prompt = ''.join(part.get('text', '') for content in request.get('contents', [])
+                             for part in content.get('parts', []))
+        except (ValueError, AttributeError):
+            return json_response({'error': {'code': 400, 'message': 'invalid JSON payload'}}, 400)
+
+        answer = json.dumps(stub_answers(prompt_items(prompt)))
+        with self._lock:
+            cut = self.rnd.random() < self.bad_answers
+        if cut:
+            answer = answer[:len(answer) // 2]
+        finish_reason = 'STOP'
+        if self.max_output_chars and len(answer) > self.max_output_chars:
+            answer = answer[:self.max_output_chars]
+            finish_reason = 'MAX_TOKENS'
+        text = f"```json\n{answer}\n```"
+        return json_response({'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]},
+                                              'finishReason': finish_reason}]})
+
+
+class RecordingApp:
+    """Forwards requests to the real API and saves each response as a fixture"""
+    def __init__(self, upstream, store):
+        import requests
+        self.upstream = upstream.rstrip('/')
+        self.store = store
+        self.session = requests.Session()
+
+    def handle(self, method, path, query, body):
+        response = self.session.request(method, self.upstream + path, params=query,
+                                        data=body.encode('utf-8') if body else None,
+                                        headers={'Content-Type': 'application/json'} if body else None,
+                                        timeout=60)
+        headers = {k: response.headers[k] for k in ('Retry-After',) if k in response.headers}
+        content_type = response.headers.get('Content-Type', 'application/json')
+        request = {'method': method, 'path': path,
+                   'query': [[k, v] for k, v in query if k not in IGNORED_QUERY_KEYS], 'body': body}
+        self.store.save(fixture_key(method, path, query, body), request, response.status_code,
+                        dict(headers, **{'Content-Type': content_type}), response.text)
+        return Response(response.status_code, response.text, content_type, headers)
+
+
+class ReplayApp:
+    """Serves recorded fixtures; unknown requests get a 404 naming the missing key"""
+    def __init__(self, store):
+        self.store = store
+
+    def handle(self, method, path, query, body):
+        key = fixture_key(method, path, query, body)
+        fixture = self.store.load(key)
+        if fixture is None:
+            return json_response({'error': {'code': 404, 'message': f"no fixture {key} for {method} {path}"}}, 404)
+        headers = dict(fixture.get('headers') or {})
+        content_type = headers.pop('Content-Type', 'application/json')
+        return Response(fixture['status'], fixture['body'], content_type, headers)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Serves one app with optional latency (lognormal, median `latency` seconds),
+    server-wide token-bucket rate limiting and malformed bodies.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, app, latency=0.0, latency_sigma=0.5, rate=None, burst=5,
+                 malformed=0.0, seed=SEED):
+        super().__init__(address, StandInHandler)
+        self.app = app
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.limiter = TokenBucket(rate, burst) if rate else None
+        self.malformed = malformed
+        self.rnd = random.Random(seed)
+        self._rnd_lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def draw(self):
+        """(latency, malformed) for one request from the seeded generator"""
+        with self._rnd_lock:
+            self.requests += 1
+            delay = self.latency * math.exp(self.rnd.gauss(0, self.latency_sigma)) if self.latency else 0.0
+            return delay, self.rnd.random() < self.malformed
+
+    def respond(self, method, path, query, body):
+        delay, malformed = self.draw()
+        if self.limiter is not None:
+            wait = self.limiter.take()
+            if wait:
+                with self._rnd_lock:
+                    self.throttled += 1
+                return json_response({'error': 'Too Many Requests'}, 429, {'Retry-After': str(math.ceil(wait))})
+        if delay:
+            time.sleep(delay)
+        response = self.app.handle(method, path, query, body)
+        if malformed and response.status == 200:
+            response.body = response.body[:len(response.body) // 2]
+        return response
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real APIs
+
+    def _serve(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qsl(url.query, keep_blank_values=True)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else None
+        try:
+            response = self.server.respond(method, url.path, query, body)
+        except Exception as e:
+            response = json_response({'error': f"stand-in failure: {e}"}, 502)
+        payload = response.body.encode('utf-8')
+        self.send_response(response.status)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._serve('GET')
+
+    def do_POST(self):
+        self._serve('POST')
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the load test output
+
+
+def build_app(args):
+    """The app for the command line options: record, replay or emulate"""
+    if args.record:
+        upstream = args.upstream or (SEARCH_UPSTREAM if args.api == 'search' else GEMINI_UPSTREAM)
+        return RecordingApp(upstream, FixtureStore(args.record))
+    if args.replay:
+        return ReplayApp(FixtureStore(args.replay))
+    if args.api == 'search':
+        return SearchApp(args.seed, args.products, args.pages, args.max_page_size)
+    return GeminiApp(args.seed, args.models, args.exhausted, args.rpm, args.bad_answers, args.max_output_chars)
+
+
+def start(app, port=0, host='127.0.0.1', **options):
+    """Starts a stand-in server on a background thread (port 0 = any free port)"""
+    server = StandInServer((host, port), app, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Local stand-in / record-replay server for the pipeline APIs")
+    parser.add_argument('api', choices=['search', 'gemini'],
+                        help="search = Open Food Facts /cgi/search.pl, gemini = Gemini REST API")
+    parser.add_argument('--port', type=int, help=f"Port to listen on (default {SEARCH_PORT} / {GEMINI_PORT})")
+    parser.add_argument('--seed', type=int, default=SEED, help="Seed for data, latency and failures")
+    parser.add_argument('--latency', type=float, default=0.0, help="Median response latency in seconds")
+    parser.add_argument('--latency-sigma', type=float, default=0.5,
+                        help="Spread of the lognormal latency distribution")
+    parser.add_argument('--rate', type=float, help="Requests per second before answering 429")
+    parser.add_argument('--burst', type=int, default=5, help="Token bucket capacity for --rate")
+    parser.add_argument('--malformed', type=float, default=0.0,
+                        help="Share of 200 responses whose JSON body is cut in half")
+    parser.add_argument('--record', metavar='DIR', help="Forward to --upstream and save fixtures to DIR")
+    parser.add_argument('--replay', metavar='DIR', help="Serve the fixtures saved in DIR")
+    parser.add_argument('--upstream', help="Real API base URL for --record")
+    search = parser.add_argument_group('search emulation')
+    search.add_argument('--products', type=int, default=CATALOGUE_SIZE, help="Synthetic catalogue size")
+    search.add_argument('--pages', type=int, default=PAGES_PER_TERM, help="Result pages per search term")
+    search.add_argument('--max-page-size', type=int, default=MAX_PAGE_SIZE, help="Cap on page_size")
+    gemini = parser.add_argument_group('gemini emulation')
+    gemini.add_argument('--models', nargs='+', default=GEMINI_MODELS, help="Model names to serve")
+    gemini.add_argument('--exhausted', nargs='+', default=[], help="Models that always answer 429")
+    gemini.add_argument('--rpm', type=int, help="Requests per minute allowed per model")
+    gemini.add_argument('--bad-answers', type=float, default=0.0,
+                        help="Share of replies whose JSON answer is cut short")
+    gemini.add_argument('--max-output-chars', type=int,
+                        help="Cut longer JSON answers here, like an output token limit")
+    args = parser.parse_args(argv)
+    if args.record and args.replay:
+        parser.error("--record and --replay can't be combined")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    port = args.port or (SEARCH_PORT if args.api == 'search' else GEMINI_PORT)
+    app = build_app(args)
+    options = {} if args.record else dict(latency=args.latency, latency_sigma=args.latency_sigma,
+                                          rate=args.rate, burst=args.burst, malformed=args.malformed,
+                                          seed=args.seed)
+    server = StandInServer(('127.0.0.1', port), app, **options)
+
+    mode = 'recording' if args.record else 'replaying' if args.replay else 'emulating'
+    print(f"🧪 {args.api} stand-in ({mode}) on {server.base_url}")
+    if args.api == 'search':
+        print(f"   👉 python openfoodfacts_to_txt.py --api-url {server.base_url}/cgi/search.pl")
+    else:
+        print(f"   👉 python activity03_mapping.py --model-url {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\n📊 {server.requests} requests, {server.throttled} answered 429 by the rate limit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# synthetic_data.py
+"""
+Seeded synthetic Open Food Facts data and a stub Gemini answerer, shared
+by benchmark.py and the stand-in servers in standin_server.py.
+
+Records mix plain English, non-English, measurement-heavy (mineral water
+analysis) and unicode-heavy (accents, combining marks, symbols) products
+in the search API's field layout, so they exercise every validation path.
+"""
+import json
+import random
+import re
+
+SEED = 2024
+# Distinct records generated per size; bigger sizes cycle through them,
+# so a 1M run doesn't need a gigabyte of dicts
+POOL_SIZE = 50000
+
+# Share of each record kind in the synthetic data
+RECORD_MIX = [('english', 0.70), ('non_english', 0.10), ('measurement', 0.10), ('unicode', 0.10)]
+
+ENGLISH_WORDS = ['water', 'sugar', 'salt', 'wheat flour', 'sunflower oil', 'milk powder', 'cocoa butter',
+                 'soy lecithin', 'eggs', 'hazelnuts', 'peanuts', 'barley malt', 'yeast', 'vinegar',
+                 'tomato paste', 'garlic', 'onion', 'natural flavouring', 'citric acid', 'rice', 'oats',
+                 'sesame seeds', 'skimmed milk', 'butter', 'cream', 'almonds', 'corn starch', 'honey']
+NON_ENGLISH_TEXTS = ['Хлеб пшеничный, мука, вода, соль, дрожжи', '小麦粉、砂糖、植物油脂、食塩',
+                     'Mehl, Zucker, Butter, Eier, Salz, Milchpulver, Haselnüsse',
+                     'ماء، سكر، ملح، زيت نباتي، دقيق القمح', 'Αλεύρι σίτου, ζάχαρη, βούτυρο, αλάτι']
+MEASUREMENTS = ['Calcium 12 mg', 'Magnesium 5 mg', 'Sodium 3 mg', 'Bicarbonates 35 mg', 'Sulfates 8 mg',
+                'Potassium 1 mg', 'Nitrates 2 mg', 'Silica 7 mg', 'Chlorides 4 mg', 'Fluorides 0 mg']
+UNICODE_WORDS = ['crème fraîche', 'œufs', 'jalapeño', 'café', 'açaí', 'purée', 'Emmental™',
+                 'sucre de canne', 'épices', 'noix de cajou•', 'blé', '“farine”']
+ALLERGEN_TAGS = ['en:milk', 'en:gluten', 'en:eggs', 'en:soybeans', 'en:nuts', 'en:peanuts',
+                 'en:fish', 'en:crustaceans', 'en:sesame-seeds', 'en:celery', 'en:mustard',
+                 'fr:lait', 'de:milch']
+ALLERGEN_TEXTS = ['contains milk and soy', 'may contain traces of nuts', 'wheat, barley',
+                  'peanut oil', 'sesame', '']
+# allergensraw values for the mapping pipeline: known terms, plus unknown
+# tokens that have to go to the (stub) model
+KNOWN_ALLERGENS = ['milk', 'gluten', 'eggs', 'soybeans', 'peanuts', 'nuts', 'fish', 'crustaceans',
+                   'sesame seeds', 'EMPTY']
+UNKNOWN_ALLERGENS = ['lupin', 'celery', 'mustard', 'molluscs', 'sulphur dioxide', 'kamut', 'spelt',
+                     'macadamia', 'prawn', 'anchovy']
+
+
+def make_record(rnd, index, kind):
+    """One synthetic raw product in the search API's field layout"""
+    code = str(3000000000000 + index)
+    if kind == 'non_english':
+        name = rnd.choice(['Хлеб', 'ケーキ', 'Brötchen', 'Ψωμί'])
+        ingredients = rnd.choice(NON_ENGLISH_TEXTS)
+    elif kind == 'measurement':
+        name = f"Mineral water {index % 97}"
+        ingredients = ', '.join(rnd.sample(MEASUREMENTS, rnd.randint(4, 8)))
+    elif kind == 'unicode':
+        name = f"Gâteau {rnd.choice(UNICODE_WORDS)}"
+        words = rnd.sample(ENGLISH_WORDS, rnd.randint(3, 8)) + rnd.sample(UNICODE_WORDS, rnd.randint(2, 5))
+        rnd.shuffle(words)
+        ingredients = ', '.join(words) + '.'
+    else:
+        name = f"{rnd.choice(['Crunchy', 'Classic', 'Organic', 'Mini'])} {rnd.choice(ENGLISH_WORDS).title()} Bar"
+        words = rnd.sample(ENGLISH_WORDS, rnd.randint(4, 12))
+        if rnd.random() < 0.3:
+            words[0] += f" ({rnd.randint(1, 60)}%)"
+        ingredients = ', '.join(words) + '.'
+
+    tags = rnd.sample(ALLERGEN_TAGS, rnd.randint(0, 3)) if rnd.random() < 0.7 else []
+    return {
+        'code': code,
+        'product_name': name,
+        'ingredients_text': ingredients,
+        'allergens_tags': tags,
+        'allergens_from_ingredients': rnd.choice(ALLERGEN_TEXTS) if not tags else '',
+        'allergens': '',
+    }
+
+
+def make_allergen_value(rnd):
+    """One allergensraw cell as foodraw.txt stores it"""
+    terms = rnd.sample(KNOWN_ALLERGENS[:-1], rnd.randint(0, 2))
+    if rnd.random() < 0.2:
+        terms.append(f"{rnd.choice(UNKNOWN_ALLERGENS)} {rnd.randint(1, 400)}")
+    return ', '.join(sorted(terms)) if terms else 'EMPTY'
+
+
+def generate_records(size, seed=SEED):
+    """`size` records: POOL_SIZE distinct ones, cycled"""
+    rnd = random.Random(seed)
+    kinds = [kind for kind, _ in RECORD_MIX]
+    weights = [weight for _, weight in RECORD_MIX]
+    pool = [make_record(rnd, i, rnd.choices(kinds, weights)[0]) for i in range(min(size, POOL_SIZE))]
+    return [pool[i % len(pool)] for i in range(size)]
+
+
+def generate_allergen_values(size, seed=SEED):
+    rnd = random.Random(seed + 1)
+    pool = [make_allergen_value(rnd) for _ in range(min(size, POOL_SIZE))]
+    return [pool[i % len(pool)] for i in range(size)]
+
+
+# The JSON list of items in activity03_mapping's PROMPT_TEMPLATE
+PROMPT_INPUT_REGEX = re.compile(r'Input:\s*(\[.*\])', re.S)
+# Stub answers for UNKNOWN_ALLERGENS (anything else maps to "")
+STUB_ANSWERS = {'lupin': '', 'celery': '', 'mustard': '', 'molluscs': 'shellfish', 'sulphur dioxide': '',
+                'kamut': 'wheat', 'spelt': 'wheat', 'macadamia': 'tree nut', 'prawn': 'shellfish',
+                'anchovy': 'fish'}
+
+
+def prompt_items(prompt):
+    """The items a mapping prompt asks about ([] if it isn't one)"""
+    match = PROMPT_INPUT_REGEX.search(prompt)
+    if not match:
+        return []
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return []
+
+
+def stub_answers(items):
+    """{item: categories} as a well-behaved model would answer the mapping prompt"""
+    return {item: STUB_ANSWERS.get(str(item).rsplit(' ', 1)[0], '') for item in items}
+
+
+class StubModel:
+    """Stands in for a Gemini model in-process: answers the mapping prompt from STUB_ANSWERS"""
+    def generate_content(self, prompt):
+        return StubResponse(json.dumps(stub_answers(prompt_items(prompt))))
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
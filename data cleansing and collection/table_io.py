@@ -0,0 +1,206 @@
+# table_io.py
+"""
+Chunked table readers/writers for the pipeline scripts, picked by extension:
+
+    .txt / .csv        semicolon (foodraw.txt format) or comma CSV, separator
+                       sniffed from the header line
+    .parquet           Apache Parquet (needs pyarrow)
+    .arrow / .feather  Arrow IPC file (needs pyarrow)
+    .xlsx              Excel through openpyxl's read-only / write-only modes,
+                       kept for exporting a sheet to open by hand
+
+Everything is read and written in chunks of rows, so memory stays flat
+whatever the file size, and every cell is read as text ("" for blanks).
+
+Semicolon files follow foodraw.txt: no quoting at all, and the collector
+turns ';' inside values into ',' (clean_text), so a '"' is just a
+character. They are read and written that way; comma CSVs use standard
+quoting.
+"""
+import csv
+import os
+
+DEFAULT_CHUNK_ROWS = 50000
+
+FORMATS = {
+    '.txt': 'csv', '.csv': 'csv', '.tsv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow', '.feather': 'arrow',
+    '.xlsx': 'xlsx',
+}
+
+
+def table_format(path):
+    """'csv', 'parquet', 'arrow' or 'xlsx' for a file name"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported table format '{ext}' ({path}). "
+                         f"Use one of: {', '.join(sorted(FORMATS))}")
+    return FORMATS[ext]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet/Arrow files need pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def sniff_separator(path):
+    """';' for foodraw.txt style files, ',' or tab otherwise (decided from the header)"""
+    if path.lower().endswith('.tsv'):
+        return '\t'
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        header = f.readline()
+    return ';' if header.count(';') > header.count(',') else ','
+
+
+def csv_quoting(separator):
+    """csv quoting mode for a separator: none for the foodraw.txt ';' format"""
+    return csv.QUOTE_NONE if separator == ';' else csv.QUOTE_MINIMAL
+
+
+def read_header(path):
+    """Column names of a table without reading its rows"""
+    fmt = table_format(path)
+    if fmt == 'csv':
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            header = f.readline().rstrip('\r\n')
+        return [c.strip().strip('"') for c in header.split(sniff_separator(path))]
+    if fmt == 'parquet':
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    if fmt == 'arrow':
+        pa = _require_pyarrow()
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.names
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        first = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+        return ['' if v is None else str(v) for v in first]
+    finally:
+        wb.close()
+
+
+def iter_table(path, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None):
+    """Yields the table as DataFrames of up to chunk_rows rows (only `columns` if given)"""
+    import pandas as pd
+
+    fmt = table_format(path)
+    if fmt == 'csv':
+        separator = sniff_separator(path)
+        yield from pd.read_csv(path, sep=separator, usecols=columns, chunksize=chunk_rows,
+                               dtype=str, keep_default_na=False, encoding='utf-8-sig',
+                               quoting=csv_quoting(separator))
+
+    elif fmt == 'parquet':
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield _as_text(batch.to_pandas())
+
+    elif fmt == 'arrow':
+        pa = _require_pyarrow()
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                yield _as_text(batch.to_pandas())
+
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = ['' if v is None else str(v) for v in next(rows, ())]
+            chunk = []
+            for row in rows:
+                chunk.append(['' if v is None else str(v) for v in row])
+                if len(chunk) >= chunk_rows:
+                    yield _select(pd.DataFrame(chunk, columns=header), columns)
+                    chunk = []
+            if chunk:
+                yield _select(pd.DataFrame(chunk, columns=header), columns)
+        finally:
+            wb.close()
+
+
+def _as_text(df):
+    return df.astype(str).where(df.notna(), '')
+
+
+def _select(df, columns):
+    return df if columns is None else df[columns]
+
+
+class TableWriter:
+    """
+    Appends DataFrame chunks to one output file. Use as a context manager;
+    the file is complete once it is closed. bom=True starts a CSV with the
+    UTF-8 byte order mark (as Excel exports it).
+    """
+    def __init__(self, path, separator=';', bom=False):
+        self.path = path
+        self.format = table_format(path)
+        self.separator = separator
+        self.bom = bom
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._schema = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, df):
+        if self.format == 'csv':
+            if self._file is None:
+                self._file = open(self.path, 'w', encoding='utf-8-sig' if self.bom else 'utf-8', newline='')
+            quoting = csv_quoting(self.separator)
+            if quoting == csv.QUOTE_NONE:
+                # Unquoted, so the separator can't appear in a value (as clean_text does it)
+                df = df.astype(str).apply(lambda col: col.str.replace(self.separator, ',', regex=False))
+            df.to_csv(self._file, sep=self.separator, index=False, header=self.rows == 0,
+                      lineterminator='\n', quoting=quoting)
+
+        elif self.format in ('parquet', 'arrow'):
+            pa = _require_pyarrow()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.format == 'parquet':
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+
+        else:
+            if self._writer is None:
+                import openpyxl
+                self._file = openpyxl.Workbook(write_only=True)  # Rows are streamed, not kept as cells
+                self._writer = self._file.create_sheet()
+                self._writer.append(list(df.columns))
+            for row in df.itertuples(index=False):
+                self._writer.append(list(row))
+
+        self.rows += len(df)
+
+    def close(self):
+        if self.format == 'xlsx':
+            if self._file is not None:
+                self._file.save(self.path)
+        elif self._writer is not None:
+            self._writer.close()
+        elif self._file is not None:
+            self._file.close()
+        self._file = None
+        self._writer = None
@@ -0,0 +1,11 @@
+# conftest.py
+"""
+The pipeline scripts are flat modules run from their own directory, so the
+tests import them the same way.
+
+    cd "data cleansing and collection" && python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,55 @@
+# test_allergen_matcher.py
+"""
+Keyword matching: word boundaries, and the ASCII word lookup giving the
+same results as the regex it stands in for.
+"""
+import pytest
+
+from allergen_matcher import build_keyword_matcher
+from openfoodfacts_to_txt import TARGET_ALLERGEN_KEYWORDS
+
+TEXTS = [
+    "en:milk, en:soybeans",
+    "Coconut milk, butternut squash, eggplant, water, salt",
+    "crustaceans, eggs, fish, gluten, molluscs, mustard, soybeans",
+    "soya_lecithin, SOYMILK, nut-nuts, walnut oil, nutmeg, 1nut",
+    "Œufs, crème, lait, noix de cajou, Milch, Erdnüsse, peanuts",
+    "tree nuts and sesame seeds",
+    "",
+]
+
+
+def regex_only(matcher):
+    """The same matcher with the word lookup fast path turned off"""
+    matcher.rebuild()
+    matcher._word_lookup = matcher._word_keywords = None
+    return matcher
+
+
+def test_word_boundaries():
+    matcher = build_keyword_matcher(TARGET_ALLERGEN_KEYWORDS)
+
+    assert matcher.find_keywords("Coconut milk, butternut squash, eggplant") == ['milk']
+    assert matcher.find_keywords("en:soybeans, eggs, crabs") == ['soy', 'egg', 'crab']
+    assert matcher.find_categories("hazelnuts, soya_lecithin") == ['tree nut', 'soy']
+    assert not matcher.matches("coconut, eggplant")
+    assert matcher.matches("Contains: MILK")
+
+
+@pytest.mark.parametrize('keywords', [TARGET_ALLERGEN_KEYWORDS,
+                                      TARGET_ALLERGEN_KEYWORDS + ["nuts", "tomato", "tomatoe"],
+                                      TARGET_ALLERGEN_KEYWORDS + ["tree nut", "sesame seed"]])
+def test_fast_path_matches_the_regex(keywords):
+    matcher = build_keyword_matcher(keywords)
+    reference = regex_only(build_keyword_matcher(keywords))
+
+    for text in TEXTS + ["tomatoes, nuts"]:
+        assert list(matcher.iter_matches(text)) == list(reference.iter_matches(text))
+        assert matcher.find_keywords(text) == reference.find_keywords(text)
+        assert matcher.matches(text) == reference.matches(text)
+
+
+def test_phrases_and_the_words_inside():
+    matcher = build_keyword_matcher(TARGET_ALLERGEN_KEYWORDS + ["tree nut"])
+
+    assert matcher.find_keywords("tree-nuts") == ['tree nut', 'nut']
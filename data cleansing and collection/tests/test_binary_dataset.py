@@ -0,0 +1,68 @@
+# test_binary_dataset.py
+import pandas as pd
+import pytest
+
+from allergen_taxonomy import categories_mask
+from binary_dataset import BinaryDataset, TEXT_FIELDS, export_dataset, check_round_trip
+
+ROWS = [
+    {'id': '1', 'name': 'Plain bread', 'link': 'https://example.org/1', 'ingredients': 'wheat flour, water',
+     'allergensraw': 'en:gluten', 'allergensmapped': 'wheat', 'allergensinferred': 'wheat'},
+    {'id': '2', 'name': 'Crème brûlée', 'link': 'https://example.org/2', 'ingredients': 'cream, œufs, sugar',
+     'allergensraw': 'en:milk,en:eggs', 'allergensmapped': 'milk, egg', 'allergensinferred': 'milk, egg'},
+    {'id': '3', 'name': 'Water', 'link': 'https://example.org/3', 'ingredients': 'water',
+     'allergensraw': 'EMPTY', 'allergensmapped': 'None', 'allergensinferred': ''},
+    {'id': '4', 'name': 'Trail mix', 'link': 'https://example.org/4', 'ingredients': 'peanuts, almonds',
+     'allergensraw': 'en:nuts', 'allergensmapped': 'milk, egg', 'allergensinferred': 'peanut, tree nut'},
+]
+
+
+def write_csv(tmp_path, rows=ROWS):
+    path = tmp_path / 'app.csv'
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def test_round_trip(tmp_path):
+    csv_path = write_csv(tmp_path)
+    binary_path = tmp_path / 'app.bin'
+
+    assert export_dataset(str(csv_path), str(binary_path), chunk_rows=3) == len(ROWS)
+    assert check_round_trip(str(csv_path), str(binary_path), samples=2) == 0
+
+    with BinaryDataset(str(binary_path)) as dataset:
+        assert len(dataset) == len(ROWS)
+        assert [dict(record) for record in dataset] == [{f: row[f] for f in TEXT_FIELDS} for row in ROWS]
+        assert dataset[-1]['name'] == 'Trail mix'
+        expected = [[categories_mask(row['allergensmapped']), categories_mask(row['allergensinferred'])]
+                    for row in ROWS]
+        assert dataset.masks.tolist() == expected
+
+
+def test_shared_values_stored_once(tmp_path):
+    binary_path = tmp_path / 'app.bin'
+    export_dataset(str(write_csv(tmp_path)), str(binary_path))
+
+    with BinaryDataset(str(binary_path)) as dataset:
+        mapped = TEXT_FIELDS.index('allergensmapped')
+        offsets = dataset.records['offsets'][:, mapped].tolist()
+        # Rows 2 and 4 share "milk, egg"
+        assert offsets[1] == offsets[3]
+
+
+def test_empty_table(tmp_path):
+    csv_path = tmp_path / 'empty.csv'
+    csv_path.write_text(','.join(TEXT_FIELDS) + '\n', encoding='utf-8')
+    binary_path = tmp_path / 'empty.bin'
+
+    assert export_dataset(str(csv_path), str(binary_path)) == 0
+    with BinaryDataset(str(binary_path)) as dataset:
+        assert len(dataset) == 0
+        assert list(dataset) == []
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.bin'
+    path.write_bytes(b'x' * 128)
+    with pytest.raises(ValueError, match='not a binary dataset'):
+        BinaryDataset(str(path))
@@ -0,0 +1,116 @@
+# test_collector.py
+"""
+The search API collector against standin_server's synthetic catalogue.
+"""
+import argparse
+import random
+from collections import Counter
+
+import pytest
+
+import openfoodfacts_to_txt as collector
+import standin_server
+
+TARGET_ALLERGENS = 60
+TARGET_SAFE = 20
+
+
+@pytest.fixture(scope='module')
+def api_url():
+    server = standin_server.start(standin_server.SearchApp(catalogue_size=2000))
+    yield f"http://127.0.0.1:{server.server_address[1]}/cgi/search.pl"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_waits(monkeypatch, tmp_path):
+    """No politeness delays, and the journal goes to a scratch directory"""
+    monkeypatch.setattr(collector.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(collector, 'PAGE_DELAY', 0)
+    monkeypatch.chdir(tmp_path)
+
+
+def collect(api_url, use_async=False, resume=False, stop_when=None):
+    """
+    (allergen ids, safe ids) of one seeded run. stop_when(term, products
+    from that term, products in all) is checked after every accepted
+    product; when true the run is interrupted like Ctrl-C and returns None.
+    """
+    args = argparse.Namespace(use_async=use_async, concurrency=4, rate=1000.0, burst=100, api_url=api_url,
+                              target_allergens=TARGET_ALLERGENS, target_safe=TARGET_SAFE)
+    random.seed(7)
+    checkpoint = collector.CollectionCheckpoint(collector.CHECKPOINT_FILE, resume=resume)
+    if checkpoint.source is None:
+        checkpoint.start(api_url)
+    if stop_when:
+        add_product = checkpoint.add_product
+        added = Counter()
+        def interrupting_add(product_data, require_allergens, term=None):
+            add_product(product_data, require_allergens, term)
+            added[term] += 1
+            if stop_when(term, added[term], sum(added.values())):
+                raise KeyboardInterrupt
+        checkpoint.add_product = interrupting_add
+    try:
+        list_allergens, list_safe = collector.collect_from_api(args, checkpoint.collected_ids(), checkpoint)
+    except KeyboardInterrupt:
+        return None
+    finally:
+        checkpoint.journal.close()
+    return [p['id'] for p in list_allergens], [p['id'] for p in list_safe]
+
+
+def test_fills_both_groups(api_url):
+    allergen_ids, safe_ids = collect(api_url)
+
+    assert len(allergen_ids) == TARGET_ALLERGENS
+    assert len(safe_ids) == TARGET_SAFE
+    assert len(set(allergen_ids + safe_ids)) == TARGET_ALLERGENS + TARGET_SAFE
+
+
+def test_products_pass_the_filters(api_url, monkeypatch):
+    kept = []
+    consume = collector.consume_term_products
+    def recording_consume(validated, term, products, *args, **kwargs):
+        result = consume(validated, term, products, *args, **kwargs)
+        kept[:] = products
+        return result
+    monkeypatch.setattr(collector, 'consume_term_products', recording_consume)
+
+    collect(api_url)
+    for product in kept:
+        assert product['allergens'] == 'EMPTY' or collector.matches_target_allergens(product['allergens'])
+
+
+def test_sync_and_async_collect_the_same_products(api_url):
+    assert collect(api_url) == collect(api_url, use_async=True)
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+def test_resume_matches_an_uninterrupted_run(api_url, use_async):
+    full = collect(api_url, use_async)
+
+    assert collect(api_url, use_async, stop_when=lambda term, from_term, total: total == 37) is None
+    assert collect(api_url, use_async, resume=True) == full
+
+
+def test_resume_skips_terms_at_quota(api_url, monkeypatch):
+    searched = []
+    iter_search = collector.iter_search_products
+    def recording_iter(term, *args, **kwargs):
+        searched.append(term)
+        return iter_search(term, *args, **kwargs)
+    monkeypatch.setattr(collector, 'iter_search_products', recording_iter)
+
+    # Interrupted right after a term's last product, before it is marked done
+    terms = []
+    def at_quota(term, from_term, total):
+        terms.append(term)
+        return from_term == collector.MAX_ITEMS_PER_KEYWORD
+    assert collect(api_url, stop_when=at_quota) is None
+    searched.clear()
+    allergen_ids, _ = collect(api_url, resume=True)
+
+    assert terms[-1] not in searched
+    assert len(allergen_ids) == TARGET_ALLERGENS
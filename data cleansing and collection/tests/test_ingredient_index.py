@@ -0,0 +1,25 @@
+# test_ingredient_index.py
+"""
+Allergen inference from ingredient text with the built-in term index.
+"""
+import pytest
+
+from ingredient_index import get_index
+
+
+@pytest.mark.parametrize('text', ["oat flour", "rice flour", "pea flour", "cassava flour", "sorghum flour",
+                                  "corn flour, water", "flour"])
+def test_other_flours_are_not_wheat(text):
+    assert get_index().infer_column([text]) == ['']
+
+
+@pytest.mark.parametrize('text', ["wheat flour", "Plain flour, sugar", "self-raising flour", "white flour",
+                                  "whole wheat flour", "enriched flour (niacin, iron)", "spelt flour"])
+def test_wheat_flours(text):
+    assert get_index().infer_column([text]) == ['wheat']
+
+
+def test_neutral_phrases_hide_the_allergen_inside():
+    texts = ["cocoa butter, sugar", "coconut milk", "gluten free oats", "whey, soy lecithin", ""]
+
+    assert get_index().infer_column(texts) == ['', '', '', 'milk, soy', '']
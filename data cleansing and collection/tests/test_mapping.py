@@ -0,0 +1,187 @@
+# test_mapping.py
+"""
+activity03_mapping's model calls: splitting and salvage of bad replies,
+failed calls, failover and quota handling, with in-process stub models.
+"""
+import json
+import time
+
+import pytest
+
+import activity03_mapping as mapping
+from batch_dispatcher import RateLimited
+from gemini_rest import ResourceExhausted
+from model_router import ModelRouter
+from synthetic_data import StubResponse, prompt_items
+
+TEXTS = ['cashew', 'shrimp', 'sesame', 'kamut', 'anchovy', 'lupin', 'macadamia', 'prawn']
+ANSWERS = {'cashew': 'tree nut', 'shrimp': 'shellfish', 'sesame': 'sesame', 'kamut': 'wheat',
+           'anchovy': 'fish', 'lupin': '', 'macadamia': 'tree nut', 'prawn': 'shellfish'}
+
+
+class ScriptedModel:
+    """Answers from ANSWERS through `reply(items)`; records every prompt's items"""
+    def __init__(self, reply=None):
+        self.reply = reply or (lambda items: {t: ANSWERS[t] for t in items})
+        self.calls = []
+
+    def generate_content(self, prompt):
+        items = prompt_items(prompt)
+        self.calls.append(items)
+        return StubResponse(json.dumps(self.reply(items)))
+
+
+class FailingModel:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        raise self.error
+
+
+@pytest.fixture
+def use_models(monkeypatch):
+    """Routes mapping calls to the given {name: model} and resets the run state"""
+    def install(models, budget=None):
+        router = ModelRouter(list(models), models.__getitem__)
+        monkeypatch.setattr(mapping, '_router', router)
+        monkeypatch.setattr(mapping, '_router_built', True)
+        monkeypatch.setattr(mapping, '_packer', None)
+        if budget is not None:
+            monkeypatch.setattr(mapping, 'TOKEN_BUDGET', budget)
+        return router
+    monkeypatch.setattr(mapping, 'MAPPING_STATS', dict.fromkeys(mapping.MAPPING_STATS, 0))
+    monkeypatch.setattr(mapping, '_partial_answers', {})
+    monkeypatch.setattr(mapping, '_counted_tokens', set())
+    return install
+
+
+def test_maps_every_text(use_models):
+    model = ScriptedModel()
+    use_models({'a': model})
+
+    assert mapping.map_allergens_with_model(TEXTS) == [ANSWERS[t] for t in TEXTS]
+    assert len(model.calls) == 1
+
+
+def test_partial_reply_keeps_answers_and_asks_again_for_the_rest(use_models):
+    # The first, full prompt comes back cut off after four answers
+    model = ScriptedModel(lambda items: {t: ANSWERS[t] for t in items[:4]})
+    use_models({'a': model})
+
+    assert mapping.map_allergens_with_model(TEXTS) == [ANSWERS[t] for t in TEXTS]
+    assert model.calls[0] == TEXTS
+    assert model.calls[1] == TEXTS[4:]  # Only the missing half
+    assert mapping.MAPPING_STATS['salvaged_items'] > 0
+
+
+def test_empty_reply_is_bisected_down_to_the_bad_item(use_models):
+    # Any prompt containing "lupin" comes back as garbage
+    model = ScriptedModel(lambda items: {} if 'lupin' in items else {t: ANSWERS[t] for t in items})
+    use_models({'a': model})
+
+    result = mapping.map_allergens_with_model(TEXTS)
+
+    assert result == [None if t == 'lupin' else ANSWERS[t] for t in TEXTS]
+    assert mapping.MAPPING_STATS['bisections'] == 3  # 8 -> 4 -> 2 -> 1
+    assert model.calls.count(['lupin']) == mapping.ITEM_MAX_ATTEMPTS
+
+
+def test_failed_call_is_not_split_or_retried(use_models):
+    model = FailingModel(RuntimeError("HTTP 500"))
+    use_models({'a': model})
+
+    assert mapping.map_allergens_with_model(TEXTS) == [None] * len(TEXTS)
+    assert model.calls == 1
+    assert mapping.MAPPING_STATS['failed_calls'] == 1
+    assert mapping.MAPPING_STATS['bisections'] == 0
+
+
+def test_error_fails_over_to_the_next_model(use_models):
+    broken = FailingModel(RuntimeError("HTTP 500"))
+    working = ScriptedModel()
+    router = use_models({'a': broken, 'b': working})
+
+    assert mapping.map_allergens_with_model(TEXTS) == [ANSWERS[t] for t in TEXTS]
+    assert broken.calls == 1
+    assert router.states[0].errors == 1
+
+
+def test_quota_error_uses_the_retry_after(use_models):
+    error = ResourceExhausted("429 Resource has been exhausted")
+    error.retry_after = 123.0
+    router = use_models({'a': FailingModel(error), 'b': ScriptedModel()})
+
+    assert mapping.map_allergens_with_model(TEXTS) == [ANSWERS[t] for t in TEXTS]
+    assert router.states[0].quota_errors == 1
+    assert router.states[0].cooldown_until - time.monotonic() > 100  # Not the 60 s default
+
+
+def test_wait_ignores_models_that_already_failed(use_models):
+    quota = ResourceExhausted("429 Resource has been exhausted")
+    quota.retry_after = 300.0
+    use_models({'a': FailingModel(RuntimeError("HTTP 500")), 'b': FailingModel(quota)})
+
+    with pytest.raises(RateLimited) as raised:
+        mapping.request_model_mappings(TEXTS, raise_on_quota=True)
+    assert raised.value.retry_after > 200  # b's cool-down, not 0 for the failed a
+
+
+def test_no_wait_when_every_model_failed(use_models, monkeypatch):
+    monkeypatch.setattr(mapping.time, 'sleep', lambda seconds: pytest.fail("waited"))
+    broken = FailingModel(RuntimeError("HTTP 500"))
+    use_models({'a': broken})
+
+    assert mapping.request_model_mappings(TEXTS, raise_on_quota=True) is None
+    assert broken.calls == 1
+
+
+def test_parse_error_is_not_a_model_error(use_models, monkeypatch):
+    def broken_parser(result_text, text_list):
+        raise KeyError('bug')
+    monkeypatch.setattr(mapping, 'parse_model_response', broken_parser)
+    first, second = ScriptedModel(), ScriptedModel()
+    router = use_models({'a': first, 'b': second})
+
+    with pytest.raises(KeyError):
+        mapping.request_model_mappings(TEXTS)
+    assert router.states[0].errors == 0
+    assert not second.calls
+
+
+def test_retry_after_from_the_message():
+    assert mapping.quota_retry_after(ResourceExhausted("429 Please retry in 21.5s.")) == 21.5
+    assert mapping.quota_retry_after(ResourceExhausted("429 quota")) is None
+
+
+def test_rate_limit_keeps_the_answers_so_far(use_models, monkeypatch):
+    model = ScriptedModel()
+    use_models({'a': model}, budget=1)  # One text per call
+    original = mapping.request_model_mappings
+    def limited(batch, raise_on_quota=False):
+        if batch == ['kamut'] and not limited.raised:
+            limited.raised = True
+            raise RateLimited("all models out of quota", retry_after=0)
+        return original(batch, raise_on_quota)
+    limited.raised = False
+    monkeypatch.setattr(mapping, 'request_model_mappings', limited)
+
+    with pytest.raises(RateLimited):
+        mapping.map_allergens_with_model(TEXTS, raise_on_quota=True)
+    asked_before = [items[0] for items in model.calls]
+    assert asked_before == TEXTS[:3]
+
+    # The dispatcher's retry only asks for what is still missing
+    assert mapping.map_allergens_with_model(TEXTS, raise_on_quota=True) == [ANSWERS[t] for t in TEXTS]
+    assert [items[0] for items in model.calls[3:]] == TEXTS[3:]
+
+
+def test_unknown_tokens_are_counted_once(use_models):
+    use_models({'a': ScriptedModel()})
+
+    mapping.count_unknown_tokens(['cashew', 'shrimp'])
+    mapping.count_unknown_tokens(['shrimp', 'lupin'])
+
+    assert mapping.MAPPING_STATS['unknown_tokens'] == 3
@@ -0,0 +1,161 @@
+#  text_engine.py
+"""
+Precompiled cleaning and validation engine for openfoodfacts_to_txt.
+
+Gives exactly the same results as clean_text, is_english_alphabet_text and
+is_valid_ingredient_text in openfoodfacts_to_txt.py (kept there as the
+readable reference), but each string is handled with a couple of C-level
+translate calls instead of several regex passes and per-char loops. ASCII
+text goes through bytes.translate, which keeps its fast path when
+characters are deleted.
+"""
+import re
+import unicodedata
+
+# Unicode whitespace, i.e. everything the reference regex's \s matches
+# (the highest whitespace code point is U+3000)
+WHITESPACE_CHARS = ''.join(chr(c) for c in range(0x3001) if chr(c).isspace())
+
+# Symbols/numbers ignored by the English check
+ENGLISH_IGNORED_CHARS = '0123456789,-.%()[]/+&:\'"' + WHITESPACE_CHARS
+ENGLISH_IGNORE_TABLE = str.maketrans('', '', ENGLISH_IGNORED_CHARS)
+# The same for ASCII text, as bytes.translate arguments
+ASCII_ENGLISH_IGNORED = bytes(c for c in ENGLISH_IGNORED_CHARS.encode('utf-8') if c < 0x80)
+ASCII_LETTERS = b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Ingredient quality rules
+MEASUREMENT_REGEX = re.compile(r'\b\d+\s*(mg|g|ml|%)\b')
+INGREDIENT_MARKERS = (',', 'and', 'with', 'contain', 'ingredient')
+FOOD_KEYWORDS = ('sugar', 'salt', 'water', 'juice', 'extract', 'oil', 'flour')
+
+# clean_text's table for ASCII text, as bytes.translate arguments: str.translate
+# leaves its ASCII fast path as soon as the table deletes a character
+ASCII_CLEANING_TABLE = bytes.maketrans(b'\t\n\r;', b'   ,')
+ASCII_DELETED_CHARS = bytes(c for c in range(0x20) if c not in b'\t\n\r') + b'\x7f<>'
+
+
+class _CleaningTable(dict):
+    """
+    str.translate table for clean_text: tabs/newlines -> space, ';' -> ',',
+    control chars and < > dropped, and (after NFKD) combining marks dropped.
+    Combining marks are looked up on first sight and cached, so repeat
+    characters are resolved at C speed.
+    """
+    def __missing__(self, code):
+        value = None if unicodedata.combining(chr(code)) else code
+        self[code] = value
+        return value
+
+
+CLEANING_TABLE = _CleaningTable()
+CLEANING_TABLE.update({c: None for c in range(0x00, 0x20)})
+CLEANING_TABLE.update({c: None for c in range(0x7F, 0xA0)})
+CLEANING_TABLE.update({
+    ord('\t'): ' ', ord('\n'): ' ', ord('\r'): ' ',
+    ord(';'): ',',
+    ord('<'): None, ord('>'): None,
+})
+
+
+def clean_text(text):
+    """Same output as openfoodfacts_to_txt.clean_text"""
+    if not text:
+        return ""
+    text = str(text)
+    # NFKD is the identity on ASCII, which is almost every product
+    if text.isascii():
+        text = text.encode('ascii').translate(ASCII_CLEANING_TABLE, ASCII_DELETED_CHARS).decode('ascii')
+    else:
+        text = unicodedata.normalize('NFKD', text).translate(CLEANING_TABLE)
+    return ' '.join(text.split())
+
+
+def is_english_alphabet_text(text):
+    """Same decision as openfoodfacts_to_txt.is_english_alphabet_text"""
+    if not text:
+        return False
+
+    if text.isascii():
+        remaining = text.encode('ascii').translate(None, ASCII_ENGLISH_IGNORED)
+        if not remaining:
+            return True  # Text was only symbols/numbers
+        letters = len(remaining) - len(remaining.translate(None, ASCII_LETTERS))
+    else:
+        remaining = text.translate(ENGLISH_IGNORE_TABLE)
+        if not remaining:
+            return True
+        letters = sum(1 for c in remaining if 'a' <= c.lower() <= 'z')
+
+    # Require at least 80% English letters
+    return letters / len(remaining) >= 0.8
+
+
+def ingredient_rejection(text):
+    """
+    Why is_valid_ingredient_text rejects a text: 'too_short',
+    'not_ingredient_list', 'measurement_only', or None if it passes.
+    """
+    if not text:
+        return 'too_short'
+
+    text = text.strip()
+    if len(text) < 20:
+        return 'too_short'
+
+    words = text.split()
+    if sum(1 for w in words if len(w) > 2) < 3:
+        return 'not_ingredient_list'
+
+    text_lower = text.lower()
+    if len(text) < 50 and not any(marker in text_lower for marker in INGREDIENT_MARKERS):
+        return 'not_ingredient_list'
+
+    # Reject mineral water analysis or chemical compositions
+    measurement_count = len(MEASUREMENT_REGEX.findall(text))
+    if measurement_count and not any(keyword in text_lower for keyword in FOOD_KEYWORDS):
+        if measurement_count > len(words) / 3:
+            return 'measurement_only'
+
+    return None
+
+
+def is_valid_ingredient_text(text):
+    """Same decision as openfoodfacts_to_txt.is_valid_ingredient_text"""
+    return ingredient_rejection(text) is None
+
+
+def validate_texts(name, ingredients):
+    """
+    Text part of validate_product_data.
+    Returns (clean_name, clean_ingredients) or None if the product is rejected.
+    """
+    if not name or not ingredients:
+        return None
+    if not is_english_alphabet_text(name) or not is_english_alphabet_text(ingredients):
+        return None
+
+    clean_name = clean_text(name)
+    clean_ing = clean_text(ingredients)
+    if len(clean_name) < 3 or len(clean_ing) < 10:
+        return None
+    if not is_valid_ingredient_text(clean_ing):
+        return None
+    return clean_name, clean_ing
+
+
+def rejection_reason(name, ingredients):
+    """
+    Why validate_texts rejects a product, for the run metrics: 'missing_text',
+    'non_english', 'too_short', 'not_ingredient_list', 'measurement_only',
+    or None if it passes. Only called for rejected products.
+    """
+    if not name or not ingredients:
+        return 'missing_text'
+    if not is_english_alphabet_text(name) or not is_english_alphabet_text(ingredients):
+        return 'non_english'
+
+    clean_name = clean_text(name)
+    clean_ing = clean_text(ingredients)
+    if len(clean_name) < 3 or len(clean_ing) < 10:
+        return 'too_short'
+    return ingredient_rejection(clean_ing)